@@ -1,42 +1,169 @@
 from fastapi import FastAPI, Request, Form, File, UploadFile
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
-from starlette.responses import HTMLResponse, RedirectResponse
+from jinja2 import FileSystemBytecodeCache
+from starlette.responses import (HTMLResponse, RedirectResponse, Response, PlainTextResponse, StreamingResponse,
+                                 JSONResponse, FileResponse)
 import os
 import json
 import sqlite3
 from datetime import datetime
-from generateBarcode import get_barcodes  # Import the updated function
-from printBarcode import print_label
+from contextlib import asynccontextmanager
+from barcodeIndex import (load_barcode_index, refresh_row, remove_row, reparent_children, refresh_rows, lookup_scan,
+                          mark_rows_scanned, complete_names)
+from boxCache import get_box_etag, get_cached_box, cache_box
+from migrations import run_migrations
+from changeFeed import get_change_horizon, get_latest_seq, get_changes, get_snapshot, compact_change_log
+from subtreeOps import get_unreferenced_images, delete_subtree, move_subtree, flatten_subtree
+from fileCleanup import queue_file_cleanup
+from reconciler import start_reconciler
+from fuzzySearch import fuzzy_search
+from scanReplay import apply_scan, parse_events, replay_scans
+from queryApi import query_items, get_item, row_to_item, dump_json, API_VERSION, FIELD_COLUMNS
+from staticAssets import AssetFiles, asset_url, precompress_assets
+from sites import (SITES, DEFAULT_SITE, SITE_COOKIE, current_site, get_db_path, get_file_directory, resolve_site,
+                   fan_out)
+from itemTimestamps import (now_epoch, format_epoch, queue_scanned, flush_scans, start_scan_writer, get_last_scan,
+                            get_last_edit, get_recently_modified, get_stale_boxes)
+from metrics import (TracedConnection, PROFILING_ENABLED, SamplingProfiler, start_request, finish_request, timed,
+                     render_metrics)
 import subprocess  # For printer checking
 import platform  # To determine the operating system
 import re
+import math
+import time
+import logging
+import threading
+from functools import partial
 
-app = FastAPI()
+# Structured key=value logging; set POTATODB_LOG_LEVEL=DEBUG to see the detailed traces
+logging.basicConfig(level=os.environ.get("POTATODB_LOG_LEVEL", "WARNING"),
+                    format="%(asctime)s level=%(levelname)s logger=%(name)s %(message)s")
+logger = logging.getLogger(__name__)
 
-# Mount static files directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Create each site's database, apply migrations and load its scan index before serving requests
+    for site_id in SITES:
+        token = current_site.set(site_id)
+        setup_database()
+        connection = connect_db()
+        run_migrations(connection)
+        compact_change_log(connection)
+        load_barcode_index(connection)
+        connection.close()
+        current_site.reset(token)
+        # Periodic tree and file check, throttled to stay out of the way of requests
+        start_reconciler(partial(connect_db, site_id=site_id), site_id=site_id)
+    # Scan times are written in batches; whatever is still queued at shutdown is written before exiting
+    start_scan_writer(lambda site_id: connect_db(site_id=site_id))
+    # Compressed copies of stylesheets and scripts that changed since the last start
+    precompress_assets()
+    yield
+    flush_scans(lambda site_id: connect_db(site_id=site_id))
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Mount static files directory; files linked with asset_url() are cached for good by the browser
+app.mount("/static", AssetFiles(directory="static"), name="static")
 
 # Setup Jinja2 templates
 templates = Jinja2Templates(directory="templates")
+# Keep compiled templates on disk so a restart does not have to recompile them
+templates.env.bytecode_cache = FileSystemBytecodeCache()
+templates.env.globals['asset_url'] = asset_url
+
+# Fragments swapped out-of-band alongside the main fragment of an htmx response
+PAGE_FRAGMENTS = ('header', 'stats', 'search_error')
 
-DB_PATH = 'storage.db'
 UPLOAD_DIRECTORY = "static/images/"
+BARCODE_DIRECTORY = "static/barcodes"
 
 # Global variables to keep track of the total number of boxes and items
 total_boxes = 0
 total_items = 0
 
-# Global variable to keep track of the last scanned single item
-last_single_item_id = None
+# Last scanned single item of each site, for scan-to-move
+last_scanned_items = {}
+# The same for scans replayed from an offline station, by (site, station), so they never pair with live scans
+replayed_scan_items = {}
 last_action = None
 
+# Suggestions shown under the search bar while typing
+AUTOCOMPLETE_LIMIT = 8
+# Results of a search across all sites
+SITE_SEARCH_LIMIT = 50
+
+# Checking the printer spawns a subprocess, so the result is reused for a short while
+PRINTER_STATUS_TTL = 30
+printer_status = None
+printer_status_checked = 0
+
+
+def connect_db(check_same_thread=True, site_id=None):
+    # Every connection is traced so SQL counts and time show up in /metrics. Without `site_id` the database of
+    # the site the current request belongs to is opened.
+    return sqlite3.connect(get_db_path(site_id), factory=TracedConnection, check_same_thread=check_same_thread)
+
+
+SITE_NEUTRAL_PATHS = ('/site/', '/static/')
+
+
+@app.middleware("http")
+async def route_site(request: Request, call_next):
+    # Everything the request does, down to connect_db() and the in-memory indexes, works on this site
+    site_id = resolve_site(request)
+    if site_id is None:
+        # Static files and the site switcher have to keep working, whatever the request asks for
+        if not request.url.path.startswith(SITE_NEUTRAL_PATHS):
+            return PlainTextResponse(f"Unknown site; use one of {', '.join(SITES)}", status_code=404)
+        site_id = DEFAULT_SITE
+    token = current_site.set(site_id)
+    try:
+        response = await call_next(request)
+    finally:
+        current_site.reset(token)
+
+    # Forget a site that has been removed from the configuration, unless the station is picking a new one
+    if request.cookies.get(SITE_COOKIE, site_id) not in SITES and not request.url.path.startswith('/site/'):
+        response.delete_cookie(SITE_COOKIE)
+    return response
+
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    stats = start_request()
+    start = time.perf_counter()
+
+    # Opt-in sampling profile of a single request, returned instead of the page
+    profiler = None
+    if PROFILING_ENABLED and request.query_params.get('profile') == '1':
+        profiler = SamplingProfiler(threading.get_ident())
+        profiler.start()
+
+    response = await call_next(request)
+
+    route = getattr(request.scope.get('route'), 'path', 'unmatched')
+    finish_request(stats, route, request.method, response.status_code, time.perf_counter() - start)
+
+    if profiler is not None:
+        profiler.stop()
+        return PlainTextResponse(profiler.report())
+    return response
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 
 def setup_database():
     global total_boxes, total_items
 
     # Create the database if it does not exist
-    connection = sqlite3.connect(DB_PATH)
+    connection = connect_db()
     cursor = connection.cursor()
 
     # Create `id_tracker` table if it doesn't exist
@@ -103,6 +230,20 @@ def get_total_boxes(cursor):
     return total_boxes
 
 
+def parse_cost(cost):
+    """
+    Turn the free-form cost field into a number, or None when it is left blank.
+    Accepts a leading currency sign and thousands separators; raises ValueError for anything else.
+    """
+    cost = (cost or '').strip().lstrip('$').replace(',', '')
+    if not cost:
+        return None
+    value = float(cost)
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(f"Invalid cost: {cost}")
+    return round(value, 2)
+
+
 def serialize_image_paths(image_paths):
     return json.dumps(image_paths)
 
@@ -111,17 +252,82 @@ def deserialize_image_paths(img_path_json):
     return json.loads(img_path_json)
 
 
+def is_htmx(request):
+    return request.headers.get('HX-Request') == 'true'
+
+
+def render_page(request, template_name, context, fragment='body', oob_fragments=PAGE_FRAGMENTS, headers=None):
+    """
+    Render the whole page, or only the named template blocks when the request comes from htmx.
+    The first block replaces the htmx target; the others are marked as out-of-band swaps.
+    """
+    headers = dict(headers or {}, Vary='HX-Request')
+    if not is_htmx(request):
+        with timed("template", name=template_name):
+            return templates.TemplateResponse(template_name, context, headers=headers)
+
+    template = templates.get_template(template_name)
+    base_template = templates.get_template('base.html')
+    blocks = [(fragment, False)] if fragment else []
+    blocks += [(block_name, True) for block_name in oob_fragments]
+
+    content = []
+    with timed("template", name=template_name):
+        for block_name, oob in blocks:
+            # Blocks that the page does not override live in base.html
+            owner = template if block_name in template.blocks else base_template
+            block_context = owner.new_context(dict(context, oob=oob))
+            content.append(''.join(owner.blocks[block_name](block_context)))
+
+    return HTMLResponse(content=''.join(content), headers=headers)
+
+
+def generate_barcode(find):
+    # python-barcode and Pillow are only loaded when the first barcode is made
+    from generateBarcode import get_barcodes
+    return get_barcodes(find, get_file_directory(BARCODE_DIRECTORY))
+
+
+def get_upload_directory():
+    # Every site numbers its rows from 1, so each keeps its barcodes and photos in its own directory
+    directory = get_file_directory(UPLOAD_DIRECTORY)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def print_barcode_label(image_path):
+    # The printer backend needs Pillow and pywin32, so it is loaded on first use and skipped where it is missing
+    try:
+        from printBarcode import print_label
+    except ImportError as e:
+        logger.warning("label_print_skipped reason=backend_unavailable error=%s", e)
+        return
+
+    with timed("label_print"):
+        print_label(image_path, "LP320 Printer")
+
+
+def get_printer_status():
+    global printer_status, printer_status_checked
+    if printer_status is None or time.monotonic() - printer_status_checked > PRINTER_STATUS_TTL:
+        with timed("printer_check"):
+            printer_status = "Connected" if is_printer_connected("LP320 Printer") else "Not Connected"
+        printer_status_checked = time.monotonic()
+    return printer_status
+
+
 def get_stats(cursor):
-    printer_status = "Connected" if is_printer_connected("LP320 Printer") else "Not Connected"
-    print(printer_status)
+    printer_status = get_printer_status()
     stats = {
         'box_count': get_total_boxes(cursor),
         'item_count': get_total_items(cursor),
-        'last_scan': 'N/A',
-        'last_edit': 'N/A',
+        'last_scan': format_epoch(get_last_scan(cursor)),
+        'last_edit': format_epoch(get_last_edit(cursor)),
         'scanner': printer_status,
         'printer': printer_status,
-        'last_scanned': last_single_item_id
+        'last_scanned': last_scanned_items.get(current_site.get()),
+        'site': current_site.get(),
+        'sites': list(SITES),
     }
     return stats
 
@@ -149,7 +355,7 @@ def is_printer_connected(printer_name):
         return printer_name in printers
 
     except Exception as e:
-        print(f"Error while checking printer status: {e}")
+        logger.warning("printer_check_failed printer=%r error=%s", printer_name, e)
         return False
 
 
@@ -175,17 +381,17 @@ def is_circular_dependency(connection, potential_parent_id, child_id):
 
 
 def get_unique_name(connection, base_name, base_id):
-    print("unique name inputs: ", base_name, base_id)
+    logger.debug("unique_name base_name=%r base_id=%s", base_name, base_id)
     cursor = connection.cursor()
     cursor.execute('SELECT NAME, FIND FROM storage WHERE NAME LIKE ?', (f'{base_name}%',))
     existing_names = cursor.fetchall()
 
-    # Print the existing names for debugging purposes
-    print("Existing names:", existing_names)
+    # Log the existing names for debugging purposes
+    logger.debug("unique_name existing_names=%r", existing_names)
 
     # If there are no matching names, return the base_name unchanged
     if not existing_names:
-        print("returning original name")
+        logger.debug("unique_name result=original")
         return base_name
 
     # Check if the stored_id matches the base_id and names are identical (case-insensitive)
@@ -212,13 +418,11 @@ def get_unique_name(connection, base_name, base_id):
         name = name_tuple
         match = base_pattern.search(name)
 
-        # Print the loop number
-        print(f"Loop number: {loop_index}")
+        logger.debug("unique_name loop=%d", loop_index)
 
         if match:
-            # Print all captured groups for debugging purposes
-            print("Match found:", match.group(0))  # Full match
-            print("All groups:", match.groups())  # Prints all groups in a tuple
+            # Log all captured groups for debugging purposes
+            logger.debug("unique_name match=%r groups=%r", match.group(0), match.groups())
 
             if name_id != base_id:  # Ensure name_id is not equal to base_id
                 number = int(match.group(1))  # Assuming the first group captures a number
@@ -237,14 +441,32 @@ def get_unique_name(connection, base_name, base_id):
 async def homepage(request: Request, box_id: int = None):
     global total_boxes, total_items
     parent_data = None
-    connection = sqlite3.connect(DB_PATH)
+    connection = connect_db()
     cursor = connection.cursor()
 
+    # Unchanged boxes are answered from the ETag alone, or from the rendered box cache
+    # Last Scan and Last Edit are shown on every page, so they are part of every page's ETag
+    etag = get_box_etag(cursor, box_id if box_id is not None else 1, last_scanned_items.get(current_site.get()),
+                        get_last_scan(cursor), get_last_edit(cursor), get_printer_status(),
+                        'hx' if is_htmx(request) else 'page')
+    if request.headers.get('if-none-match') == etag:
+        connection.close()
+        return Response(status_code=304, headers={'ETag': etag})
+
+    cached_body = get_cached_box(etag)
+    if cached_body is not None:
+        connection.close()
+        return HTMLResponse(content=cached_body, headers={'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'HX-Request'})
+
     # If no box_id is provided, use the rootdirectory
     if box_id is None:
         cursor.execute('SELECT * FROM storage WHERE FIND = 1;')
         root_box = cursor.fetchone()
 
+        if root_box is None:
+            connection.close()
+            return HTMLResponse(content="Root directory not found.", status_code=404)
+
         parent_data = {
             'id': root_box[0],
             'name': root_box[1],
@@ -260,9 +482,6 @@ async def homepage(request: Request, box_id: int = None):
             'cost': root_box[11]
         }
 
-        if root_box is None:
-            return HTMLResponse(content="Root directory not found.", status_code=404)
-
         box_id = root_box[0]  # The FIND value of the "rootdirectory"
         box_name = root_box[1]  # The name of the "rootdirectory"
     else:
@@ -270,6 +489,10 @@ async def homepage(request: Request, box_id: int = None):
         cursor.execute('SELECT * FROM storage WHERE FIND = ?', (box_id,))
         result = cursor.fetchone()
 
+        if result is None:
+            connection.close()
+            return HTMLResponse(content="Box not found.", status_code=404)
+
         parent_data = {
             'id': result[0],
             'name': result[1],
@@ -285,9 +508,6 @@ async def homepage(request: Request, box_id: int = None):
             'cost': result[11]
         }
 
-        if result is None:
-            return HTMLResponse(content="Box not found.", status_code=404)
-
     cursor.execute('SELECT * FROM storage WHERE PARENT = ?', (box_id,))
     result = cursor.fetchall()
 
@@ -313,18 +533,20 @@ async def homepage(request: Request, box_id: int = None):
     connection.close()
 
     # Return the updated template with box name and ID
-    return templates.TemplateResponse('homepage.html', {
+    response = render_page(request, 'homepage.html', {
         'request': request,
         'stats': stats,
         'parent': parent_data,
         'data': child_data
-    })
+    }, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+    cache_box(etag, response.body)
+    return response
 
 
 @app.get("/new/{item_type}", response_class=HTMLResponse)
 async def new_item(request: Request, item_type: str):  # Ensure `item_type` is included here
     global total_boxes, total_items
-    connection = sqlite3.connect(DB_PATH)
+    connection = connect_db()
     cursor = connection.cursor()
 
     stats = get_stats(cursor)
@@ -346,7 +568,7 @@ async def new_item(request: Request, item_type: str):  # Ensure `item_type` is i
         'cost': None
     }
 
-    return templates.TemplateResponse('add.html', {
+    return render_page(request, 'add.html', {
         'request': request,
         'stats': stats,
         'data': item_data,
@@ -384,7 +606,7 @@ async def add_item(
         else:
             parent = int(parent)  # Convert to integer if provided
 
-        connection = sqlite3.connect(DB_PATH)
+        connection = connect_db()
         cursor = connection.cursor()
 
         stats = get_stats(cursor)
@@ -393,7 +615,7 @@ async def add_item(
         cursor.execute('SELECT FIND, TYPE FROM storage WHERE FIND = ? AND TYPE = "BOX";', (parent,))
         parent_record = cursor.fetchone()
 
-        print("Parent Record: ", parent_record)
+        logger.debug("add_item parent_record=%r", parent_record)
 
         item_data = {
             'id': None,
@@ -410,9 +632,16 @@ async def add_item(
             'cost': cost
         }
 
-        if parent_record is None:
-            error_message = f"Parent ID {parent} does not exist or is not of type 'BOX'."
-            return templates.TemplateResponse('add.html', {
+        # Reports add up COST, so only numbers are stored
+        cost_error = None
+        try:
+            cost = parse_cost(cost)
+        except ValueError:
+            cost_error = f"Cost must be a number, not '{cost}'."
+
+        if parent_record is None or cost_error:
+            error_message = cost_error or f"Parent ID {parent} does not exist or is not of type 'BOX'."
+            return render_page(request, 'add.html', {
                 'request': request,
                 'stats': stats,
                 'data': item_data,
@@ -426,11 +655,11 @@ async def add_item(
             for image in images:
                 # Check if the filename is not blank before proceeding
                 if not image.filename.strip():
-                    print("Empty filename detected, skipping this file.")
+                    logger.debug("upload_skipped reason=empty_filename")
                     continue
 
-                # Save each image to the UPLOAD_DIRECTORY
-                image_path = os.path.join(UPLOAD_DIRECTORY, image.filename)
+                # Save each image to the site's upload directory
+                image_path = os.path.join(get_upload_directory(), image.filename)
                 with open(image_path, "wb") as buffer:
                     buffer.write(await image.read())
                 image_paths.append(image_path)
@@ -440,60 +669,154 @@ async def add_item(
 
         # Generate a unique FIND value
         find = get_unique_find(connection)
-        current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        current_time = now_epoch()
+        current_date = format_epoch(current_time)
 
         # Ensure the name is unique
         name = get_unique_name(connection, name, find)
 
         # Generate a unique barcode using the FIND value and get its image path
-        barcode_image_path, barcode_number = get_barcodes(find)
-        print_label(barcode_image_path, "LP320 Printer")
+        barcode_image_path, barcode_number = generate_barcode(find)
+        print_barcode_label(barcode_image_path)
         # Insert the new item or box into the storage table
         cursor.execute('''
             INSERT INTO storage 
-            (FIND, NAME, TYPE, DESCRIPTION, WEIGHT, BARCODE_NUMBER, BARCODE_IMG_PATH, DATE_CREATED, DATE_MODIFIED, PARENT, IMG_PATH, COST) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (barcode_number, name, item_type, description, weight, barcode_number, barcode_image_path, current_date, current_date, parent, img_path_json, cost))
+            (FIND, NAME, TYPE, DESCRIPTION, WEIGHT, BARCODE_NUMBER, BARCODE_IMG_PATH, DATE_CREATED, DATE_MODIFIED, PARENT, IMG_PATH, COST, CREATED_AT, MODIFIED_AT) 
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (barcode_number, name, item_type, description, weight, barcode_number, barcode_image_path, current_date, current_date, parent, img_path_json, cost, current_time, current_time))
 
         #barcode_number is used for find to make it easier to search for boxes or items when scanning their barcode
 
         connection.commit()
+        refresh_row(connection, barcode_number)
         connection.close()
 
         return RedirectResponse(url="/", status_code=303)
 
     except Exception as e:
-        print(f"Error while processing item: {e}")
+        logger.exception("Error while processing item")
         return HTMLResponse(content="Error while processing item.", status_code=500)
 
 
 @app.get("/delete/{item_id}", response_class=HTMLResponse)
 async def delete_item(request: Request, item_id: int):
     try:
-        connection = sqlite3.connect(DB_PATH)
+        connection = connect_db()
         cursor = connection.cursor()
 
+        # Remember the files of the deleted row so they can be removed from disk afterwards
+        cursor.execute('SELECT BARCODE_IMG_PATH, IMG_PATH FROM storage WHERE FIND = ?', (item_id,))
+        deleted_row = cursor.fetchone()
+
         cursor.execute('UPDATE storage SET PARENT = 1 WHERE PARENT = ?', (item_id,))
 
         cursor.execute('DELETE FROM storage WHERE FIND = ?', (item_id,))
         cursor.execute('DELETE FROM id_tracker WHERE id = ?', (item_id,))
 
+        unused_files = []
+        if deleted_row:
+            image_paths = deserialize_image_paths(deleted_row[1]) if deleted_row[1] else []
+            unused_files = [deleted_row[0]] + get_unreferenced_images(cursor, image_paths)
+
         # Commit the changes and close the connection
         connection.commit()
+        reparent_children(item_id, 1)
+        remove_row(item_id)
+        queue_file_cleanup(unused_files)
+
+        # htmx removes the deleted card itself, so only the stats need to be sent back
+        if is_htmx(request):
+            stats = get_stats(cursor)
+            connection.close()
+            return render_page(request, 'homepage.html', {
+                'request': request,
+                'stats': stats
+            }, fragment=None, oob_fragments=('stats',))
+
         connection.close()
 
         # Redirect to the homepage after deletion
         return RedirectResponse(url="/", status_code=303)
 
     except Exception as e:
-        print(f"Error while deleting item: {e}")
+        logger.exception("Error while deleting item")
         return HTMLResponse(content="Error while deleting item.", status_code=500)
 
 
+@app.get("/delete-tree/{box_id}", response_class=HTMLResponse)
+async def delete_box_tree(request: Request, box_id: int):
+    try:
+        connection = connect_db()
+
+        # Delete the box together with everything inside it, then remove their files in the background
+        try:
+            deleted_ids, unused_files = delete_subtree(connection, box_id)
+        except ValueError as e:
+            connection.close()
+            return HTMLResponse(content=str(e), status_code=400)
+
+        for deleted_id in deleted_ids:
+            remove_row(deleted_id)
+        queue_file_cleanup(unused_files)
+
+        if is_htmx(request):
+            stats = get_stats(connection.cursor())
+            connection.close()
+            return render_page(request, 'homepage.html', {
+                'request': request,
+                'stats': stats
+            }, fragment=None, oob_fragments=('stats',))
+
+        connection.close()
+        return RedirectResponse(url="/", status_code=303)
+
+    except Exception as e:
+        logger.exception("Error while deleting box contents")
+        return HTMLResponse(content="Error while deleting box contents.", status_code=500)
+
+
+@app.post("/move-tree/{box_id}", response_class=HTMLResponse)
+async def move_box_tree(request: Request, box_id: int, parent: int = Form(...)):
+    try:
+        connection = connect_db()
+
+        # Moving the box moves its contents with it; moves into its own subtree are refused
+        try:
+            move_subtree(connection, box_id, parent)
+        except ValueError as e:
+            connection.close()
+            return HTMLResponse(content=str(e), status_code=400)
+
+        refresh_row(connection, box_id)
+        connection.close()
+        return RedirectResponse(url=f"/?box_id={parent}", status_code=303)
+
+    except Exception as e:
+        logger.exception("Error while moving box")
+        return HTMLResponse(content="Error while moving box.", status_code=500)
+
+
+@app.get("/flatten/{box_id}", response_class=HTMLResponse)
+async def flatten_box_tree(request: Request, box_id: int):
+    try:
+        connection = connect_db()
+
+        # Pull everything nested inside the box up to be its direct children
+        moved_ids = flatten_subtree(connection, box_id)
+        refresh_rows(connection, moved_ids)
+
+        connection.close()
+        return RedirectResponse(url=f"/?box_id={box_id}", status_code=303)
+
+    except Exception as e:
+        logger.exception("Error while flattening box")
+        return HTMLResponse(content="Error while flattening box.", status_code=500)
+
+
 @app.get("/modify/{item_id}", response_class=HTMLResponse)
 async def modify_item(request: Request, item_id: int):
     try:
-        connection = sqlite3.connect(DB_PATH)
+        connection = connect_db()
         cursor = connection.cursor()
 
         # Fetch the item details to be modified
@@ -525,7 +848,7 @@ async def modify_item(request: Request, item_id: int):
         connection.close()
 
         # Render the add.html template with item data for modification
-        return templates.TemplateResponse('add.html', {
+        return render_page(request, 'add.html', {
             'request': request,
             'stats': stats,
             'data': item_data,
@@ -534,7 +857,7 @@ async def modify_item(request: Request, item_id: int):
         })
 
     except Exception as e:
-        print(f"Error while fetching item for modification: {e}")
+        logger.exception("Error while fetching item for modification")
         return HTMLResponse(content="Error while fetching item for modification.", status_code=500)
 
 
@@ -551,23 +874,51 @@ async def modify_item_submit(
         delete_images: list[str] = Form([])  # List of images marked for deletion
 ):
     try:
-        connection = sqlite3.connect(DB_PATH)
+        connection = connect_db()
         cursor = connection.cursor()
 
         # Fetch the current item details to modify images
-        cursor.execute('SELECT IMG_PATH FROM storage WHERE FIND = ?', (item_id,))
+        cursor.execute('SELECT * FROM storage WHERE FIND = ?', (item_id,))
         current_item = cursor.fetchone()
 
-        print("starting unique name")
         # Ensure the name is unique
         name = get_unique_name(connection, name, item_id)
-        print("modified name: ", name)
+        logger.debug("modify_item name=%r", name)
 
         if not current_item:
             return HTMLResponse(content="Item not found.", status_code=404)
 
         # Deserialize existing image paths
-        existing_image_paths = deserialize_image_paths(current_item[0]) if current_item[0] else []
+        existing_image_paths = deserialize_image_paths(current_item[10]) if current_item[10] else []
+
+        try:
+            cost = parse_cost(cost)
+        except ValueError:
+            # Show the form again with the values as entered, the same way adding an item does
+            item_data = {
+                'id': current_item[0],
+                'name': name,
+                'type': current_item[2],
+                'description': description,
+                'weight': weight,
+                'barcode_num': current_item[5],
+                'barcode_path': current_item[6],
+                'date_created': current_item[7],
+                'date_modified': current_item[8],
+                'parent': parent,
+                'images': existing_image_paths,
+                'cost': cost
+            }
+            stats = get_stats(cursor)
+            connection.close()
+            return render_page(request, 'add.html', {
+                'request': request,
+                'stats': stats,
+                'data': item_data,
+                'parent': item_data,
+                'opp': 'MODIFY',
+                'error': f"Cost must be a number, not '{cost}'."
+            })
 
         # Remove images that are marked for deletion from the list
         updated_image_paths = [path for path in existing_image_paths if path not in delete_images]
@@ -576,11 +927,11 @@ async def modify_item_submit(
         for image in images:
             # Check if the filename is not blank before proceeding
             if not image.filename.strip():
-                print("Empty filename detected, skipping this file.")
+                logger.debug("upload_skipped reason=empty_filename")
                 continue
 
-            # Save each image to the UPLOAD_DIRECTORY
-            image_path = os.path.join(UPLOAD_DIRECTORY, image.filename)
+            # Save each image to the site's upload directory
+            image_path = os.path.join(get_upload_directory(), image.filename)
             with open(image_path, "wb") as buffer:
                 buffer.write(await image.read())
             updated_image_paths.append(image_path)
@@ -589,28 +940,30 @@ async def modify_item_submit(
         img_path_json = serialize_image_paths(updated_image_paths)
 
         # Update the item in the database
-        current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        current_time = now_epoch()
+        current_date = format_epoch(current_time)
         cursor.execute('''
             UPDATE storage
-            SET NAME = ?, DESCRIPTION = ?, WEIGHT = ?, DATE_MODIFIED = ?, PARENT = ?, COST = ?, IMG_PATH = ?
+            SET NAME = ?, DESCRIPTION = ?, WEIGHT = ?, DATE_MODIFIED = ?, MODIFIED_AT = ?, PARENT = ?, COST = ?, IMG_PATH = ?
             WHERE FIND = ?;
-        ''', (name, description, weight, current_date, parent, cost, img_path_json, item_id))
+        ''', (name, description, weight, current_date, current_time, parent, cost, img_path_json, item_id))
 
         connection.commit()
+        refresh_row(connection, item_id)
         connection.close()
 
         # Redirect to the homepage after modification
         return RedirectResponse(url="/", status_code=303)
 
     except Exception as e:
-        print(f"Error while modifying item: {e}")
+        logger.exception("Error while modifying item")
         return HTMLResponse(content="Error while modifying item.", status_code=500)
 
 
 @app.get("/display-all", response_class=HTMLResponse)
 async def homepage(request: Request, box_id: int = None):
     global total_boxes, total_items
-    connection = sqlite3.connect(DB_PATH)
+    connection = connect_db()
     cursor = connection.cursor()
 
     cursor.execute('SELECT * FROM storage WHERE FIND = 1')
@@ -658,7 +1011,7 @@ async def homepage(request: Request, box_id: int = None):
     connection.close()
 
     # Return the updated template with box name and ID
-    return templates.TemplateResponse('display-all.html', {
+    return render_page(request, 'display-all.html', {
         'request': request,
         'data': item_data,
         'stats': stats,
@@ -666,10 +1019,71 @@ async def homepage(request: Request, box_id: int = None):
     })
 
 
+def activity_list_data(rows):
+    # Rows with itemTimestamps.ACTIVITY_COLUMNS
+    return [
+        {
+            'id': column[0],
+            'name': column[1],
+            'type': column[2],
+            'description': column[3],
+            'weight': column[4],
+            'barcode_num': column[5],
+            'barcode_path': column[6],
+            'date_created': column[7],
+            'date_modified': column[8],
+            'parent': column[9],
+            'images': column[10],
+            'cost': column[11],
+            'last_scanned': format_epoch(column[12])
+        } for column in rows
+    ]
+
+
+@app.get("/recent", response_class=HTMLResponse)
+async def recently_modified(request: Request, days: float = 7, limit: int = 500):
+    connection = connect_db()
+    cursor = connection.cursor()
+
+    # Range scan on idx_storage_modified_at
+    item_data = activity_list_data(get_recently_modified(cursor, days, limit))
+    stats = get_stats(cursor)
+
+    connection.close()
+
+    return render_page(request, 'display-all.html', {
+        'request': request,
+        'data': item_data,
+        'stats': stats,
+        'parent': {},
+        'title': f"Modified in the Last {days:g} Days"
+    })
+
+
+@app.get("/stale", response_class=HTMLResponse)
+async def stale_boxes(request: Request, days: float = 90, limit: int = 500):
+    connection = connect_db()
+    cursor = connection.cursor()
+
+    # Range scan on idx_storage_box_last_seen
+    item_data = activity_list_data(get_stale_boxes(cursor, days, limit))
+    stats = get_stats(cursor)
+
+    connection.close()
+
+    return render_page(request, 'display-all.html', {
+        'request': request,
+        'data': item_data,
+        'stats': stats,
+        'parent': {},
+        'title': f"Boxes Not Scanned in {days:g} Days"
+    })
+
+
 @app.get("/reprint/{item_id}", response_class=HTMLResponse)
 async def reprint_barcode(request: Request, item_id: int):
     try:
-        connection = sqlite3.connect(DB_PATH)
+        connection = connect_db()
         cursor = connection.cursor()
 
         # Fetch the barcode image path for the given item ID
@@ -696,57 +1110,69 @@ async def reprint_barcode(request: Request, item_id: int):
         }
 
         # Print the barcode image
-        print_label(result[6], "LP320 Printer")
+        print_barcode_label(result[6])
 
         stats = get_stats(cursor)
 
         connection.close()
 
-        # Render the 'add.html' template to return to the current item view
-        return templates.TemplateResponse('add.html', {
+        # Render the 'add.html' template to return to the current item view; htmx only swaps the reprint form
+        return render_page(request, 'add.html', {
             'request': request,
             'stats': stats,
             'data': item_data,
             'parent': item_data,
-            'opp': 'MODIFY'
-        })
+            'opp': 'MODIFY',
+            'reprinted': True
+        }, fragment='reprint', oob_fragments=())
 
     except Exception as e:
-        print(f"Error while reprinting barcode: {e}")
+        logger.exception("Error while reprinting barcode")
         return HTMLResponse(content="Error while reprinting barcode.", status_code=500)
 
 
 @app.get("/search/{item_id}", response_class=HTMLResponse)
 async def search_item(request: Request, item_id: str):
-    global last_single_item_id
+    # Scan-to-move state is kept per site; it is written back once the scan has been handled
+    site_id = current_site.get()
+    last_single_item_id = last_scanned_items.get(site_id)
     try:
         # Remove leading zeros from the item_id
         stripped_item_id = item_id.lstrip('0')
         #print("stripped id: ", stripped_item_id)
-        connection = sqlite3.connect(DB_PATH)
+        connection = connect_db()
         cursor = connection.cursor()
 
-        stats = get_stats(cursor)
         scan_error = None
         search_error = None
 
         # Check if the item ID is numeric, indicating a barcode or ID search
-        if stripped_item_id.isdigit():
-            # Search for the item with the stripped ID or exact name in the storage table
-            cursor.execute('SELECT * FROM storage WHERE FIND = ? OR NAME = ?', (stripped_item_id, item_id))
+        if stripped_item_id.isdecimal():
+            # Look up the stripped ID or exact name in the in-memory barcode index
+            result = lookup_scan(connection, item_id, stripped_item_id)
+            if result:
+                # Record the scan time for Last Scan and the stale box report; the scan writer stores it shortly
+                scanned_at = now_epoch()
+                queue_scanned([row[0] for row in result], scanned_at)
+                mark_rows_scanned([row[0] for row in result], scanned_at)
         else:
             # Search for items or boxes where the name contains the input
             cursor.execute('SELECT * FROM storage WHERE NAME LIKE ?', (f'%{item_id}%',))
+            result = cursor.fetchall()
+            if not result:
+                # Nothing contains the text as typed, so show the closest spellings in names and descriptions
+                with timed("fuzzy_search"):
+                    result = fuzzy_search(connection, item_id)
 
-        result = cursor.fetchall()
+        stats = get_stats(cursor)
 
         item_data = []
 
         if not result:
             connection.close()
-            print("Item/box not found.")
+            logger.info("search_not_found item_id=%r", item_id)
             search_error = f"{item_id} does not exist"
-            return templates.TemplateResponse('homepage.html', {
+            return render_page(request, 'homepage.html', {
                 'request': request,
                 'stats': stats,
                 'data': item_data,
@@ -776,45 +1202,17 @@ async def search_item(request: Request, item_id: str):
 
         # Handle the case where there is exactly one item in the search result
         if len(result) == 1:
-            # Get the ID and type of the current single item found
-            current_item_id = result[0][0]
-            current_item_type = result[0][2]
-
-            # Check if there is a previously tracked single item
-            if last_single_item_id is not None:
-                # Fetch the type of the newly scanned item to ensure it's a box
-                cursor.execute('SELECT TYPE FROM storage WHERE FIND = ?', (current_item_id,))
-                parent_type = cursor.fetchone()
-
-                if parent_type and parent_type[0] == "BOX" and last_single_item_id != current_item_id:
-                    # Update the parent of the previously tracked item
-                    cursor.execute('''
-                        UPDATE storage 
-                        SET PARENT = ? 
-                        WHERE FIND = ?;
-                    ''', (current_item_id, last_single_item_id))
-                    connection.commit()
-                    # Clear the last_single_item_id after setting the parent
-                    last_single_item_id = None
-                else:
-                    if not parent_type:
-                        print("Error: Parent type is None.")
-                        scan_error = "Error: Parent type is None."
-                    elif parent_type[0] != "BOX":
-                        print(f"Error: The new parent must be a 'BOX', but found '{parent_type[0]}'.")
-                        scan_error = f"Error: The new parent must be a 'BOX', but found '{parent_type[0]}'."
-                    elif last_single_item_id == current_item_id:
-                        print("Error: The new parent is the same as the current item.")
-                        scan_error = "Error: The new parent is the same as the current item."
-                    last_single_item_id = None
-            else:
-                # Track the ID of the single item found
-                last_single_item_id = current_item_id
+            # Scanning an item and then a box moves the item into the box
+            last_single_item_id, moved_id, scan_error = apply_scan(cursor, last_single_item_id, result[0])
+            if moved_id is not None:
+                connection.commit()
+                refresh_row(connection, moved_id)
 
+        last_scanned_items[site_id] = last_single_item_id
         connection.close()
 
         # Render a template (e.g., 'homepage.html') to show the item details
-        return templates.TemplateResponse('homepage.html', {
+        return render_page(request, 'homepage.html', {
             'request': request,
             'stats': stats,
             'data': item_data,
@@ -823,13 +1221,254 @@ async def search_item(request: Request, item_id: str):
         })
 
     except Exception as e:
-        print(f"Error while searching for item: {e}")
+        logger.exception("Error while searching for item")
         return HTMLResponse(content="Error while searching for item.", status_code=500)
 
 
+@app.get("/autocomplete", response_class=HTMLResponse)
+async def autocomplete(request: Request, q: str = ''):
+    # Answered from the in-memory prefix index, so a keystroke never touches the database.
+    # Digits are a barcode being scanned, which is looked up on Enter instead.
+    if len(q.strip()) < 2 or q.strip().isdigit():
+        rows = []
+    else:
+        rows = complete_names(q, AUTOCOMPLETE_LIMIT)
+
+    matches = [{'id': row[0], 'name': row[1], 'type': row[2]} for row in rows]
+    with timed("template", name="autocomplete.html"):
+        return templates.TemplateResponse('autocomplete.html', {'request': request, 'matches': matches})
+
+
+@app.get("/site/{site_id}")
+async def select_site(site_id: str):
+    # Stations stay on the chosen site until they pick another one
+    if site_id not in SITES:
+        return PlainTextResponse(f"Unknown site; use one of {', '.join(SITES)}", status_code=404)
+    response = RedirectResponse(url="/", status_code=303)
+    response.set_cookie(SITE_COOKIE, site_id, max_age=10 * 365 * 24 * 3600, samesite='lax')
+    return response
+
+
+@app.get("/changes")
+async def change_feed(since: int = 0, limit: int = 10000):
+    connection = connect_db()
+    cursor = connection.cursor()
+    horizon = get_change_horizon(cursor)
+    latest_seq = get_latest_seq(cursor)
+    connection.close()
+
+    site_id = current_site.get()
+
+    # Changes older than the horizon were compacted away, so the client has to start over from a full snapshot
+    if since < horizon:
+        return JSONResponse({'error': 'since is older than the change log horizon', 'horizon': horizon,
+                             'snapshot': f'/changes/snapshot?site={site_id}'}, status_code=410)
+
+    def stream_changes():
+        # Streaming runs in a worker thread, and each chunk may come from a different one
+        stream_connection = connect_db(check_same_thread=False, site_id=site_id)
+        try:
+            for change in get_changes(stream_connection.cursor(), since, limit):
+                yield json.dumps(change) + '\n'
+        finally:
+            stream_connection.close()
+
+    # One JSON object per line; pass the last seq received as `since` to fetch the next page
+    return StreamingResponse(stream_changes(), media_type='application/x-ndjson',
+                             headers={'X-Latest-Seq': str(latest_seq)})
+
+
+@app.get("/changes/snapshot")
+async def change_feed_snapshot():
+    # Every row, in the same format as /changes; continue with /changes?since=<X-Latest-Seq>
+    connection = connect_db()
+    try:
+        latest_seq, rows = get_snapshot(connection.cursor())
+    finally:
+        connection.close()
+
+    return StreamingResponse((json.dumps(row) + '\n' for row in rows), media_type='application/x-ndjson',
+                             headers={'X-Latest-Seq': str(latest_seq)})
+
+
+def api_response(payload, status_code=200, headers=None):
+    return Response(content=dump_json(payload), status_code=status_code, media_type='application/json',
+                    headers=headers)
+
+
+@app.get(f"/api/{API_VERSION}/items")
+async def api_list_items(type: str = None, parent: int = None, subtree: int = None,
+                         weight_min: float = None, weight_max: float = None,
+                         cost_min: float = None, cost_max: float = None,
+                         created_after: int = None, created_before: int = None,
+                         modified_after: int = None, modified_before: int = None,
+                         sort: str = 'id', fields: str = None, limit: int = 100, cursor: str = None):
+    # Dates are UTC epoch seconds; pass `next_cursor` back as `cursor` with the same filters for the next page
+    filters = {
+        'type': type, 'parent': parent, 'subtree': subtree,
+        'weight_min': weight_min, 'weight_max': weight_max, 'cost_min': cost_min, 'cost_max': cost_max,
+        'created_after': created_after, 'created_before': created_before,
+        'modified_after': modified_after, 'modified_before': modified_before,
+    }
+    connection = connect_db()
+    try:
+        items, next_cursor = query_items(connection.cursor(), filters, sort, fields, limit, cursor)
+    except ValueError as e:
+        return api_response({'error': str(e)}, status_code=400)
+    finally:
+        connection.close()
+
+    return api_response({'items': items, 'next_cursor': next_cursor})
+
+
+@app.get(f"/api/{API_VERSION}/items/{{item_id}}")
+async def api_get_item(item_id: int, fields: str = None):
+    connection = connect_db()
+    try:
+        item = get_item(connection.cursor(), item_id, fields)
+    except ValueError as e:
+        return api_response({'error': str(e)}, status_code=400)
+    finally:
+        connection.close()
+
+    if item is None:
+        return api_response({'error': f"{item_id} does not exist"}, status_code=404)
+    return api_response(item)
+
+
+@app.get(f"/api/{API_VERSION}/reports/inventory")
+async def api_inventory_report(top: int = 10):
+    # NumPy is only loaded when the first report is asked for
+    try:
+        from inventoryReports import get_inventory_report
+    except ImportError as e:
+        return api_response({'error': f"Reports are unavailable: {e}"}, status_code=503)
+
+    connection = connect_db()
+    try:
+        with timed("report", name="inventory"):
+            report = get_inventory_report(connection, max(1, min(top, 100)))
+    finally:
+        connection.close()
+    return api_response(report)
+
+
+@app.get(f"/api/{API_VERSION}/reports/boxes/{{box_id}}")
+async def api_box_report(box_id: int):
+    try:
+        from inventoryReports import get_box_valuation
+    except ImportError as e:
+        return api_response({'error': f"Reports are unavailable: {e}"}, status_code=503)
+
+    connection = connect_db()
+    try:
+        with timed("report", name="box"):
+            valuation = get_box_valuation(connection, box_id)
+    finally:
+        connection.close()
+
+    if valuation is None:
+        return api_response({'error': f"{box_id} does not exist"}, status_code=404)
+    return api_response(valuation)
+
+
+@app.post(f"/api/{API_VERSION}/scans")
+async def api_replay_scans(request: Request):
+    # Scans a station buffered while offline, replayed in one transaction; see scanReplay.py
+    try:
+        station, events, rejected = parse_events(json.loads(await request.body()))
+    except ValueError as e:
+        return api_response({'error': str(e)}, status_code=400)
+
+    # A long queue arrives in several batches, so an item at the end of one can be moved by a box in the next
+    station_key = (current_site.get(), station)
+    connection = connect_db()
+    try:
+        with timed("scan_replay"):
+            results, last_item_id, changed = replay_scans(connection, station, events,
+                                                          replayed_scan_items.get(station_key))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        connection.close()
+        logger.exception("Error while replaying scans")
+        return api_response({'error': "Error while replaying scans."}, status_code=500)
+
+    if station is not None:
+        replayed_scan_items[station_key] = last_item_id
+    for find in changed:
+        refresh_row(connection, find)
+    connection.close()
+    logger.info("scans_replayed station=%r events=%d rejected=%d changed=%d", station, len(events), len(rejected),
+                len(changed))
+    # Rejected events are acknowledged too, after the replayed ones, so the station stops sending them
+    return api_response({'results': results + rejected, 'last_scanned': last_item_id})
+
+
+@app.get("/service-worker.js")
+async def service_worker():
+    # Served from the root so the worker controls every page; browsers check it for updates themselves
+    return FileResponse("static/js/service-worker.js", media_type="text/javascript",
+                        headers={'Cache-Control': 'no-cache'})
+
+
+def get_site_summary(connection):
+    cursor = connection.cursor()
+    return {
+        'box_count': get_total_boxes(cursor),
+        'item_count': get_total_items(cursor),
+        'last_scan': get_last_scan(cursor),
+        'last_edit': get_last_edit(cursor),
+    }
+
+
+def search_site(connection, query, limit):
+    # Same matching as the search bar: names containing the text, else the closest spellings
+    cursor = connection.cursor()
+    cursor.execute('SELECT * FROM storage WHERE NAME LIKE ? ORDER BY NAME LIMIT ?;', (f'%{query}%', limit))
+    rows = cursor.fetchall()
+    if not rows:
+        rows = fuzzy_search(connection, query, limit)
+    return [row_to_item(list(FIELD_COLUMNS), row) for row in rows]
+
+
+@app.get(f"/api/{API_VERSION}/sites")
+async def api_sites():
+    # Each site is counted on its own connection, in parallel, then the counts are added up
+    with timed("fan_out", name="sites"):
+        summaries = fan_out(get_site_summary, connect_db)
+
+    last_scans = [summary['last_scan'] for summary in summaries.values() if summary['last_scan'] is not None]
+    last_edits = [summary['last_edit'] for summary in summaries.values() if summary['last_edit'] is not None]
+    return api_response({
+        'sites': [dict(summary, site=site_id) for site_id, summary in summaries.items()],
+        'total': {
+            'box_count': sum(summary['box_count'] for summary in summaries.values()),
+            'item_count': sum(summary['item_count'] for summary in summaries.values()),
+            'last_scan': max(last_scans, default=None),
+            'last_edit': max(last_edits, default=None),
+        },
+    })
+
+
+@app.get(f"/api/{API_VERSION}/search")
+async def api_search_sites(q: str, sites: str = None, limit: int = SITE_SEARCH_LIMIT):
+    # Search every site (or a comma-separated list of them) at once; ids are only unique within a site
+    site_ids = [site_id.strip() for site_id in sites.split(',') if site_id.strip()] if sites else list(SITES)
+    unknown = [site_id for site_id in site_ids if site_id not in SITES]
+    if unknown:
+        return api_response({'error': f"Unknown sites: {', '.join(unknown)}"}, status_code=400)
+
+    limit = max(1, min(limit, SITE_SEARCH_LIMIT))
+    with timed("fan_out", name="search"):
+        results = fan_out(lambda connection: search_site(connection, q, limit), connect_db, site_ids)
+
+    items = [dict(item, site=site_id) for site_id, site_items in results.items() for item in site_items]
+    items.sort(key=lambda item: (item['name'].lower(), item['site'], item['id']))
+    return api_response({'items': items[:limit]})
+
+
 if __name__ == "__main__":
-    if not os.path.exists(DB_PATH):
-        setup_database()
     import uvicorn
 
     uvicorn.run(app, host="127.0.0.1", port=9000)
@@ -0,0 +1,294 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import tarfile
+import tempfile
+from datetime import datetime
+
+from boxCache import GLOBAL_VERSION_ROW, setup_box_versions
+from changeFeed import get_latest_seq, setup_change_log
+from fileCleanup import get_referenced_files
+from sites import DEFAULT_SITE, get_db_path, get_file_directory
+
+logger = logging.getLogger(__name__)
+
+# Online snapshots of the database plus the barcode and photo files it references.
+# Usage:
+#   python backup.py snapshot [--incremental] [--dest backups]
+#   python backup.py restore backups/snapshot-20241010-034926-000000.tar.gz [--db storage.db]
+#     (restart the app after restoring the database it serves)
+#   python backup.py verify backups/snapshot-20241010-034926-000000.tar.gz
+# Add --site to back up another site; its snapshots go to backups/<site>.
+
+DB_PATH = 'storage.db'
+BACKUP_DIRECTORY = 'backups'
+
+# The backup API copies this many pages per step and sleeps in between, so writers only wait for one step
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.005
+
+
+def file_sha256(file_object):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file_object.read(1024 * 1024), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_database(source_path, target_path):
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+    finally:
+        target.close()
+        source.close()
+
+
+def check_database(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        result = connection.execute('PRAGMA integrity_check;').fetchone()[0]
+    finally:
+        connection.close()
+    if result != 'ok':
+        raise ValueError(f"Integrity check failed for {db_path}: {result}")
+
+
+def get_snapshot_files(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        return get_referenced_files(connection.cursor())
+    finally:
+        connection.close()
+
+
+def get_latest_manifest(dest):
+    # Every archive has a copy of its manifest next to it so incremental snapshots don't have to open archives
+    if not os.path.isdir(dest):
+        return None
+    manifests = sorted(name for name in os.listdir(dest) if name.endswith('.manifest.json'))
+    if not manifests:
+        return None
+    with open(os.path.join(dest, manifests[-1])) as manifest_file:
+        return json.load(manifest_file)
+
+
+def take_snapshot(db_path=DB_PATH, dest=BACKUP_DIRECTORY, incremental=False, base_dir='.'):
+    """
+    Copy the live database with the backup API and bundle it with the files it references into a .tar.gz.
+    In incremental mode only files that are new or changed since the last snapshot are stored; the manifest
+    records which earlier archive holds each of the others.
+    """
+    os.makedirs(dest, exist_ok=True)
+    name = 'snapshot-' + datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    archive_path = os.path.join(dest, name + '.tar.gz')
+
+    previous = get_latest_manifest(dest) if incremental else None
+    previous_files = previous['files'] if previous else {}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        snapshot_db = os.path.join(work_dir, 'storage.db')
+        copy_database(db_path, snapshot_db)
+        check_database(snapshot_db)
+
+        with open(snapshot_db, 'rb') as db_file:
+            db_sha256 = file_sha256(db_file)
+
+        files = {}
+        missing = []
+        with tarfile.open(archive_path, 'w:gz') as archive:
+            archive.add(snapshot_db, arcname='storage.db')
+
+            for path in get_snapshot_files(snapshot_db):
+                full_path = os.path.join(base_dir, path)
+                if not os.path.isfile(full_path):
+                    missing.append(path)
+                    continue
+
+                stat = os.stat(full_path)
+                old = previous_files.get(path)
+                if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+                    # Unchanged since the last snapshot: point at the archive that already holds it
+                    files[path] = old
+                    continue
+
+                with open(full_path, 'rb') as data_file:
+                    sha256 = file_sha256(data_file)
+                archive.add(full_path, arcname='files/' + path)
+                files[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256,
+                               'archive': name + '.tar.gz'}
+
+            manifest = {
+                'name': name,
+                'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'incremental': bool(previous),
+                'base': previous['name'] if previous else None,
+                'db_sha256': db_sha256,
+                'files': files,
+                'missing_files': missing,
+            }
+            manifest_bytes = json.dumps(manifest, indent=2).encode()
+            info = tarfile.TarInfo('manifest.json')
+            info.size = len(manifest_bytes)
+            archive.addfile(info, io.BytesIO(manifest_bytes))
+
+    with open(os.path.join(dest, name + '.manifest.json'), 'wb') as manifest_file:
+        manifest_file.write(manifest_bytes)
+
+    logger.info("snapshot_created archive=%s files=%d missing=%d", archive_path, len(files), len(missing))
+    return archive_path, manifest
+
+
+def read_manifest(archive):
+    return json.load(archive.extractfile('manifest.json'))
+
+
+def verify_snapshot(archive_path):
+    """
+    Check the database and every file in the manifest against their recorded hashes, following
+    incremental snapshots back to the archives that hold unchanged files.
+    """
+    dest = os.path.dirname(archive_path)
+    archives = {}
+    try:
+        archive = archives[os.path.basename(archive_path)] = tarfile.open(archive_path, 'r:gz')
+        manifest = read_manifest(archive)
+
+        if file_sha256(archive.extractfile('storage.db')) != manifest['db_sha256']:
+            raise ValueError("Database in the snapshot does not match its checksum.")
+
+        for path, entry in manifest['files'].items():
+            holder = archives.get(entry['archive'])
+            if holder is None:
+                holder = archives[entry['archive']] = tarfile.open(os.path.join(dest, entry['archive']), 'r:gz')
+            if file_sha256(holder.extractfile('files/' + path)) != entry['sha256']:
+                raise ValueError(f"{path} does not match its checksum.")
+
+        return manifest, archives
+    except Exception:
+        for open_archive in archives.values():
+            open_archive.close()
+        raise
+
+
+def get_sync_state(db_path):
+    """
+    Latest change log sequence number and global page version of a database, or zeros if it has neither.
+    """
+    if not os.path.exists(db_path):
+        return 0, 0
+    connection = sqlite3.connect(db_path)
+    try:
+        tables = {name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table';")}
+        latest_seq = get_latest_seq(connection.cursor()) if 'change_log_horizon' in tables else 0
+        row = None
+        if 'box_versions' in tables:
+            row = connection.execute('SELECT VERSION FROM box_versions WHERE BOX = ?;',
+                                     (GLOBAL_VERSION_ROW,)).fetchone()
+        return latest_seq, row[0] if row else 0
+    finally:
+        connection.close()
+
+
+def advance_sync_state(db_path, latest_seq, page_version):
+    """
+    Move the restored database's change log and page version past those of the database it replaced, so every
+    sync client downloads everything again and no ETag handed out before the restore matches a page after it.
+    Returns the new change log horizon.
+    """
+    connection = sqlite3.connect(db_path)
+    try:
+        # A snapshot from before these tables existed gets them now rather than on the next start
+        setup_box_versions(connection)
+        setup_change_log(connection)
+        restored_seq, restored_version = get_sync_state(db_path)
+
+        horizon = max(latest_seq, restored_seq) + 1
+        connection.execute('DELETE FROM change_log;')
+        connection.execute('UPDATE change_log_horizon SET SEQ = ? WHERE ID = 1;', (horizon,))
+        # New entries are numbered after the horizon
+        cursor = connection.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'change_log';", (horizon,))
+        if cursor.rowcount == 0:
+            connection.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', ?);", (horizon,))
+
+        connection.execute('''INSERT INTO box_versions (BOX, VERSION) VALUES (?, ?)
+                                ON CONFLICT(BOX) DO UPDATE SET VERSION = excluded.VERSION;''',
+                           (GLOBAL_VERSION_ROW, max(page_version, restored_version) + 1))
+        connection.commit()
+    finally:
+        connection.close()
+    return horizon
+
+
+def restore_snapshot(archive_path, db_path=DB_PATH, base_dir='.'):
+    """
+    Verify a snapshot, then restore its files and copy its database over `db_path` with the backup API.
+    The change log and page version continue from the replaced database, so sync clients start over instead of
+    skipping changes. A running app keeps serving its in-memory indexes of the old rows: restart it afterwards.
+    """
+    latest_seq, page_version = get_sync_state(db_path)
+    manifest, archives = verify_snapshot(archive_path)
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            snapshot_db = os.path.join(work_dir, 'storage.db')
+            with open(snapshot_db, 'wb') as db_file:
+                db_file.write(archives[os.path.basename(archive_path)].extractfile('storage.db').read())
+            check_database(snapshot_db)
+
+            for path, entry in manifest['files'].items():
+                target_path = os.path.join(base_dir, path)
+                os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+                with open(target_path, 'wb') as target_file:
+                    target_file.write(archives[entry['archive']].extractfile('files/' + path).read())
+
+            copy_database(snapshot_db, db_path)
+    finally:
+        for archive in archives.values():
+            archive.close()
+
+    horizon = advance_sync_state(db_path, latest_seq, page_version)
+    check_database(db_path)
+    logger.info("snapshot_restored archive=%s files=%d change_horizon=%d", archive_path, len(manifest['files']),
+                horizon)
+    return manifest
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s level=%(levelname)s logger=%(name)s %(message)s")
+
+    parser = argparse.ArgumentParser(description="Online snapshots of the inventory database and its files.")
+    parser.add_argument("--site", default=DEFAULT_SITE)
+    parser.add_argument("--db", help="database to use instead of the site's own")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="take a consistent snapshot of the live database")
+    snapshot_parser.add_argument("--dest")
+    snapshot_parser.add_argument("--incremental", action="store_true",
+                                 help="only store files that changed since the last snapshot")
+
+    restore_parser = subparsers.add_parser("restore", help="verify a snapshot and restore it")
+    restore_parser.add_argument("archive")
+
+    verify_parser = subparsers.add_parser("verify", help="check a snapshot against its checksums")
+    verify_parser.add_argument("archive")
+
+    args = parser.parse_args()
+    db_path = args.db or get_db_path(args.site)
+
+    if args.command == "snapshot":
+        dest = args.dest or get_file_directory(BACKUP_DIRECTORY, args.site)
+        archive_path, manifest = take_snapshot(db_path, dest, args.incremental)
+        print(f"Snapshot saved to {archive_path}")
+    elif args.command == "restore":
+        restore_snapshot(args.archive, db_path)
+        print(f"Restored {args.archive} to {db_path}; restart the app if it is running")
+    else:
+        manifest, archives = verify_snapshot(args.archive)
+        for archive in archives.values():
+            archive.close()
+        print(f"{args.archive} is intact ({len(manifest['files'])} files)")
@@ -0,0 +1,154 @@
+from prefixIndex import rebuild_prefix_index, add_name, remove_name, complete
+from sites import get_site_cache
+
+# In-memory index of the storage table used by the barcode scanner fast path.
+# Rows are kept exactly as `SELECT * FROM storage` returns them so the scan
+# handler can render them without touching the database.
+# The autocomplete prefix index is maintained alongside it. Each site has its own index.
+
+
+class ScanIndex:
+    def __init__(self):
+        self.rows_by_find = {}
+        self.finds_by_name = {}
+        # Position of LAST_SCANNED_AT in the rows, which depends on the order the columns were added in
+        self.last_scanned_column = None
+        self.loaded = False
+
+
+def get_index():
+    return get_site_cache('barcode_index', ScanIndex)
+
+
+def load_barcode_index(connection):
+    index = get_index()
+    rows_by_find = index.rows_by_find
+    finds_by_name = index.finds_by_name
+    cursor = connection.cursor()
+
+    rows_by_find.clear()
+    finds_by_name.clear()
+    cursor.execute('SELECT * FROM storage;')
+    columns = [description[0] for description in cursor.description]
+    index.last_scanned_column = columns.index('LAST_SCANNED_AT') if 'LAST_SCANNED_AT' in columns else None
+    for row in cursor.fetchall():
+        rows_by_find[row[0]] = row
+        finds_by_name.setdefault(row[1], set()).add(row[0])
+    rebuild_prefix_index((find, row[1]) for find, row in rows_by_find.items())
+
+    index.loaded = True
+    return len(rows_by_find)
+
+
+def put_row(row):
+    index = get_index()
+    old_row = index.rows_by_find.get(row[0])
+    if old_row is not None and old_row[1] == row[1]:
+        # Same name, so the name lookups do not change
+        index.rows_by_find[row[0]] = row
+        return
+
+    # Drop the old name entry first in case the row was renamed
+    remove_row(row[0])
+    index.rows_by_find[row[0]] = row
+    index.finds_by_name.setdefault(row[1], set()).add(row[0])
+    add_name(row[0], row[1])
+
+
+def remove_row(find):
+    index = get_index()
+    old_row = index.rows_by_find.pop(find, None)
+    if old_row is None:
+        return
+
+    remove_name(find, old_row[1])
+
+    finds = index.finds_by_name.get(old_row[1])
+    if finds is not None:
+        finds.discard(find)
+        if not finds:
+            del index.finds_by_name[old_row[1]]
+
+
+def refresh_row(connection, find):
+    """
+    Re-read a single row after it was inserted or updated so the index stays coherent.
+    """
+    cursor = connection.cursor()
+    cursor.execute('SELECT * FROM storage WHERE FIND = ?', (find,))
+    row = cursor.fetchone()
+
+    if row is None:
+        remove_row(find)
+    else:
+        put_row(row)
+
+
+def reparent_children(old_parent, new_parent):
+    # Mirrors `UPDATE storage SET PARENT = new WHERE PARENT = old`; PARENT is a TEXT column
+    rows_by_find = get_index().rows_by_find
+    old_parent = str(old_parent)
+    for find, row in list(rows_by_find.items()):
+        if row[9] == old_parent:
+            rows_by_find[find] = row[:9] + (str(new_parent),) + row[10:]
+
+
+def mark_rows_scanned(finds, scanned_at):
+    # Mirrors itemTimestamps.mark_scanned() for the rows in memory, so a scan does not have to re-read them
+    index = get_index()
+    column = index.last_scanned_column
+    if column is None:
+        return
+    for find in finds:
+        row = index.rows_by_find.get(find)
+        if row is not None and (row[column] or 0) < scanned_at:
+            index.rows_by_find[find] = row[:column] + (scanned_at,) + row[column + 1:]
+
+
+def refresh_rows(connection, finds):
+    # Re-read a known set of rows, e.g. after flattening a box, a chunk of FIND values per query
+    finds = list(finds)
+    cursor = connection.cursor()
+    for start in range(0, len(finds), 500):
+        chunk = finds[start:start + 500]
+        cursor.execute(f'SELECT * FROM storage WHERE FIND IN ({", ".join("?" * len(chunk))});', chunk)
+        for row in cursor.fetchall():
+            put_row(row)
+
+
+def lookup_scan(connection, item_id, stripped_item_id):
+    """
+    Same result as `SELECT * FROM storage WHERE FIND = ? OR NAME = ?` for a numeric scan,
+    answered from memory. Falls back to the database when nothing is found in the index.
+    """
+    index = get_index()
+    if not index.loaded:
+        load_barcode_index(connection)
+
+    results = []
+    row = index.rows_by_find.get(int(stripped_item_id))
+    if row is not None:
+        results.append(row)
+
+    for find in index.finds_by_name.get(item_id, ()):
+        if row is None or find != row[0]:
+            results.append(index.rows_by_find[find])
+
+    if results:
+        return results
+
+    # Miss: the row may have been written by another process, so ask the database
+    cursor = connection.cursor()
+    cursor.execute('SELECT * FROM storage WHERE FIND = ? OR NAME = ?', (stripped_item_id, item_id))
+    results = cursor.fetchall()
+    for row in results:
+        put_row(row)
+
+    return results
+
+
+
+def complete_names(prefix, limit=8):
+    # Rows whose name has a word starting with `prefix`, for search-as-you-type
+    rows_by_find = get_index().rows_by_find
+    return [rows_by_find[find] for find in complete(prefix, limit)]
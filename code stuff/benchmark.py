@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime
+
+from benchmarkScan import percentile
+from syntheticInventory import generate_inventory, get_find
+
+# End-to-end benchmark: builds a synthetic inventory, drives the app in-process with a test client and
+# reports latency percentiles, SQL statements per request and allocated memory for each endpoint.
+# Usage: python benchmark.py --rows 10000 --depth 8 --requests 200 --output benchmark-results.json
+
+# SQL statements executed since the counter was last reset
+query_count = 0
+
+
+def install_stub_backends():
+    """
+    Replace the label printer and the barcode image writer so the benchmark only measures the app itself.
+    Must run before app.py is imported.
+    """
+    print_barcode = types.ModuleType("printBarcode")
+    print_barcode.print_label = lambda image_path, printer_name=None: None
+    sys.modules["printBarcode"] = print_barcode
+
+    generate_barcode = types.ModuleType("generateBarcode")
+
+    def get_barcodes(unique_id, barcode_dir="static/barcodes"):
+        full_code = str(get_find(unique_id)).zfill(13)
+        return f"{barcode_dir}/{full_code}.png", full_code
+
+    generate_barcode.get_barcodes = get_barcodes
+    sys.modules["generateBarcode"] = generate_barcode
+
+
+def install_query_counter():
+    # Count every statement run on connections the app opens
+    original_connect = sqlite3.connect
+
+    def count_query(statement):
+        global query_count
+        query_count += 1
+
+    def traced_connect(*args, **kwargs):
+        connection = original_connect(*args, **kwargs)
+        connection.set_trace_callback(count_query)
+        return connection
+
+    sqlite3.connect = traced_connect
+
+
+def get_endpoints(inventory, rng):
+    boxes = inventory['boxes']
+    items = inventory['items']
+    names = inventory['names']
+
+    # name, method, function returning (path, form data), share of the request budget
+    return [
+        ("homepage root", "GET", lambda: ("/", None), 1.0),
+        ("homepage box", "GET", lambda: (f"/?box_id={rng.choice(boxes)}", None), 1.0),
+        ("search barcode", "GET", lambda: (f"/search/{str(rng.choice(items)).zfill(13)}", None), 1.0),
+        ("search name", "GET", lambda: (f"/search/{rng.choice(names).split()[0]}", None), 0.25),
+        ("modify form", "GET", lambda: (f"/modify/{rng.choice(items)}", None), 1.0),
+        ("add item", "POST", lambda: ("/add/ITEM", {
+            'name': rng.choice(names), 'description': "benchmark", 'weight': 1,
+            'parent': str(rng.choice(boxes)), 'cost': "1.00"}), 0.5),
+        ("display all", "GET", lambda: ("/display-all", None), 0.05),
+    ]
+
+
+def send(client, method, path, data):
+    if method == "GET":
+        return client.get(path, follow_redirects=False)
+    return client.post(path, data=data, follow_redirects=False)
+
+
+def measure_endpoint(client, method, make_request, request_count, memory_samples):
+    global query_count
+
+    # Warm up caches and compiled templates before timing
+    send(client, method, *make_request())
+
+    times_ms = []
+    queries = []
+    for _ in range(request_count):
+        path, data = make_request()
+        query_count = 0
+        start = time.perf_counter()
+        response = send(client, method, path, data)
+        times_ms.append((time.perf_counter() - start) * 1000)
+        queries.append(query_count)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}")
+
+    # Memory is sampled separately because tracemalloc slows every allocation down
+    peaks_kb = []
+    for _ in range(memory_samples):
+        path, data = make_request()
+        tracemalloc.start()
+        send(client, method, path, data)
+        peaks_kb.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+
+    times_ms.sort()
+    return {
+        'requests': request_count,
+        'mean_ms': round(sum(times_ms) / len(times_ms), 3),
+        'p50_ms': round(percentile(times_ms, 0.50), 3),
+        'p90_ms': round(percentile(times_ms, 0.90), 3),
+        'p99_ms': round(percentile(times_ms, 0.99), 3),
+        'max_ms': round(times_ms[-1], 3),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+        'peak_memory_kb': round(max(peaks_kb), 1) if peaks_kb else None,
+    }
+
+
+def run_benchmark(row_count, depth, request_count, memory_samples, seed):
+    install_stub_backends()
+    install_query_counter()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    connection = sqlite3.connect(db_path)
+    start = time.perf_counter()
+    inventory = generate_inventory(connection, row_count, depth, seed=seed)
+    connection.close()
+    print(f"Generated {row_count} rows ({len(inventory['boxes'])} boxes, depth {depth}) "
+          f"in {time.perf_counter() - start:.1f} s")
+
+    import app
+    import sites
+    from fastapi.testclient import TestClient
+
+    sites.SITES[sites.DEFAULT_SITE] = db_path
+    app.is_printer_connected = lambda printer_name: True
+
+    rng = random.Random(seed)
+    results = {}
+    with TestClient(app.app) as client:
+        for name, method, make_request, share in get_endpoints(inventory, rng):
+            endpoint_requests = max(1, int(request_count * share))
+            results[name] = measure_endpoint(client, method, make_request, endpoint_requests, memory_samples)
+            print(f"{name:15} p50 {results[name]['p50_ms']:9.2f} ms  p99 {results[name]['p99_ms']:9.2f} ms  "
+                  f"queries {results[name]['queries_per_request']:6.1f}  "
+                  f"peak {results[name]['peak_memory_kb']} KB")
+
+    os.remove(db_path)
+    return {
+        'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'rows': row_count,
+        'depth': depth,
+        'seed': seed,
+        'endpoints': results,
+    }
+
+
+def compare_results(baseline, results):
+    print("\nChange in p50 against the baseline:")
+    for name, endpoint in results['endpoints'].items():
+        old = baseline.get('endpoints', {}).get(name)
+        if old and old['p50_ms']:
+            print(f"{name:15} {old['p50_ms']:9.2f} ms -> {endpoint['p50_ms']:9.2f} ms "
+                  f"({endpoint['p50_ms'] / old['p50_ms']:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the app against a synthetic inventory.")
+    parser.add_argument("--rows", type=int, default=10000, help="number of rows to generate (1k to 1M)")
+    parser.add_argument("--depth", type=int, default=6, help="box nesting depth")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--memory-samples", type=int, default=3, help="requests traced for memory per endpoint")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark-results.json", help="where to save the JSON results")
+    parser.add_argument("--baseline", help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    # The app serves templates and static files relative to its own directory
+    output_path = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    results = run_benchmark(args.rows, args.depth, args.requests, args.memory_samples, args.seed)
+
+    with open(output_path, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results saved to {output_path}")
+
+    if baseline_path:
+        with open(baseline_path) as baseline_file:
+            compare_results(json.load(baseline_file), results)
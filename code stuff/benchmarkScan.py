@@ -0,0 +1,68 @@
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from barcodeIndex import load_barcode_index, lookup_scan
+from syntheticInventory import generate_inventory
+
+# Replays random barcode scans against the in-memory index and the old SQL query.
+# Usage: python benchmarkScan.py [row_count] [scan_count]
+
+
+def percentile(sorted_times, fraction):
+    return sorted_times[min(len(sorted_times) - 1, int(len(sorted_times) * fraction))]
+
+
+def report(label, times_ns):
+    times_ns.sort()
+    print(f"{label}: {len(times_ns)} scans, "
+          f"mean {sum(times_ns) / len(times_ns) / 1000:.2f} us, "
+          f"p50 {percentile(times_ns, 0.50) / 1000:.2f} us, "
+          f"p99 {percentile(times_ns, 0.99) / 1000:.2f} us, "
+          f"max {times_ns[-1] / 1000:.2f} us")
+
+
+def run_benchmark(row_count=100000, scan_count=1000000):
+    db_file = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    connection = sqlite3.connect(db_file)
+    inventory = generate_inventory(connection, row_count)
+    finds = inventory['boxes'] + inventory['items']
+
+    start = time.perf_counter()
+    load_barcode_index(connection)
+    print(f"Index loaded: {row_count} rows in {time.perf_counter() - start:.3f} s")
+
+    # Scans arrive as zero-padded 13 digit barcodes; a few are unknown codes
+    scans = []
+    for _ in range(scan_count):
+        find = random.choice(finds) if random.random() < 0.99 else random.randint(1, row_count * 10)
+        scans.append(str(find).zfill(13))
+
+    index_times = []
+    for scan in scans:
+        start = time.perf_counter_ns()
+        lookup_scan(connection, scan, scan.lstrip('0'))
+        index_times.append(time.perf_counter_ns() - start)
+    report("In-memory index", index_times)
+
+    # The SQL query is much slower, so only a sample is replayed against it
+    cursor = connection.cursor()
+    sql_times = []
+    for scan in scans[:min(scan_count, 10000)]:
+        start = time.perf_counter_ns()
+        cursor.execute('SELECT * FROM storage WHERE FIND = ? OR NAME = ?', (scan.lstrip('0'), scan))
+        cursor.fetchall()
+        sql_times.append(time.perf_counter_ns() - start)
+    report("SQL FIND/NAME query", sql_times)
+
+    connection.close()
+    os.remove(db_file)
+
+
+if __name__ == "__main__":
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    scan_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+    run_benchmark(row_count, scan_count)
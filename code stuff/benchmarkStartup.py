@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Measures cold start of the app module with `python -X importtime`.
+# Usage: python benchmarkStartup.py --runs 5 --output startup-results.json [--baseline earlier.json]
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output into {module: (self_us, cumulative_us)}.
+    Lines look like: `import time:       123 |        456 |   package.module`
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        modules[module.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure_import(module_name="app"):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+                            cwd=APP_DIR, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module_name} failed:\n{result.stderr[-2000:]}")
+
+    modules = parse_importtime(result.stderr)
+    return wall_ms, modules
+
+
+def run_benchmark(runs, top):
+    wall_times = []
+    import_totals = []
+    modules = {}
+    for _ in range(runs):
+        wall_ms, modules = measure_import()
+        wall_times.append(wall_ms)
+        import_totals.append(sum(self_us for self_us, _ in modules.values()) / 1000)
+
+    # Slowest modules by cumulative time, from the last run
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:top]
+
+    return {
+        'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'runs': runs,
+        'wall_ms_min': round(min(wall_times), 1),
+        'wall_ms_median': round(sorted(wall_times)[len(wall_times) // 2], 1),
+        'import_ms_min': round(min(import_totals), 1),
+        'import_ms_median': round(sorted(import_totals)[len(import_totals) // 2], 1),
+        'module_count': len(modules),
+        'slowest_modules': [{'module': name, 'self_ms': self_us / 1000, 'cumulative_ms': cumulative_us / 1000}
+                            for name, (self_us, cumulative_us) in slowest],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how long importing app.py takes.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="number of slowest modules to report")
+    parser.add_argument("--output", default="startup-results.json")
+    parser.add_argument("--baseline", help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.runs, args.top)
+
+    print(f"Import total: {results['import_ms_median']} ms median ({results['module_count']} modules), "
+          f"process wall time {results['wall_ms_median']} ms median")
+    for module in results['slowest_modules']:
+        print(f"  {module['cumulative_ms']:9.1f} ms  {module['module']}")
+
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"Import total: {baseline['import_ms_median']} ms -> {results['import_ms_median']} ms "
+              f"({results['import_ms_median'] / baseline['import_ms_median']:.2f}x)")
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+from changeFeed import CONTENT_COLUMNS
+from sites import current_site
+
+# Rendered box views, keyed by ETag, most recently used last. The ETag starts with the site id, since every site
+# numbers its boxes from 1.
+BOX_CACHE_SIZE = 256
+rendered_boxes = OrderedDict()
+
+# Row 0 of `box_versions` is a global counter for changes that affect every page (box/item counts)
+GLOBAL_VERSION_ROW = 0
+
+
+def setup_box_versions(connection):
+    """
+    Create the per-box version table and the triggers that bump it.
+    A box's version changes whenever a child is added, modified, moved or deleted, or the box itself is edited.
+    """
+    cursor = connection.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS box_versions (
+                        BOX INTEGER PRIMARY KEY NOT NULL,
+                        VERSION INTEGER NOT NULL
+                    );''')
+
+    # A cache miss still has to list the children of the box
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_storage_parent ON storage (PARENT);')
+
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS box_versions_insert AFTER INSERT ON storage
+        BEGIN
+            INSERT INTO box_versions (BOX, VERSION) SELECT NEW.PARENT, 1 WHERE NEW.PARENT IS NOT NULL
+                ON CONFLICT(BOX) DO UPDATE SET VERSION = VERSION + 1;
+            INSERT INTO box_versions (BOX, VERSION) VALUES (0, 1)
+                ON CONFLICT(BOX) DO UPDATE SET VERSION = VERSION + 1;
+        END;''')
+
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS box_versions_update AFTER UPDATE OF {CONTENT_COLUMNS} ON storage
+        BEGIN
+            INSERT INTO box_versions (BOX, VERSION) SELECT NEW.FIND, 1 WHERE true
+                ON CONFLICT(BOX) DO UPDATE SET VERSION = VERSION + 1;
+            INSERT INTO box_versions (BOX, VERSION) SELECT OLD.PARENT, 1 WHERE OLD.PARENT IS NOT NULL
+                ON CONFLICT(BOX) DO UPDATE SET VERSION = VERSION + 1;
+            INSERT INTO box_versions (BOX, VERSION) SELECT NEW.PARENT, 1
+                WHERE NEW.PARENT IS NOT NULL AND NEW.PARENT IS NOT OLD.PARENT
+                ON CONFLICT(BOX) DO UPDATE SET VERSION = VERSION + 1;
+            INSERT INTO box_versions (BOX, VERSION) SELECT 0, 1 WHERE NEW.TYPE IS NOT OLD.TYPE
+                ON CONFLICT(BOX) DO UPDATE SET VERSION = VERSION + 1;
+        END;''')
+
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS box_versions_delete AFTER DELETE ON storage
+        BEGIN
+            INSERT INTO box_versions (BOX, VERSION) SELECT OLD.PARENT, 1 WHERE OLD.PARENT IS NOT NULL
+                ON CONFLICT(BOX) DO UPDATE SET VERSION = VERSION + 1;
+            INSERT INTO box_versions (BOX, VERSION) SELECT OLD.FIND, 1 WHERE true
+                ON CONFLICT(BOX) DO UPDATE SET VERSION = VERSION + 1;
+            INSERT INTO box_versions (BOX, VERSION) VALUES (0, 1)
+                ON CONFLICT(BOX) DO UPDATE SET VERSION = VERSION + 1;
+        END;''')
+
+    connection.commit()
+
+
+def get_box_etag(cursor, box_id, *extra):
+    # One primary key lookup fetches both the box version and the global version
+    cursor.execute('SELECT BOX, VERSION FROM box_versions WHERE BOX IN (?, ?);', (box_id, GLOBAL_VERSION_ROW))
+    versions = dict(cursor.fetchall())
+
+    parts = [current_site.get(), box_id, versions.get(box_id, 0), versions.get(GLOBAL_VERSION_ROW, 0)] + list(extra)
+    return 'W/"' + '-'.join(str(part) for part in parts) + '"'
+
+
+def get_cached_box(etag):
+    body = rendered_boxes.get(etag)
+    if body is not None:
+        rendered_boxes.move_to_end(etag)
+    return body
+
+
+def cache_box(etag, body):
+    rendered_boxes[etag] = body
+    rendered_boxes.move_to_end(etag)
+    while len(rendered_boxes) > BOX_CACHE_SIZE:
+        rendered_boxes.popitem(last=False)
@@ -0,0 +1,133 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Monotonic log of changes to `storage`, written by triggers so every writer is covered.
+# Clients sync with /changes?since=<seq>: every entry after `since` is the latest change to one row, so anything
+# other than a DELETE should be treated as an upsert of the row sent with it. A new client, or one that fell behind
+# the horizon, starts from /changes/snapshot and continues from the sequence number it returns.
+
+# DELETE entries older than this are dropped; clients that last synced before them must re-download everything
+CHANGE_LOG_RETENTION_DAYS = 30
+
+STORAGE_COLUMNS = ('id', 'name', 'type', 'description', 'weight', 'barcode_num', 'barcode_path', 'date_created',
+                   'date_modified', 'parent', 'images', 'cost', 'created_at', 'modified_at', 'last_scanned_at')
+
+# Every column except LAST_SCANNED_AT. A scan only records when a row was last seen, so update triggers are limited
+# to these columns: scans add nothing to the change log and leave box versions alone.
+CONTENT_COLUMNS = ('FIND, NAME, TYPE, DESCRIPTION, WEIGHT, BARCODE_NUMBER, BARCODE_IMG_PATH, DATE_CREATED, '
+                   'DATE_MODIFIED, PARENT, IMG_PATH, COST, CREATED_AT, MODIFIED_AT')
+
+
+def setup_change_log(connection):
+    cursor = connection.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS change_log (
+                        SEQ INTEGER PRIMARY KEY AUTOINCREMENT,
+                        FIND INTEGER NOT NULL,
+                        OPERATION TEXT NOT NULL,
+                        CHANGED_AT TEXT NOT NULL DEFAULT (datetime('now'))
+                    );''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_find ON change_log (FIND);')
+
+    # Oldest sequence number a client can still sync from
+    cursor.execute('''CREATE TABLE IF NOT EXISTS change_log_horizon (
+                        ID INTEGER PRIMARY KEY CHECK (ID = 1),
+                        SEQ INTEGER NOT NULL
+                    );''')
+    cursor.execute('INSERT OR IGNORE INTO change_log_horizon (ID, SEQ) VALUES (1, 0);')
+
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS change_log_insert AFTER INSERT ON storage
+        BEGIN
+            INSERT INTO change_log (FIND, OPERATION) VALUES (NEW.FIND, 'INSERT');
+        END;''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS change_log_move AFTER UPDATE ON storage
+        WHEN NEW.PARENT IS NOT OLD.PARENT
+        BEGIN
+            INSERT INTO change_log (FIND, OPERATION) VALUES (NEW.FIND, 'MOVE');
+        END;''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS change_log_update AFTER UPDATE OF {CONTENT_COLUMNS} ON storage
+        WHEN NEW.PARENT IS OLD.PARENT
+        BEGIN
+            INSERT INTO change_log (FIND, OPERATION) VALUES (NEW.FIND, 'UPDATE');
+        END;''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS change_log_delete AFTER DELETE ON storage
+        BEGIN
+            INSERT INTO change_log (FIND, OPERATION) VALUES (OLD.FIND, 'DELETE');
+        END;''')
+
+    connection.commit()
+
+
+def get_change_horizon(cursor):
+    cursor.execute('SELECT SEQ FROM change_log_horizon WHERE ID = 1;')
+    return cursor.fetchone()[0]
+
+
+def get_latest_seq(cursor):
+    cursor.execute('SELECT MAX(SEQ) FROM change_log;')
+    latest = cursor.fetchone()[0]
+    return latest if latest is not None else get_change_horizon(cursor)
+
+
+def get_changes(cursor, since, limit):
+    """
+    Yield the latest change for each row changed after `since`, in sequence order, with the row's current data.
+    """
+    cursor.execute('''
+        SELECT change_log.SEQ, change_log.OPERATION, change_log.FIND, storage.*
+        FROM change_log
+        LEFT JOIN storage ON storage.FIND = change_log.FIND AND change_log.OPERATION != 'DELETE'
+        WHERE change_log.SEQ > ?
+            AND change_log.SEQ = (SELECT MAX(latest.SEQ) FROM change_log AS latest WHERE latest.FIND = change_log.FIND)
+        ORDER BY change_log.SEQ
+        LIMIT ?;
+    ''', (since, limit))
+
+    for row in cursor:
+        item = dict(zip(STORAGE_COLUMNS, row[3:])) if row[3] is not None else None
+        yield {'seq': row[0], 'op': row[1], 'find': row[2], 'item': item}
+
+
+def get_snapshot(cursor):
+    """
+    Every current row as an upsert, in the same form as get_changes(), with the sequence number the rows are
+    current as of. Both are read in one transaction, so a client that continues from that number misses nothing.
+    """
+    cursor.execute('BEGIN;')
+    try:
+        latest_seq = get_latest_seq(cursor)
+        cursor.execute('SELECT * FROM storage ORDER BY FIND;')
+        rows = cursor.fetchall()
+    finally:
+        cursor.execute('COMMIT;')
+    return latest_seq, [{'seq': latest_seq, 'op': 'INSERT', 'find': row[0], 'item': dict(zip(STORAGE_COLUMNS, row))}
+                        for row in rows]
+
+
+def compact_change_log(connection, retention_days=CHANGE_LOG_RETENTION_DAYS):
+    """
+    Drop entries superseded by a later change to the same row (clients never need them), then drop DELETE
+    entries older than the retention period and move the sync horizon past them.
+    """
+    cursor = connection.cursor()
+    cursor.execute('''
+        DELETE FROM change_log
+        WHERE SEQ < (SELECT MAX(latest.SEQ) FROM change_log AS latest WHERE latest.FIND = change_log.FIND);
+    ''')
+    superseded = cursor.rowcount
+
+    cursor.execute('''
+        SELECT MAX(SEQ), COUNT(*) FROM change_log
+        WHERE OPERATION = 'DELETE' AND CHANGED_AT < datetime('now', ?);
+    ''', (f'-{retention_days} days',))
+    horizon, expired = cursor.fetchone()
+
+    if expired:
+        cursor.execute('''
+            DELETE FROM change_log WHERE OPERATION = 'DELETE' AND SEQ <= ?;
+        ''', (horizon,))
+        cursor.execute('UPDATE change_log_horizon SET SEQ = MAX(SEQ, ?) WHERE ID = 1;', (horizon,))
+
+    connection.commit()
+    logger.info("change_log_compacted superseded=%d expired=%d", superseded, expired)
+    return superseded, expired
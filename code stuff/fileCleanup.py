@@ -0,0 +1,55 @@
+import json
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Files left behind by deleted rows are removed by a background thread so the request does not wait on disk I/O
+cleanup_queue = queue.Queue()
+cleanup_thread = None
+cleanup_lock = threading.Lock()
+
+
+def normalize_file_path(path):
+    # Barcode paths written on Windows use backslashes
+    return os.path.normpath(path.replace('\\', '/'))
+
+
+def get_referenced_files(cursor):
+    # Every barcode and photo path used by a row, normalized
+    cursor.execute('SELECT BARCODE_IMG_PATH, IMG_PATH FROM storage;')
+    paths = set()
+    for barcode_path, img_path_json in cursor.fetchall():
+        if barcode_path:
+            paths.add(normalize_file_path(barcode_path))
+        if img_path_json:
+            paths.update(normalize_file_path(path) for path in json.loads(img_path_json))
+    return sorted(paths)
+
+
+def cleanup_worker():
+    while True:
+        path = cleanup_queue.get()
+        try:
+            if os.path.isfile(path):
+                os.remove(path)
+        except OSError as e:
+            logger.warning("file_cleanup_failed path=%r error=%s", path, e)
+        finally:
+            cleanup_queue.task_done()
+
+
+def queue_file_cleanup(paths):
+    global cleanup_thread
+
+    # Start the worker on first use
+    with cleanup_lock:
+        if cleanup_thread is None:
+            cleanup_thread = threading.Thread(target=cleanup_worker, name="file-cleanup", daemon=True)
+            cleanup_thread.start()
+
+    for path in paths:
+        if path:
+            cleanup_queue.put(normalize_file_path(path))
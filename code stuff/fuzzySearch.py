@@ -0,0 +1,189 @@
+import re
+from collections import Counter
+
+from changeFeed import get_change_horizon, get_latest_seq, get_changes
+from sites import get_site_cache
+
+# Typo-tolerant search over NAME and DESCRIPTION, in two steps:
+# 1. Each query word is matched against the vocabulary (every distinct word used in a name or description) by
+#    trigram similarity, as pg_trgm does it, so "screwdirver" becomes "screwdriver".
+# 2. Rows containing the corrected words are found through an FTS5 table with the trigram tokenizer, which
+#    triggers keep in step with `storage`. The best CANDIDATE_LIMIT of them by bm25 are scored against the
+#    original query, so a common corrected word cannot crowd out the closest rows.
+# Matching the query itself with bm25 instead would score every row sharing a trigram with the query, which is
+# hundreds of thousands of rows when many items share a name.
+
+# Rows taken from the FTS index before scoring
+CANDIDATE_LIMIT = 200
+# Vocabulary words tried for each query word
+CORRECTIONS_PER_WORD = 5
+# Minimum similarity for a vocabulary word to replace a query word, and for a row to count as a match
+MIN_WORD_SCORE = 0.4
+MIN_SCORE = 0.4
+# A match in the description scores a little lower than the same match in the name
+DESCRIPTION_WEIGHT = 0.8
+# The FTS5 trigram tokenizer cannot look up anything shorter than one trigram
+MIN_LOOKUP_LENGTH = 3
+
+
+class Vocabulary:
+    # word -> its trigrams, and trigram -> words containing it. Words are only ever added: a word that is no
+    # longer used just finds no rows in step 2.
+    def __init__(self):
+        self.word_trigrams = {}
+        self.words_by_trigram = {}
+        self.version = None
+
+
+def get_vocabulary():
+    return get_site_cache('fuzzy_vocabulary', Vocabulary)
+
+
+def setup_search_index(connection):
+    cursor = connection.cursor()
+    cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS storage_search USING fts5 (
+                        NAME, DESCRIPTION, content='storage', content_rowid='FIND', tokenize='trigram'
+                    );''')
+
+    # External content table: the triggers pass the old values in so FTS5 can remove their trigrams
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS storage_search_insert AFTER INSERT ON storage
+        BEGIN
+            INSERT INTO storage_search (rowid, NAME, DESCRIPTION) VALUES (NEW.FIND, NEW.NAME, NEW.DESCRIPTION);
+        END;''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS storage_search_update AFTER UPDATE OF NAME, DESCRIPTION ON storage
+        BEGIN
+            INSERT INTO storage_search (storage_search, rowid, NAME, DESCRIPTION)
+                VALUES ('delete', OLD.FIND, OLD.NAME, OLD.DESCRIPTION);
+            INSERT INTO storage_search (rowid, NAME, DESCRIPTION) VALUES (NEW.FIND, NEW.NAME, NEW.DESCRIPTION);
+        END;''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS storage_search_delete AFTER DELETE ON storage
+        BEGIN
+            INSERT INTO storage_search (storage_search, rowid, NAME, DESCRIPTION)
+                VALUES ('delete', OLD.FIND, OLD.NAME, OLD.DESCRIPTION);
+        END;''')
+
+    cursor.execute("INSERT INTO storage_search (storage_search) VALUES ('rebuild');")
+    connection.commit()
+
+
+def get_words(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def get_trigrams(word):
+    # Padded the way pg_trgm does it so short words and word starts count too
+    padded = f'  {word} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def add_words(vocabulary, text):
+    for word in get_words(text):
+        if word not in vocabulary.word_trigrams:
+            trigrams = vocabulary.word_trigrams[word] = get_trigrams(word)
+            for trigram in trigrams:
+                vocabulary.words_by_trigram.setdefault(trigram, set()).add(word)
+
+
+def update_vocabulary(connection):
+    """
+    Read the whole table the first time, then only the rows changed since the last update.
+    """
+    vocabulary = get_vocabulary()
+    cursor = connection.cursor()
+    version = get_latest_seq(cursor)
+    if version == vocabulary.version:
+        return vocabulary
+
+    if vocabulary.version is None or vocabulary.version < get_change_horizon(cursor):
+        # Many rows share a name or description, so each distinct text is split only once
+        cursor.execute('SELECT DISTINCT NAME FROM storage UNION SELECT DISTINCT DESCRIPTION FROM storage;')
+        texts = [text for (text,) in cursor.fetchall()]
+    else:
+        texts = []
+        for change in get_changes(cursor, vocabulary.version, version - vocabulary.version):
+            if change['item'] is not None:
+                texts += [change['item']['name'], change['item']['description']]
+
+    for text in texts:
+        add_words(vocabulary, text)
+    vocabulary.version = version
+    return vocabulary
+
+
+def get_similar_words(vocabulary, word):
+    """
+    Vocabulary words closest to `word`, best first, with their similarity.
+    """
+    trigrams = get_trigrams(word)
+    shared = Counter()
+    for trigram in trigrams:
+        shared.update(vocabulary.words_by_trigram.get(trigram, ()))
+
+    scored = []
+    for candidate, count in shared.items():
+        score = count / (len(trigrams) + len(vocabulary.word_trigrams[candidate]) - count)
+        if score >= MIN_WORD_SCORE:
+            scored.append((score, candidate))
+    scored.sort(reverse=True)
+    return scored[:CORRECTIONS_PER_WORD]
+
+
+def similarity(query_words, text):
+    """
+    For each query word, the similarity of the closest word in `text`, averaged over the query words.
+    Word order and the rest of the text do not matter, so "charger ebike" fully matches "Ebike charger".
+    """
+    text_words = [get_trigrams(word) for word in get_words(text)]
+    if not query_words or not text_words:
+        return 0.0
+
+    total = 0.0
+    for query_trigrams in query_words:
+        total += max(len(query_trigrams & trigrams) / len(query_trigrams | trigrams) for trigrams in text_words)
+    return total / len(query_words)
+
+
+def quote(word):
+    return '"' + word.replace('"', '""') + '"'
+
+
+def get_match_expression(vocabulary, query):
+    # Rows must contain a correction of every query word that can be looked up
+    groups = []
+    for word in get_words(query):
+        if len(word) < MIN_LOOKUP_LENGTH:
+            continue
+        corrections = [candidate for _, candidate in get_similar_words(vocabulary, word) if len(candidate) >= MIN_LOOKUP_LENGTH]
+        if corrections:
+            groups.append('(' + ' OR '.join(quote(candidate) for candidate in corrections) + ')')
+    return ' AND '.join(groups)
+
+
+def fuzzy_search(connection, query, limit=20, min_score=MIN_SCORE):
+    """
+    Rows whose NAME or DESCRIPTION is closest to `query`, best first, as `SELECT * FROM storage` rows.
+    """
+    vocabulary = update_vocabulary(connection)
+    match_expression = get_match_expression(vocabulary, query)
+    if not match_expression:
+        return []
+
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT storage.* FROM storage
+        JOIN (
+            SELECT rowid FROM storage_search WHERE storage_search MATCH ? ORDER BY rank LIMIT ?
+        ) AS candidates ON storage.FIND = candidates.rowid;
+    ''', (match_expression, CANDIDATE_LIMIT))
+    candidates = cursor.fetchall()
+
+    query_words = [get_trigrams(word) for word in get_words(query)]
+    scored = []
+    for row in candidates:
+        score = max(similarity(query_words, row[1]), similarity(query_words, row[3]) * DESCRIPTION_WEIGHT)
+        if score >= min_score:
+            # Among equal scores, a name that is exactly the query comes first
+            scored.append((score, row[1].lower() == query.lower(), row))
+
+    scored.sort(key=lambda match: match[:2], reverse=True)
+    return [row for _, _, row in scored[:limit]]
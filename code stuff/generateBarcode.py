@@ -1,15 +1,18 @@
 import barcode
 from barcode.writer import ImageWriter
 import os
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Define the directory to save barcodes
 BARCODE_DIR = 'static/barcodes'
 
-# Ensure the directory exists
-os.makedirs(BARCODE_DIR, exist_ok=True)
 
+def get_barcodes(unique_id, barcode_dir=BARCODE_DIR):
+    # Ensure the directory exists
+    os.makedirs(barcode_dir, exist_ok=True)
 
-def get_barcodes(unique_id):
     # Use the unique identifier to generate a 12-digit barcode content (left-padded with zeros if necessary)
     barcode_content = str(unique_id).zfill(12)
     # print(unique_id)
@@ -23,13 +26,13 @@ def get_barcodes(unique_id):
     full_code = ean.get_fullcode()
 
     # Define the full path where the barcode will be saved
-    filename = os.path.join(BARCODE_DIR, full_code)
+    filename = os.path.join(barcode_dir, full_code)
 
     # Save the barcode as an image file with the full barcode content as the filename
     ean.save(filename)
 
     # Return the path to the saved barcode image and the barcode content
-    print(full_code)
+    logger.debug("barcode_saved code=%s", full_code)
     return f"{filename}.png", full_code
 
 
@@ -0,0 +1,256 @@
+import time
+
+import numpy as np
+
+from changeFeed import get_change_horizon, get_latest_seq, get_changes
+from sites import get_site_cache
+
+# Valuation and weight/age reports computed over a columnar copy of `storage` held in NumPy arrays.
+# The copy and the finished reports are reused until the change log moves past the sequence number they were
+# built at, so repeated reports on an unchanged inventory cost a dict lookup. After a change only the changed
+# rows are read back from the change log; the whole table is read once, on the first report.
+# Each site has its own copy.
+
+AGE_BUCKET_DAYS = (0, 7, 30, 90, 180, 365, 730)
+WEIGHT_BINS = 10
+# Deeper than any real shelf/box nesting; only a cycle in PARENT gets there
+MAX_DEPTH = 1000
+# Past this many changed rows it is faster to read the whole table again
+INCREMENTAL_REFRESH_LIMIT = 50000
+
+
+class ReportState:
+    def __init__(self):
+        self.snapshot = None
+        self.version = None
+        self.report_cache = {}
+
+
+def get_report_state():
+    return get_site_cache('inventory_reports', ReportState)
+
+
+def load_snapshot(connection):
+    """
+    Read the columns the reports need into arrays, one array per column.
+    PARENT, WEIGHT and COST are coerced in SQL: a missing parent becomes -1 and a weight or cost that is not a
+    number becomes NULL (NaN).
+    """
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT FIND,
+               IFNULL(CAST(PARENT AS INTEGER), -1),
+               TYPE = 'BOX',
+               CASE WHEN typeof(WEIGHT) IN ('integer', 'real') THEN WEIGHT END,
+               CASE WHEN typeof(COST) IN ('integer', 'real') THEN COST END,
+               IFNULL(CREATED_AT, 0),
+               IFNULL(MODIFIED_AT, 0)
+        FROM storage
+        ORDER BY FIND;
+    ''')
+    return index_snapshot(rows_to_columns(cursor.fetchall()))
+
+
+def rows_to_columns(rows):
+    columns = list(zip(*rows)) if rows else [()] * 7
+    return {
+        'find': np.array(columns[0], dtype=np.int64),
+        'parent': np.array(columns[1], dtype=np.int64),
+        'is_box': np.array(columns[2], dtype=bool),
+        'weight': np.array(columns[3], dtype=np.float64),
+        'cost': np.array(columns[4], dtype=np.float64),
+        'created_at': np.array(columns[5], dtype=np.int64),
+        'modified_at': np.array(columns[6], dtype=np.int64),
+    }
+
+
+def index_snapshot(data):
+    # Position of each row's parent in the arrays, or -1 for the root and rows whose parent is missing
+    find = data['find']
+    parent = data['parent']
+    parent_index = np.minimum(np.searchsorted(find, parent), len(find) - 1)
+    parent_index = np.where((parent >= 0) & (find[parent_index] == parent), parent_index, -1)
+
+    data['parent_index'] = parent_index
+    data['depth'] = get_depths(parent_index)
+    return data
+
+
+def change_to_row(item):
+    # Same coercion as the SELECT in load_snapshot, for a row sent by the change log
+    parent = item['parent']
+    weight = item['weight']
+    cost = item['cost']
+    return (
+        item['id'],
+        int(parent) if parent not in (None, '') else -1,
+        item['type'] == 'BOX',
+        weight if isinstance(weight, (int, float)) else None,
+        cost if isinstance(cost, (int, float)) else None,
+        item['created_at'] or 0,
+        item['modified_at'] or 0,
+    )
+
+
+def refresh_snapshot(connection, data, since):
+    """
+    Apply the changes logged after `since` to a snapshot. Returns None when there are too many of them, or
+    when the change log no longer reaches back to `since`, and the table has to be read again.
+    """
+    cursor = connection.cursor()
+    if since < get_change_horizon(cursor):
+        return None
+
+    changes = list(get_changes(cursor, since, INCREMENTAL_REFRESH_LIMIT + 1))
+    if len(changes) > INCREMENTAL_REFRESH_LIMIT:
+        return None
+
+    # Drop the old copy of every changed row, then add back the ones that still exist, keeping FIND order
+    changed = rows_to_columns([change_to_row(change['item']) for change in changes if change['item'] is not None])
+    keep = ~np.isin(data['find'], [change['find'] for change in changes])
+    merged = {name: np.concatenate([data[name][keep], changed[name]]) for name in changed}
+    order = np.argsort(merged['find'], kind='stable')
+    return index_snapshot({name: column[order] for name, column in merged.items()})
+
+
+def get_depths(parent_index):
+    # Follow every row's parent pointer one level per pass; a pass is one vectorized step over all rows
+    depth = np.zeros(len(parent_index), dtype=np.int64)
+    current = parent_index.copy()
+    for _ in range(MAX_DEPTH):
+        active = current >= 0
+        if not active.any():
+            break
+        depth[active] += 1
+        current[active] = parent_index[current[active]]
+    else:
+        # Leave rows caught in a cycle out of the subtree sums
+        depth[current >= 0] = -1
+    return depth
+
+
+def get_snapshot(connection):
+    state = get_report_state()
+    version = get_latest_seq(connection.cursor())
+    if state.snapshot is None or version != state.version:
+        refreshed = refresh_snapshot(connection, state.snapshot, state.version) if state.snapshot is not None else None
+        state.snapshot = refreshed if refreshed is not None else load_snapshot(connection)
+        state.version = version
+        state.report_cache.clear()
+    return state.snapshot, version
+
+
+def subtree_totals(data):
+    """
+    Total cost, total weight and item count of every row's subtree (the row itself included), by adding each
+    level into the level above it, deepest level first.
+    """
+    count = len(data['find'])
+    cost = np.nan_to_num(data['cost'])
+    weight = np.nan_to_num(data['weight'])
+    items = (~data['is_box']).astype(np.float64)
+    parent_index = data['parent_index']
+    depth = data['depth']
+
+    for level in range(int(depth.max(initial=0)), 0, -1):
+        at_level = depth == level
+        parents = parent_index[at_level]
+        cost += np.bincount(parents, weights=cost[at_level], minlength=count)
+        weight += np.bincount(parents, weights=weight[at_level], minlength=count)
+        items += np.bincount(parents, weights=items[at_level], minlength=count)
+
+    return cost, weight, items.astype(np.int64)
+
+
+def get_subtree_totals(data):
+    report_cache = get_report_state().report_cache
+    totals = report_cache.get('subtree_totals')
+    if totals is None:
+        totals = report_cache['subtree_totals'] = subtree_totals(data)
+    return totals
+
+
+def top_boxes(data, values, top):
+    # Boxes only, without the root directory, largest first
+    candidates = np.flatnonzero(data['is_box'] & (data['parent_index'] >= 0))
+    if len(candidates) > top:
+        candidates = candidates[np.argpartition(values[candidates], -top)[-top:]]
+    return candidates[np.argsort(values[candidates])[::-1]]
+
+
+def box_entry(data, totals, index):
+    cost, weight, items = totals
+    return {
+        'id': int(data['find'][index]),
+        'value': round(float(cost[index]), 2),
+        'weight': float(weight[index]),
+        'item_count': int(items[index]),
+    }
+
+
+def weight_distribution(data):
+    item_weights = data['weight'][~data['is_box']]
+    item_weights = item_weights[~np.isnan(item_weights)]
+    if not len(item_weights):
+        return {'count': 0, 'bins': [], 'counts': [], 'percentiles': {}}
+
+    counts, edges = np.histogram(item_weights, bins=WEIGHT_BINS)
+    percentiles = np.percentile(item_weights, [50, 90, 99])
+    return {
+        'count': int(len(item_weights)),
+        'bins': [float(edge) for edge in edges],
+        'counts': [int(count) for count in counts],
+        'percentiles': {'p50': float(percentiles[0]), 'p90': float(percentiles[1]), 'p99': float(percentiles[2])},
+    }
+
+
+def age_histogram(data, now):
+    age_days = np.maximum(now - data['created_at'][~data['is_box']], 0) / 86400
+    counts = np.bincount(np.searchsorted(AGE_BUCKET_DAYS, age_days, side='right') - 1,
+                         minlength=len(AGE_BUCKET_DAYS))
+    labels = [f"{low}-{high}d" for low, high in zip(AGE_BUCKET_DAYS, AGE_BUCKET_DAYS[1:])]
+    labels.append(f"{AGE_BUCKET_DAYS[-1]}d+")
+    return dict(zip(labels, (int(count) for count in counts)))
+
+
+def get_inventory_report(connection, top=10):
+    """
+    Valuation, weight and age report for the whole inventory. Cached until the data changes.
+    """
+    data, version = get_snapshot(connection)
+    report_cache = get_report_state().report_cache
+    cached = report_cache.get(('inventory', top))
+    if cached is not None:
+        return cached
+
+    totals = get_subtree_totals(data)
+    cost, weight, _ = totals
+    is_item = ~data['is_box']
+
+    report = {
+        'version': version,
+        'box_count': int(data['is_box'].sum()),
+        'item_count': int(is_item.sum()),
+        'total_value': round(float(np.nansum(data['cost'])), 2),
+        'total_weight': float(np.nansum(data['weight'])),
+        'items_without_cost': int(np.isnan(data['cost'][is_item]).sum()),
+        'most_valuable_boxes': [box_entry(data, totals, index) for index in top_boxes(data, cost, top)],
+        'heaviest_boxes': [box_entry(data, totals, index) for index in top_boxes(data, weight, top)],
+        'weight_distribution': weight_distribution(data),
+        'item_age_days': age_histogram(data, int(time.time())),
+    }
+    report_cache[('inventory', top)] = report
+    return report
+
+
+def get_box_valuation(connection, box_id):
+    """
+    Value, weight and item count of everything inside one box. Returns None if the box does not exist.
+    """
+    data, version = get_snapshot(connection)
+    totals = get_subtree_totals(data)
+
+    index = np.searchsorted(data['find'], box_id)
+    if index >= len(data['find']) or data['find'][index] != box_id:
+        return None
+    return dict(box_entry(data, totals, index), version=version)
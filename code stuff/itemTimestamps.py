@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sites import current_site
+
+logger = logging.getLogger(__name__)
+
+# Integer UTC epoch seconds for creation, modification and the last barcode scan of each row.
+# DATE_CREATED/DATE_MODIFIED stay as local time strings for display; every range query uses these columns.
+
+SECONDS_PER_DAY = 86400
+
+# Columns of the activity lists, by name: the epoch columns were added by a migration, so their position in
+# `SELECT *` depends on the database
+ACTIVITY_COLUMNS = ('FIND, NAME, TYPE, DESCRIPTION, WEIGHT, BARCODE_NUMBER, BARCODE_IMG_PATH, DATE_CREATED, '
+                    'DATE_MODIFIED, PARENT, IMG_PATH, COST, LAST_SCANNED_AT')
+
+# A live scan only records when a row was seen, so scan times are gathered here and written in one transaction
+# every few seconds instead of costing each scan a write and a commit. Site id -> {FIND: newest scan time}
+SCAN_FLUSH_SECONDS = 5
+pending_scans = {}
+pending_scans_lock = threading.Lock()
+
+
+def setup_epoch_timestamps(connection):
+    """
+    Add the epoch columns, fill them in from the existing local time strings and index them.
+    """
+    cursor = connection.cursor()
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(storage);').fetchall()]
+    for column in ('CREATED_AT', 'MODIFIED_AT', 'LAST_SCANNED_AT'):
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE storage ADD COLUMN {column} INTEGER NULL;')
+
+    # The strings were written with datetime.now(), so convert them from local time
+    cursor.execute('''
+        UPDATE storage
+        SET CREATED_AT = CAST(strftime('%s', DATE_CREATED, 'utc') AS INTEGER),
+            MODIFIED_AT = CAST(strftime('%s', DATE_MODIFIED, 'utc') AS INTEGER)
+        WHERE CREATED_AT IS NULL OR MODIFIED_AT IS NULL;
+    ''')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_storage_modified_at ON storage (MODIFIED_AT);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_storage_last_scanned_at ON storage (LAST_SCANNED_AT);')
+    # A box that was never scanned counts from when it was created; get_stale_boxes repeats this expression
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_storage_box_last_seen
+                        ON storage (TYPE, IFNULL(LAST_SCANNED_AT, CREATED_AT));''')
+
+    connection.commit()
+
+
+def now_epoch():
+    return int(time.time())
+
+
+def days_ago(days):
+    return now_epoch() - int(days * SECONDS_PER_DAY)
+
+
+def format_epoch(timestamp):
+    # Shown in local time, in the same format as DATE_CREATED/DATE_MODIFIED
+    if timestamp is None:
+        return 'N/A'
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def mark_scanned(cursor, finds, scanned_at=None):
+    # Scans replayed from an offline station can be older than the last live scan, so the newest time is kept
+    scanned_at = scanned_at if scanned_at is not None else now_epoch()
+    cursor.executemany('UPDATE storage SET LAST_SCANNED_AT = MAX(IFNULL(LAST_SCANNED_AT, 0), ?) WHERE FIND = ?;',
+                       [(scanned_at, find) for find in finds])
+
+
+def queue_scanned(finds, scanned_at=None):
+    # Written to the current site's database by the next flush_scans()
+    scanned_at = scanned_at if scanned_at is not None else now_epoch()
+    with pending_scans_lock:
+        site_scans = pending_scans.setdefault(current_site.get(), {})
+        for find in finds:
+            site_scans[find] = max(site_scans.get(find, 0), scanned_at)
+
+
+def flush_scans(connect):
+    """
+    Write the queued scan times of every site, one transaction per site. `connect(site_id)` opens a connection
+    to a site's database. Scan times that could not be written are queued again.
+    """
+    with pending_scans_lock:
+        batches = dict(pending_scans)
+        pending_scans.clear()
+
+    for site_id, scans in batches.items():
+        connection = connect(site_id)
+        try:
+            connection.executemany('UPDATE storage SET LAST_SCANNED_AT = MAX(IFNULL(LAST_SCANNED_AT, 0), ?) '
+                                   'WHERE FIND = ?;', [(scanned_at, find) for find, scanned_at in scans.items()])
+            connection.commit()
+        except Exception:
+            logger.exception("Error while writing scan times")
+            with pending_scans_lock:
+                site_scans = pending_scans.setdefault(site_id, {})
+                for find, scanned_at in scans.items():
+                    site_scans[find] = max(site_scans.get(find, 0), scanned_at)
+        finally:
+            connection.close()
+
+
+def scan_writer(connect):
+    while True:
+        time.sleep(SCAN_FLUSH_SECONDS)
+        flush_scans(connect)
+
+
+def start_scan_writer(connect):
+    thread = threading.Thread(target=scan_writer, args=(connect,), name="scan-writer", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_last_scan(cursor):
+    # MAX() of an indexed column reads a single index entry; scans not written yet are newer still
+    cursor.execute('SELECT MAX(LAST_SCANNED_AT) FROM storage;')
+    last_scan = cursor.fetchone()[0]
+    with pending_scans_lock:
+        pending = pending_scans.get(current_site.get())
+        if pending:
+            last_scan = max(last_scan or 0, max(pending.values()))
+    return last_scan
+
+
+def get_last_edit(cursor):
+    cursor.execute('SELECT MAX(MODIFIED_AT) FROM storage;')
+    return cursor.fetchone()[0]
+
+
+def get_recently_modified(cursor, days, limit=500):
+    """
+    Rows modified in the last `days` days, most recent first, with ACTIVITY_COLUMNS.
+    """
+    cursor.execute(f'''
+        SELECT {ACTIVITY_COLUMNS} FROM storage
+        WHERE MODIFIED_AT >= ?
+        ORDER BY MODIFIED_AT DESC
+        LIMIT ?;
+    ''', (days_ago(days), limit))
+    return cursor.fetchall()
+
+
+def get_stale_boxes(cursor, days, limit=500):
+    """
+    Boxes that have not been scanned in the last `days` days (or were never scanned and are older than that),
+    longest unseen first, with ACTIVITY_COLUMNS.
+    """
+    cursor.execute(f'''
+        SELECT {ACTIVITY_COLUMNS} FROM storage
+        WHERE TYPE = 'BOX' AND IFNULL(LAST_SCANNED_AT, CREATED_AT) < ?
+        ORDER BY IFNULL(LAST_SCANNED_AT, CREATED_AT)
+        LIMIT ?;
+    ''', (days_ago(days), limit))
+    return cursor.fetchall()
@@ -0,0 +1,218 @@
+import contextvars
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+
+# Request, SQL, subprocess and template timings, exposed in the Prometheus text format at /metrics
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# The sampling profiler is opt-in: set POTATODB_PROFILING=1 and add ?profile=1 to a request
+PROFILING_ENABLED = os.environ.get("POTATODB_PROFILING") == "1"
+PROFILE_INTERVAL = 0.001
+
+metrics_lock = threading.Lock()
+
+# Per-request SQL totals, set by the middleware for the duration of each request
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with metrics_lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with metrics_lock:
+            for key, (bucket_counts, total, count) in sorted(self.series.items()):
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with metrics_lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with metrics_lock:
+            for key, value in sorted(self.series.items()):
+                lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+
+request_duration = Histogram("potatodb_request_duration_seconds", "Request latency by route.")
+sql_statements = Counter("potatodb_sql_statements_total", "SQL statements executed, by route.")
+sql_duration = Counter("potatodb_sql_duration_seconds_total", "Time spent executing SQL, by route.")
+operation_duration = Histogram("potatodb_operation_duration_seconds",
+                               "Time spent in printer checks, label printing and template rendering.")
+reconcile_findings = Counter("potatodb_reconcile_findings_total",
+                             "Tree and file problems found by the background reconciler, by kind.")
+
+ALL_METRICS = (request_duration, sql_statements, sql_duration, operation_duration, reconcile_findings)
+
+
+class RequestStats:
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+
+
+def record_sql(seconds):
+    stats = current_request.get()
+    if stats is None:
+        # Statements run outside a request, e.g. at startup
+        sql_statements.inc(route="background")
+        sql_duration.inc(seconds, route="background")
+    else:
+        stats.sql_count += 1
+        stats.sql_time += seconds
+
+
+def add_sql_time(seconds):
+    stats = current_request.get()
+    if stats is None:
+        sql_duration.inc(seconds, route="background")
+    else:
+        stats.sql_time += seconds
+
+
+class TracedCursor(sqlite3.Cursor):
+    # Times statements and fetches; fetches count towards time because SQLite does its work while stepping rows
+
+    def execute(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            record_sql(time.perf_counter() - start)
+
+    def executemany(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            record_sql(time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            add_sql_time(time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            add_sql_time(time.perf_counter() - start)
+
+
+class TracedConnection(sqlite3.Connection):
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+
+def start_request():
+    stats = RequestStats()
+    current_request.set(stats)
+    return stats
+
+
+def finish_request(stats, route, method, status, seconds):
+    request_duration.observe(seconds, route=route, method=method, status=status)
+    sql_statements.inc(stats.sql_count, route=route)
+    sql_duration.inc(stats.sql_time, route=route)
+    current_request.set(None)
+
+
+@contextmanager
+def timed(operation, **labels):
+    # Records how long the block took, e.g. `with timed("template", name="add.html"):`
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        operation_duration.observe(time.perf_counter() - start, operation=operation, **labels)
+
+
+def render_metrics():
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval and reports it in the collapsed-stack format
+    understood by flame graph tools.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = StackCounter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def report(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common()) + '\n'
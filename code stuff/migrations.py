@@ -0,0 +1,64 @@
+import logging
+
+from boxCache import setup_box_versions
+from changeFeed import setup_change_log
+from itemTimestamps import setup_epoch_timestamps
+from queryApi import add_query_indexes
+from fuzzySearch import setup_search_index
+from scanReplay import setup_scan_events
+
+logger = logging.getLogger(__name__)
+
+# Schema changes applied on startup, in order. `PRAGMA user_version` records how many have already run,
+# so each one only runs once per database. Append new migrations to the end of the list.
+
+
+def add_name_index(connection):
+    # Lets the barcode lookup fallback and exact-name searches use an index instead of scanning the table
+    connection.execute('CREATE INDEX IF NOT EXISTS idx_storage_name ON storage (NAME);')
+
+
+def clear_blank_costs(connection):
+    # An empty cost field used to be stored as '' rather than NULL
+    connection.execute("UPDATE storage SET COST = NULL WHERE typeof(COST) = 'text' AND trim(COST) = '';")
+
+
+def ignore_scan_only_updates(connection):
+    # The update triggers used to fire on a scan that only set LAST_SCANNED_AT; recreate them with column lists
+    for trigger in ('change_log_update', 'box_versions_update'):
+        connection.execute(f'DROP TRIGGER IF EXISTS {trigger};')
+    setup_box_versions(connection)
+    setup_change_log(connection)
+
+
+def drop_activity_trigger(connection):
+    # Every edit used to bump the global page version; Last Edit is part of the page ETag instead
+    connection.execute('DROP TRIGGER IF EXISTS box_versions_activity;')
+
+
+MIGRATIONS = [
+    add_name_index,
+    setup_box_versions,
+    setup_change_log,
+    setup_epoch_timestamps,
+    add_query_indexes,
+    clear_blank_costs,
+    setup_search_index,
+    setup_scan_events,
+    ignore_scan_only_updates,
+    drop_activity_trigger,
+]
+
+
+def run_migrations(connection):
+    cursor = connection.cursor()
+    cursor.execute('PRAGMA user_version;')
+    version = cursor.fetchone()[0]
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logger.info("migration_start number=%d name=%s", number, migration.__name__)
+        migration(connection)
+        cursor.execute(f'PRAGMA user_version = {number};')
+        connection.commit()
+
+    return len(MIGRATIONS)
@@ -0,0 +1,71 @@
+import re
+from bisect import bisect_left, insort
+
+from sites import get_site_cache
+
+# Sorted (key, FIND) pairs for name autocompletion. Each name is stored under its full lowercased text and
+# again from the start of every later word, so "yo" completes "Lenovo L13 Yoga". Words that start with a digit
+# are left out: typing digits means a barcode scan, and they would double the size of the index.
+# barcodeIndex keeps this in step with the rows it holds. Each site has its own list.
+
+
+def get_entries():
+    return get_site_cache('prefix_index', list)
+
+WORD_START = re.compile(r'(?<!\w)[^\W\d]')
+
+
+def get_keys(name):
+    name = name.lower()
+    keys = [name]
+    for match in WORD_START.finditer(name, 1):
+        keys.append(name[match.start():])
+    return keys
+
+
+def rebuild_prefix_index(names):
+    # `names` is an iterable of (FIND, NAME); sorting once is much faster than inserting row by row
+    keys_by_name = {}
+    new_entries = []
+    for find, name in names:
+        keys = keys_by_name.get(name)
+        if keys is None:
+            keys = keys_by_name[name] = get_keys(name)
+        new_entries.extend((key, find) for key in keys)
+    new_entries.sort()
+    get_entries()[:] = new_entries
+
+
+def add_name(find, name):
+    entries = get_entries()
+    for key in get_keys(name):
+        insort(entries, (key, find))
+
+
+def remove_name(find, name):
+    entries = get_entries()
+    for key in get_keys(name):
+        position = bisect_left(entries, (key, find))
+        if position < len(entries) and entries[position] == (key, find):
+            del entries[position]
+
+
+def complete(prefix, limit=8):
+    """
+    FIND values of the first `limit` names with a word starting with `prefix`, in alphabetical order.
+    """
+    prefix = prefix.strip().lower()
+    if not prefix:
+        return []
+
+    entries = get_entries()
+    finds = []
+    position = bisect_left(entries, (prefix,))
+    while position < len(entries) and len(finds) < limit:
+        key, find = entries[position]
+        if not key.startswith(prefix):
+            break
+        if find not in finds:
+            finds.append(find)
+        position += 1
+    return finds
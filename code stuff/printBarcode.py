@@ -2,10 +2,13 @@ from string import printable
 
 from PIL import Image
 import os
+import logging
 import win32print
 import win32ui
 from PIL import ImageWin
 
+logger = logging.getLogger(__name__)
+
 
 def print_label(image_path, printer_name=None):
     # Normalize the image path to handle different path formats
@@ -13,14 +16,14 @@ def print_label(image_path, printer_name=None):
 
     # Check if the image file exists and is accessible
     if not os.path.isfile(image_path):
-        print(f"Error: The file at {image_path} does not exist or is not a file.")
+        logger.error("label_print_failed reason=missing_file path=%r", image_path)
         return
 
     # Load the image
     try:
         image = Image.open(image_path)
     except Exception as e:
-        print(f"An error occurred while opening the image: {e}")
+        logger.error("label_print_failed reason=unreadable_image path=%r error=%s", image_path, e)
         return
 
     # Resize image to fit the 2"x1" label (203 DPI assumed for label printers)
@@ -62,7 +65,7 @@ def print_label(image_path, printer_name=None):
     # Clean up temporary BMP file
     os.remove(temp_image_path)
 
-    print(f"Image sent to {printer_name} successfully.")
+    logger.info("label_printed printer=%r", printer_name)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,207 @@
+import base64
+import json
+
+from subtreeOps import SUBTREE_CTE
+
+try:
+    import orjson
+except ImportError:
+    # The standard library encoder gives the same output, only slower
+    orjson = None
+
+# Structured item/box queries for the /api/v1 JSON endpoints.
+# Every filter maps to an indexed column (see add_query_indexes), and pages are fetched with keyset pagination
+# on (sort column, FIND) so a deep page costs the same as the first one.
+
+API_VERSION = 'v1'
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# API field name -> storage column
+FIELD_COLUMNS = {
+    'id': 'FIND',
+    'name': 'NAME',
+    'type': 'TYPE',
+    'description': 'DESCRIPTION',
+    'weight': 'WEIGHT',
+    'barcode_num': 'BARCODE_NUMBER',
+    'barcode_path': 'BARCODE_IMG_PATH',
+    'date_created': 'DATE_CREATED',
+    'date_modified': 'DATE_MODIFIED',
+    'parent': 'PARENT',
+    'images': 'IMG_PATH',
+    'cost': 'COST',
+    'created_at': 'CREATED_AT',
+    'modified_at': 'MODIFIED_AT',
+    'last_scanned_at': 'LAST_SCANNED_AT',
+}
+
+SORT_FIELDS = ('id', 'name', 'weight', 'cost', 'created_at', 'modified_at', 'last_scanned_at')
+
+# Range filters: query parameter -> (column, operator)
+RANGE_FILTERS = {
+    'weight_min': ('WEIGHT', '>='),
+    'weight_max': ('WEIGHT', '<='),
+    'cost_min': ('COST', '>='),
+    'cost_max': ('COST', '<='),
+    'created_after': ('CREATED_AT', '>='),
+    'created_before': ('CREATED_AT', '<'),
+    'modified_after': ('MODIFIED_AT', '>='),
+    'modified_before': ('MODIFIED_AT', '<'),
+}
+
+
+def add_query_indexes(connection):
+    # PARENT, NAME, MODIFIED_AT and LAST_SCANNED_AT are already indexed by earlier migrations
+    cursor = connection.cursor()
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_storage_type ON storage (TYPE);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_storage_weight ON storage (WEIGHT);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_storage_cost ON storage (COST);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_storage_created_at ON storage (CREATED_AT);')
+    # With statistics the planner picks the most selective index when several filters are combined
+    cursor.execute('ANALYZE;')
+    connection.commit()
+
+
+def dump_json(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def encode_cursor(sort, value, find):
+    return base64.urlsafe_b64encode(dump_json([sort, value, find])).decode().rstrip('=')
+
+
+def decode_cursor(cursor_token, sort):
+    try:
+        padded = cursor_token + '=' * (-len(cursor_token) % 4)
+        cursor_sort, value, find = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if cursor_sort != sort:
+        raise ValueError("The cursor belongs to a query with a different sort order.")
+    return value, find
+
+
+def parse_fields(fields):
+    if not fields:
+        return list(FIELD_COLUMNS)
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in FIELD_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def parse_sort(sort):
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+    if field not in SORT_FIELDS:
+        raise ValueError(f"Cannot sort by {field}; use one of {', '.join(SORT_FIELDS)}")
+    return field, descending
+
+
+def keyset_condition(column, descending, value, find):
+    """
+    Rows after (value, find) in `ORDER BY column, FIND` (or both DESC). SQLite sorts NULLs first,
+    so they come before every value in ascending order and after every value in descending order.
+    """
+    if column == 'FIND':
+        return ('FIND < ?' if descending else 'FIND > ?'), [find]
+
+    if value is None:
+        if descending:
+            return f'({column} IS NULL AND FIND < ?)', [find]
+        return f'(({column} IS NULL AND FIND > ?) OR {column} IS NOT NULL)', [find]
+
+    if descending:
+        return f'({column} < ? OR ({column} = ? AND FIND < ?) OR {column} IS NULL)', [value, value, find]
+    return f'({column} > ? OR ({column} = ? AND FIND > ?))', [value, value, find]
+
+
+def query_items(cursor, filters, sort='id', fields=None, limit=DEFAULT_PAGE_SIZE, cursor_token=None):
+    """
+    Run a filtered, sorted, paginated query. `filters` holds the query parameters that were given:
+    type, parent, subtree and the keys of RANGE_FILTERS.
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for an invalid parameter.
+    """
+    field_names = parse_fields(fields)
+    sort_field, descending = parse_sort(sort)
+    sort_column = FIELD_COLUMNS[sort_field]
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    conditions = []
+    params = []
+    prefix = ''
+
+    if filters.get('type') is not None:
+        item_type = filters['type'].upper()
+        if item_type not in ('BOX', 'ITEM'):
+            raise ValueError("type must be BOX or ITEM")
+        conditions.append('TYPE = ?')
+        params.append(item_type)
+
+    if filters.get('parent') is not None:
+        # PARENT is a TEXT column; compare as text so idx_storage_parent is used
+        conditions.append('PARENT = ?')
+        params.append(str(filters['parent']))
+
+    if filters.get('subtree') is not None:
+        prefix = SUBTREE_CTE
+        conditions.append('FIND IN (SELECT FIND FROM subtree)')
+        params.insert(0, filters['subtree'])
+
+    for name, (column, operator) in RANGE_FILTERS.items():
+        if filters.get(name) is not None:
+            conditions.append(f'{column} {operator} ?')
+            params.append(filters[name])
+            if column == 'COST':
+                # COST has been stored from a free-form field, so skip values that are not numbers
+                conditions.append("typeof(COST) IN ('integer', 'real')")
+
+    if cursor_token:
+        value, find = decode_cursor(cursor_token, sort)
+        condition, condition_params = keyset_condition(sort_column, descending, value, find)
+        conditions.append(condition)
+        params.extend(condition_params)
+
+    # The sort column and FIND are always selected so the next cursor can be built
+    selected = [FIELD_COLUMNS[name] for name in field_names]
+    select_columns = selected + [sort_column, 'FIND']
+    direction = 'DESC' if descending else 'ASC'
+    order_by = f'FIND {direction}' if sort_column == 'FIND' else f'{sort_column} {direction}, FIND {direction}'
+
+    sql = f'''{prefix}
+        SELECT {', '.join(select_columns)} FROM storage
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY {order_by}
+        LIMIT ?;'''
+    # One extra row tells whether there is another page
+    cursor.execute(sql, params + [limit + 1])
+    rows = cursor.fetchall()
+
+    items = [row_to_item(field_names, row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last_row = rows[limit - 1]
+        next_cursor = encode_cursor(sort, last_row[-2], last_row[-1])
+    return items, next_cursor
+
+
+def get_item(cursor, find, fields=None):
+    field_names = parse_fields(fields)
+    columns = ', '.join(FIELD_COLUMNS[name] for name in field_names)
+    cursor.execute(f'SELECT {columns} FROM storage WHERE FIND = ?;', (find,))
+    row = cursor.fetchone()
+    return row_to_item(field_names, row) if row is not None else None
+
+
+def row_to_item(field_names, row):
+    item = dict(zip(field_names, row))
+    if item.get('images'):
+        item['images'] = json.loads(item['images'])
+    if item.get('parent') is not None:
+        item['parent'] = int(item['parent'])
+    return item
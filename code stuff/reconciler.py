@@ -0,0 +1,315 @@
+import argparse
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from changeFeed import compact_change_log
+from fileCleanup import get_referenced_files, normalize_file_path
+from metrics import reconcile_findings
+from sites import DEFAULT_SITE, get_db_path, get_file_directory
+
+logger = logging.getLogger(__name__)
+
+# Background consistency check of the box tree and the barcode/photo directories.
+# - The tree is walked once, upwards from every row, to find PARENT cycles, rows whose parent does not exist
+#   and rows that cannot reach the root because of either.
+# - Files in the managed directories that no row (and no template or stylesheet) refers to are moved to a
+#   quarantine directory, and deleted once they have sat there for QUARANTINE_DAYS.
+# All work is throttled so it can run next to normal traffic. The background thread also compacts the change log.
+# Run it by hand with:
+#   python reconciler.py [--site main] [--dry-run] [--repair-tree]
+# Each site is checked on its own, against its own database and file directories.
+
+MANAGED_DIRECTORIES = ('static/barcodes', 'static/images')
+QUARANTINE_DIRECTORY = 'quarantine'
+QUARANTINE_DAYS = 30
+# Files this new may belong to a row that is still being added
+GRACE_SECONDS = 3600
+
+# static/images holds the app's own pictures next to uploaded photos. Those referenced from a template or the
+# stylesheet are found by ASSET_REFERENCE; the rest are listed here.
+ASSET_SOURCES = ('templates', 'static/css')
+ASSET_REFERENCE = re.compile(r'(images/[\w.\-]+)')
+SHIPPED_FILES = ('static/images/potato.png', 'static/images/ranger.png', 'static/images/FtStk.png')
+
+ROOT_ID = 1
+TREE_CHUNK_SIZE = 10000
+
+# Share of one CPU core the reconciler may use, and how many file operations per second it may make
+DUTY_CYCLE = 0.1
+MAX_FILE_OPS_PER_SECOND = 50
+
+# Seconds between runs of the background thread; set POTATODB_RECONCILE_INTERVAL=0 to turn it off
+RECONCILE_INTERVAL = int(os.environ.get("POTATODB_RECONCILE_INTERVAL", 24 * 3600))
+RECONCILE_START_DELAY = 600
+
+
+class Throttle:
+    """
+    Sleeps between chunks of work so that the job uses about `duty_cycle` of a core and makes at most
+    `max_ops_per_second` file operations.
+    """
+    def __init__(self, duty_cycle=DUTY_CYCLE, max_ops_per_second=MAX_FILE_OPS_PER_SECOND, chunk_seconds=0.01):
+        self.duty_cycle = duty_cycle
+        self.max_ops_per_second = max_ops_per_second
+        self.chunk_seconds = chunk_seconds
+        self.chunk_start = time.perf_counter()
+        self.chunk_ops = 0
+
+    def step(self, ops=0):
+        self.chunk_ops += ops
+        busy = time.perf_counter() - self.chunk_start
+        if busy < self.chunk_seconds and self.chunk_ops < self.max_ops_per_second * self.chunk_seconds * 10:
+            return
+
+        pause = max(busy * (1 - self.duty_cycle) / self.duty_cycle,
+                    self.chunk_ops / self.max_ops_per_second - busy)
+        time.sleep(pause)
+        self.chunk_start = time.perf_counter()
+        self.chunk_ops = 0
+
+
+def load_parents(connection, throttle):
+    # Read in FIND order, a chunk at a time, so the reader never holds the database for long
+    cursor = connection.cursor()
+    parents = {}
+    last_find = -1
+    while True:
+        cursor.execute('SELECT FIND, PARENT FROM storage WHERE FIND > ? ORDER BY FIND LIMIT ?;',
+                       (last_find, TREE_CHUNK_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            return parents
+        for find, parent in rows:
+            parents[find] = int(parent) if parent not in (None, '') else None
+        last_find = rows[-1][0]
+        throttle.step()
+
+
+def check_tree(parents, throttle):
+    """
+    Walk up from every row once. Every row ends up either reaching the root, or stuck on a missing parent,
+    a cycle or a second row without a parent; each row is visited a single time overall.
+    Returns the rows with a missing parent, the cycles and the rows that cannot reach the root.
+    """
+    reaches_root = {}
+    dangling = []
+    cycles = []
+
+    for start in parents:
+        if start in reaches_root:
+            continue
+
+        path = []
+        on_path = set()
+        node = start
+        while True:
+            if node in reaches_root:
+                result = reaches_root[node]
+                break
+            if node in on_path:
+                cycle = path[path.index(node):]
+                cycles.append(cycle)
+                result = False
+                break
+            if node == ROOT_ID:
+                result = True
+                path.append(node)
+                break
+
+            path.append(node)
+            on_path.add(node)
+            parent = parents[node]
+            if parent is None:
+                result = False
+                dangling.append((node, None))
+                break
+            if parent not in parents:
+                result = False
+                dangling.append((node, parent))
+                break
+            node = parent
+
+        for node in path:
+            reaches_root[node] = result
+        throttle.step()
+
+    unreachable = [find for find, reachable in reaches_root.items() if not reachable]
+    return dangling, cycles, unreachable
+
+
+def get_asset_files(base_dir):
+    assets = {normalize_file_path(path) for path in SHIPPED_FILES}
+    for source in ASSET_SOURCES:
+        source_dir = os.path.join(base_dir, source)
+        if not os.path.isdir(source_dir):
+            continue
+        for name in os.listdir(source_dir):
+            if not os.path.isfile(os.path.join(source_dir, name)):
+                continue
+            with open(os.path.join(source_dir, name), encoding='utf-8', errors='ignore') as source_file:
+                assets.update(normalize_file_path('static/' + path)
+                              for path in ASSET_REFERENCE.findall(source_file.read()))
+    return assets
+
+
+def get_site_directories(site_id):
+    return [get_file_directory(directory, site_id) for directory in MANAGED_DIRECTORIES]
+
+
+def find_unreferenced_files(connection, base_dir, directories, throttle):
+    referenced = set(get_referenced_files(connection.cursor())) | get_asset_files(base_dir)
+    cutoff = time.time() - GRACE_SECONDS
+
+    unreferenced = []
+    for directory in directories:
+        full_directory = os.path.join(base_dir, directory)
+        if not os.path.isdir(full_directory):
+            continue
+        with os.scandir(full_directory) as entries:
+            for entry in entries:
+                throttle.step(1)
+                if not entry.is_file():
+                    continue
+                path = normalize_file_path(os.path.join(directory, entry.name))
+                if path not in referenced and entry.stat().st_mtime < cutoff:
+                    unreferenced.append(path)
+    return unreferenced
+
+
+def quarantine_files(paths, base_dir, throttle):
+    target_dir = os.path.join(base_dir, QUARANTINE_DIRECTORY, datetime.now().strftime("%Y%m%d"))
+    for path in paths:
+        target = os.path.join(target_dir, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(os.path.join(base_dir, path), target)
+        throttle.step(1)
+
+
+def purge_quarantine(base_dir, throttle):
+    # Quarantine directories are named by date, so whole days are dropped at once
+    quarantine_dir = os.path.join(base_dir, QUARANTINE_DIRECTORY)
+    if not os.path.isdir(quarantine_dir):
+        return 0
+
+    cutoff = datetime.now().timestamp() - QUARANTINE_DAYS * 86400
+    purged = 0
+    for name in sorted(os.listdir(quarantine_dir)):
+        try:
+            day = datetime.strptime(name, "%Y%m%d").timestamp()
+        except ValueError:
+            continue
+        if day < cutoff:
+            shutil.rmtree(os.path.join(quarantine_dir, name))
+            purged += 1
+            throttle.step(1)
+    return purged
+
+
+def repair_tree(connection, dangling, cycles):
+    # Put rows with a missing parent, and one row of each cycle, directly under the root
+    moved = [find for find, _ in dangling if find != ROOT_ID] + [cycle[0] for cycle in cycles]
+    connection.executemany('UPDATE storage SET PARENT = ? WHERE FIND = ?;', [(str(ROOT_ID), find) for find in moved])
+    connection.commit()
+    return moved
+
+
+def reconcile(connection, base_dir='.', dry_run=False, repair=False, throttle=None, site_id=DEFAULT_SITE):
+    """
+    Run one full check. Returns a summary of what was found and done.
+    """
+    throttle = throttle or Throttle()
+    start = time.monotonic()
+
+    parents = load_parents(connection, throttle)
+    dangling, cycles, unreachable = check_tree(parents, throttle)
+    unreferenced = find_unreferenced_files(connection, base_dir, get_site_directories(site_id), throttle)
+
+    summary = {
+        'rows': len(parents),
+        'dangling_parents': [{'id': find, 'parent': parent} for find, parent in dangling],
+        'cycles': cycles,
+        'unreachable_rows': len(unreachable),
+        'unreferenced_files': unreferenced,
+        'repaired_rows': [],
+        'purged_quarantine_days': 0,
+    }
+
+    if not dry_run:
+        quarantine_files(unreferenced, base_dir, throttle)
+        summary['purged_quarantine_days'] = purge_quarantine(base_dir, throttle)
+        if repair and (dangling or cycles):
+            summary['repaired_rows'] = repair_tree(connection, dangling, cycles)
+
+    reconcile_findings.inc(len(dangling), kind='dangling_parent')
+    reconcile_findings.inc(len(cycles), kind='cycle')
+    reconcile_findings.inc(len(unreferenced), kind='unreferenced_file')
+
+    log = logger.warning if dangling or cycles else logger.info
+    log("reconcile_finished site=%s rows=%d dangling=%d cycles=%d unreachable=%d unreferenced_files=%d dry_run=%s "
+        "duration=%.1fs", site_id, len(parents), len(dangling), len(cycles), len(unreachable), len(unreferenced),
+        dry_run, time.monotonic() - start)
+    return summary
+
+
+def reconcile_worker(connect, base_dir, site_id):
+    time.sleep(RECONCILE_START_DELAY)
+    while True:
+        connection = connect()
+        try:
+            reconcile(connection, base_dir, site_id=site_id)
+        except Exception:
+            logger.exception("Error while reconciling")
+        # The change log is compacted on the same schedule, so it stays bounded on a server that is never restarted
+        try:
+            compact_change_log(connection)
+        except Exception:
+            logger.exception("Error while compacting the change log")
+        finally:
+            connection.close()
+        time.sleep(RECONCILE_INTERVAL)
+
+
+def start_reconciler(connect, base_dir='.', site_id=DEFAULT_SITE):
+    # `connect` opens a connection to the site's database; it is called from the reconciler thread
+    if RECONCILE_INTERVAL <= 0:
+        return None
+    thread = threading.Thread(target=reconcile_worker, args=(connect, base_dir, site_id),
+                              name=f"reconciler-{site_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s level=%(levelname)s logger=%(name)s %(message)s")
+
+    parser = argparse.ArgumentParser(description="Check the box tree and clean up unreferenced files.")
+    parser.add_argument("--site", default=DEFAULT_SITE)
+    parser.add_argument("--db", help="database to check instead of the site's own")
+    parser.add_argument("--dry-run", action="store_true", help="only report, do not move any files")
+    parser.add_argument("--repair-tree", action="store_true",
+                        help="move rows with a missing parent, and one row of each cycle, under the root")
+    parser.add_argument("--unthrottled", action="store_true", help="run at full speed, e.g. during maintenance")
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.db or get_db_path(args.site))
+    throttle = Throttle(duty_cycle=1.0, max_ops_per_second=float('inf')) if args.unthrottled else None
+    summary = reconcile(connection, dry_run=args.dry_run, repair=args.repair_tree, throttle=throttle,
+                        site_id=args.site)
+    connection.close()
+
+    print(f"{summary['rows']} rows, {len(summary['dangling_parents'])} with a missing parent, "
+          f"{len(summary['cycles'])} cycles, {summary['unreachable_rows']} unreachable from the root")
+    for cycle in summary['cycles']:
+        print("  cycle: " + " -> ".join(str(find) for find in cycle))
+    action = "would be quarantined" if args.dry_run else "quarantined"
+    print(f"{len(summary['unreferenced_files'])} unreferenced files {action}")
+    for path in summary['unreferenced_files']:
+        print("  " + path)
+    if summary['repaired_rows']:
+        print(f"Moved {len(summary['repaired_rows'])} rows under the root")
@@ -0,0 +1,162 @@
+import json
+import logging
+
+from barcodeIndex import lookup_scan
+from itemTimestamps import mark_scanned, now_epoch, format_epoch
+from subtreeOps import ROOT_ID, is_in_subtree
+
+logger = logging.getLogger(__name__)
+
+# Scans buffered by a station while it was offline (see static/js/service-worker.js) arrive here as one batch
+# and are replayed in order through the same scan-to-move step as live scans, in a single transaction.
+# Every event carries an id chosen by the station; results are stored under it in `scan_events`, so a batch that
+# is sent again after a lost response returns the stored results instead of moving anything twice.
+
+MAX_BATCH_SIZE = 1000
+# How far ahead of the server's clock a station's clock may be
+MAX_CLOCK_SKEW_SECONDS = 86400
+# Stored results are kept this long, well past any retry
+EVENT_RETENTION_DAYS = 30
+
+
+def setup_scan_events(connection):
+    cursor = connection.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS scan_events (
+                        EVENT_ID TEXT PRIMARY KEY NOT NULL,
+                        STATION TEXT NULL,
+                        CODE TEXT NOT NULL,
+                        SCANNED_AT INTEGER NOT NULL,
+                        RECEIVED_AT INTEGER NOT NULL,
+                        RESULT TEXT NOT NULL
+                    );''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scan_events_received_at ON scan_events (RECEIVED_AT);')
+    connection.commit()
+
+
+def apply_scan(cursor, last_item_id, row):
+    """
+    Scan-to-move for a scan that found exactly one row: scanning an item and then a box puts the item in the box.
+    Returns (the item to remember for the next scan, the FIND that was moved or None, an error message or None).
+    The caller commits.
+    """
+    current_item_id = row[0]
+    current_item_type = row[2]
+
+    if last_item_id is None:
+        return current_item_id, None, None
+
+    if current_item_type == "BOX" and last_item_id != current_item_id:
+        if last_item_id == ROOT_ID:
+            logger.info("scan_move_failed reason=root")
+            return None, None, "Error: The root directory cannot be moved."
+        # Scanning a box and then a box inside it would make the tree loop
+        if is_in_subtree(cursor, last_item_id, current_item_id):
+            logger.info("scan_move_failed reason=into_own_subtree item_id=%s parent=%s", last_item_id, current_item_id)
+            return None, None, f"Error: {current_item_id} is inside {last_item_id}, so it cannot hold it."
+        current_time = now_epoch()
+        cursor.execute('''
+            UPDATE storage
+            SET PARENT = ?, DATE_MODIFIED = ?, MODIFIED_AT = ?
+            WHERE FIND = ?;
+        ''', (current_item_id, format_epoch(current_time), current_time, last_item_id))
+        return None, last_item_id, None
+
+    if current_item_type != "BOX":
+        logger.info("scan_move_failed reason=parent_not_box type=%s", current_item_type)
+        return None, None, f"Error: The new parent must be a 'BOX', but found '{current_item_type}'."
+
+    logger.info("scan_move_failed reason=same_item item_id=%s", current_item_id)
+    return None, None, "Error: The new parent is the same as the current item."
+
+
+def parse_events(payload):
+    """
+    Validate a batch: {"station": "...", "events": [{"id": "...", "code": "...", "scanned_at": epoch}, ...]}.
+    Returns (station, valid events with `scanned_at` made a whole number, results for the events that were
+    rejected). Raises ValueError when the batch itself is malformed, since no event could be acknowledged then.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get('events'), list):
+        raise ValueError("Expected an object with an `events` list.")
+    events = payload['events']
+    if len(events) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} events per batch.")
+    if not all(isinstance(event, dict) and isinstance(event.get('id'), str) and event['id'] for event in events):
+        raise ValueError("Every event needs a non-empty string `id`.")
+
+    latest_scan = now_epoch() + MAX_CLOCK_SKEW_SECONDS
+
+    valid = []
+    rejected = []
+    for event in events:
+        scanned_at = event.get('scanned_at')
+        if not isinstance(event.get('code'), str):
+            error = "`code` must be a string."
+        # The range check also turns away NaN and infinity
+        elif (not isinstance(scanned_at, (int, float)) or isinstance(scanned_at, bool)
+                or not 0 <= scanned_at <= latest_scan):
+            error = "`scanned_at` must be in epoch seconds, no later than now."
+        else:
+            valid.append(dict(event, scanned_at=int(scanned_at)))
+            continue
+        logger.info("scan_event_rejected id=%r error=%r", event['id'], error)
+        rejected.append({'id': event['id'], 'status': 'rejected', 'error': error})
+
+    station = payload.get('station')
+    return (str(station) if station is not None else None), valid, rejected
+
+
+def replay_scans(connection, station, events, last_item_id):
+    """
+    Replay scan events in scan order. Returns (per-event results in the order the events were sent, the item to
+    remember for the next scan, the FINDs whose rows changed).
+    """
+    cursor = connection.cursor()
+    received_at = now_epoch()
+
+    event_ids = [event['id'] for event in events]
+    stored = {}
+    for start in range(0, len(event_ids), 500):
+        chunk = event_ids[start:start + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        cursor.execute(f'SELECT EVENT_ID, RESULT FROM scan_events WHERE EVENT_ID IN ({placeholders});', chunk)
+        stored.update((event_id, json.loads(result)) for event_id, result in cursor.fetchall())
+
+    results = {}
+    changed = set()
+    # Stable sort: events with the same timestamp keep the order the station sent them in
+    for event in sorted(events, key=lambda event: event['scanned_at']):
+        if event['id'] in stored or event['id'] in results:
+            results.setdefault(event['id'], dict(stored.get(event['id'], {}), duplicate=True))
+            continue
+
+        code = event['code'].strip()
+        stripped_code = code.lstrip('0')
+        result = {'id': event['id']}
+        if not stripped_code.isdecimal():
+            result.update(status='not_a_barcode')
+        else:
+            rows = lookup_scan(connection, code, stripped_code)
+            if not rows:
+                result.update(status='not_found')
+            else:
+                finds = [row[0] for row in rows]
+                mark_scanned(cursor, finds, event['scanned_at'])
+                changed.update(finds)
+                result.update(status='found', items=finds)
+                if len(rows) == 1:
+                    last_item_id, moved_id, error = apply_scan(cursor, last_item_id, rows[0])
+                    if moved_id is not None:
+                        changed.add(moved_id)
+                        result.update(status='moved', moved=moved_id, parent=rows[0][0])
+                    elif error:
+                        result.update(status='error', error=error)
+                    else:
+                        result.update(status='tracked')
+
+        cursor.execute('''INSERT INTO scan_events (EVENT_ID, STATION, CODE, SCANNED_AT, RECEIVED_AT, RESULT)
+                          VALUES (?, ?, ?, ?, ?, ?);''',
+                       (event['id'], station, code, event['scanned_at'], received_at, json.dumps(result)))
+        results[event['id']] = result
+
+    cursor.execute('DELETE FROM scan_events WHERE RECEIVED_AT < ?;', (received_at - EVENT_RETENTION_DAYS * 86400,))
+    return [results[event_id] for event_id in event_ids], last_item_id, changed
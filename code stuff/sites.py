@@ -0,0 +1,95 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+
+# One SQLite database per stockroom, so each site has its own writer lock, backups and vacuums.
+# Sites are configured as POTATODB_SITES="main=storage.db,north=storage-north.db"; the first one is the default
+# and keeps the original file locations. Without the setting there is a single site backed by storage.db.
+#
+# A request picks its site with ?site=, an X-Site header or the `site` cookie set by /site/{site_id}; the app
+# middleware stores it in `current_site` for everything that runs during the request. Module-level caches
+# (scan index, autocomplete, fuzzy vocabulary, reports) are kept per site through get_site_cache().
+#
+# Every site has its own FIND numbering starting from its root box 1, so ids are only unique within a site.
+
+
+def parse_sites(setting):
+    sites = {}
+    for entry in setting.split(','):
+        if not entry.strip():
+            continue
+        site_id, _, db_path = entry.partition('=')
+        site_id = site_id.strip()
+        if not site_id.isidentifier() or not db_path.strip():
+            raise ValueError(f"Invalid site entry {entry!r}; expected name=path/to/database.db")
+        sites[site_id] = db_path.strip()
+    return sites
+
+
+SITES = parse_sites(os.environ.get("POTATODB_SITES", "main=storage.db"))
+DEFAULT_SITE = next(iter(SITES))
+SITE_COOKIE = 'site'
+
+current_site = ContextVar('current_site', default=DEFAULT_SITE)
+
+# Cache name -> {site id -> cache}
+site_caches = {}
+
+# Fan-out queries run on every site at once; each worker has its own connection
+fan_out_pool = ThreadPoolExecutor(max_workers=min(8, len(SITES)), thread_name_prefix="site-query")
+
+
+def get_db_path(site_id=None):
+    return SITES[site_id or current_site.get()]
+
+
+def get_file_directory(base_directory, site_id=None):
+    # The default site keeps the original directories; other sites get a subdirectory named after the site
+    site_id = site_id or current_site.get()
+    if site_id == DEFAULT_SITE:
+        return base_directory
+    return os.path.join(base_directory, site_id)
+
+
+def get_site_cache(name, factory):
+    """
+    The current site's copy of a module-level cache, made with `factory` the first time it is asked for.
+    """
+    caches = site_caches.setdefault(name, {})
+    site_id = current_site.get()
+    cache = caches.get(site_id)
+    if cache is None:
+        cache = caches[site_id] = factory()
+    return cache
+
+
+def resolve_site(request):
+    """
+    Site id for a request, or None if ?site= or X-Site names a site that does not exist. A cookie naming a site
+    that is no longer configured is ignored, so the station falls back to the default site.
+    """
+    site_id = request.query_params.get('site') or request.headers.get('x-site')
+    if site_id:
+        return site_id if site_id in SITES else None
+    site_id = request.cookies.get(SITE_COOKIE)
+    return site_id if site_id in SITES else DEFAULT_SITE
+
+
+def run_on_site(site_id, function, connect):
+    token = current_site.set(site_id)
+    connection = connect()
+    try:
+        return function(connection)
+    finally:
+        connection.close()
+        current_site.reset(token)
+
+
+def fan_out(function, connect, site_ids=None):
+    """
+    Call `function(connection)` for every site in parallel, each with a connection to that site's database and
+    `current_site` set. Returns {site id: result}, in configuration order.
+    """
+    site_ids = site_ids or list(SITES)
+    futures = {site_id: fan_out_pool.submit(run_on_site, site_id, function, connect) for site_id in site_ids}
+    return {site_id: future.result() for site_id, future in futures.items()}
@@ -0,0 +1,182 @@
+// Buffers barcode scans while the station is offline and sends them to the server in one batch once it is back.
+// A scan is a GET /search/<digits> made by performSearch() in base.html. When it fails because the network is
+// down, the code is stored in IndexedDB with the time it was scanned and the site named in its X-Site header, and
+// the page is told it was queued.
+// Queued scans are replayed through /api/v1/scans before any newer scan goes out, so the server sees them in the
+// order they were made; if the replay fails while the network is up, the new scan is sent anyway. Each scan has its
+// own id, so a batch that is sent twice is only applied once.
+
+const DB_NAME = 'potatodb-scans';
+const SCAN_STORE = 'scans';
+const META_STORE = 'meta';
+const SCAN_PATH = /^\/search\/(\d+)$/;
+const REPLAY_URL = '/api/v1/scans';
+const BATCH_SIZE = 500;
+
+self.addEventListener('install', () => self.skipWaiting());
+self.addEventListener('activate', event => event.waitUntil(self.clients.claim()));
+
+function openQueue() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(DB_NAME, 1);
+        request.onupgradeneeded = () => {
+            // Keys increase with every scan, so reading the store returns scans in the order they were made
+            request.result.createObjectStore(SCAN_STORE, {keyPath: 'seq', autoIncrement: true});
+            request.result.createObjectStore(META_STORE);
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+// Run `work(store)` in one transaction and resolve with the result of the request it returns
+async function withStore(storeName, mode, work) {
+    const db = await openQueue();
+    return new Promise((resolve, reject) => {
+        const transaction = db.transaction(storeName, mode);
+        const request = work(transaction.objectStore(storeName));
+        transaction.oncomplete = () => resolve(request ? request.result : undefined);
+        transaction.onerror = () => reject(transaction.error);
+    });
+}
+
+async function getStationId() {
+    let station = await withStore(META_STORE, 'readonly', store => store.get('station'));
+    if (!station) {
+        station = crypto.randomUUID();
+        await withStore(META_STORE, 'readwrite', store => store.put(station, 'station'));
+    }
+    return station;
+}
+
+function enqueueScan(code, site) {
+    const scan = {id: crypto.randomUUID(), code: code, site: site, scanned_at: Math.floor(Date.now() / 1000)};
+    return withStore(SCAN_STORE, 'readwrite', store => store.add(scan));
+}
+
+function getQueuedScans() {
+    return withStore(SCAN_STORE, 'readonly', store => store.getAll());
+}
+
+function removeScans(scans) {
+    return withStore(SCAN_STORE, 'readwrite', store => {
+        scans.forEach(scan => store.delete(scan.seq));
+    });
+}
+
+async function notifyPages(message) {
+    const pages = await self.clients.matchAll({type: 'window'});
+    pages.forEach(page => page.postMessage(message));
+}
+
+async function sendQueuedScans() {
+    let sent = 0;
+    const rejected = [];
+    for (;;) {
+        const queued = await getQueuedScans();
+        if (!queued.length) {
+            break;
+        }
+        // A batch holds consecutive scans made on the same site, and is sent to that site whatever the station
+        // has switched to since; scans queued without a site go to the station's current one
+        const site = queued[0].site || null;
+        const end = queued.findIndex(scan => (scan.site || null) !== site);
+        const scans = queued.slice(0, end === -1 ? BATCH_SIZE : Math.min(end, BATCH_SIZE));
+
+        const headers = {'Content-Type': 'application/json'};
+        if (site) {
+            headers['X-Site'] = site;
+        }
+        // Throws while still offline; the scans stay queued for the next attempt
+        const response = await fetch(REPLAY_URL, {
+            method: 'POST',
+            headers: headers,
+            body: JSON.stringify({
+                station: await getStationId(),
+                events: scans.map(scan => ({id: scan.id, code: scan.code, scanned_at: scan.scanned_at})),
+            }),
+        });
+        // After any failure the scans stay queued and are sent again on the next attempt
+        if (!response.ok) {
+            throw new Error(`Replaying scans failed with ${response.status}`);
+        }
+
+        // Scans the server answered for are removed, including ones it rejected since it would reject them again;
+        // any others stay queued
+        const results = (await response.json()).results;
+        const answered = new Set(results.map(result => result.id));
+        const done = scans.filter(scan => answered.has(scan.id));
+        if (!done.length) {
+            throw new Error('The server did not acknowledge any queued scan');
+        }
+        const codes = new Map(done.map(scan => [scan.id, scan.code]));
+        const refused = results.filter(result => result.status === 'rejected' && codes.has(result.id));
+        refused.forEach(result => rejected.push({code: codes.get(result.id), error: result.error}));
+
+        await removeScans(done);
+        sent += done.length - refused.length;
+    }
+
+    if (sent || rejected.length) {
+        await notifyPages({type: 'scans-replayed', count: sent, rejected: rejected});
+    }
+    return sent;
+}
+
+// One replay at a time, even when a scan, a sync event and a page message all ask for one
+let replaying = Promise.resolve();
+
+function replayScans() {
+    replaying = replaying.catch(() => {}).then(sendQueuedScans);
+    return replaying;
+}
+
+async function queueScan(code, site) {
+    await enqueueScan(code, site);
+    const waiting = (await getQueuedScans()).length;
+    if (self.registration.sync) {
+        self.registration.sync.register('replay-scans').catch(() => {});
+    }
+    return new Response(
+        `<p style="color: orange;">Offline: scan ${code} saved, ${waiting} waiting to be sent.</p>`,
+        {headers: {'Content-Type': 'text/html; charset=utf-8'}}
+    );
+}
+
+async function handleScan(request, code) {
+    const site = request.headers.get('X-Site');
+    try {
+        await replayScans();
+    } catch (error) {
+        // Earlier scans could not be sent; they are retried later, and this scan still goes out if it can
+        console.warn('Replaying queued scans failed', error);
+    }
+
+    try {
+        return await fetch(request);
+    } catch (error) {
+        // Only a network failure queues the scan; an error response from the server is shown as it is
+        return queueScan(code, site);
+    }
+}
+
+self.addEventListener('fetch', event => {
+    const url = new URL(event.request.url);
+    const match = url.pathname.match(SCAN_PATH);
+    if (event.request.method !== 'GET' || url.origin !== self.location.origin || !match) {
+        return;
+    }
+    event.respondWith(handleScan(event.request, match[1]));
+});
+
+self.addEventListener('sync', event => {
+    if (event.tag === 'replay-scans') {
+        event.waitUntil(replayScans());
+    }
+});
+
+self.addEventListener('message', event => {
+    if (event.data === 'replay-scans') {
+        event.waitUntil(replayScans().catch(() => {}));
+    }
+});
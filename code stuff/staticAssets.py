@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from urllib.parse import quote
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:
+    # Without brotli only the gzip copies are made and served
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Fingerprinted static files. Templates link to assets with asset_url(), which adds a hash of the file's contents
+# (`/static/css/style.css?v=3f2a...`). A request carrying the current hash is cached by the browser for a year
+# without revalidating; any other request is revalidated with the ETag, so a stale link still gets fresh content.
+# Text assets are compressed ahead of time (style.css.gz, style.css.br) and the smallest variant the browser
+# accepts is sent as is. Run `python staticAssets.py` after changing them; the app also does it on startup.
+
+STATIC_DIRECTORY = 'static'
+HASH_LENGTH = 16
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+COMPRESSIBLE_SUFFIXES = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+# Preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Full path -> (mtime_ns, size, hash); a file is only hashed again after it changes
+asset_hashes = {}
+
+
+def get_asset_hash(full_path):
+    try:
+        stat_result = os.stat(full_path)
+    except OSError:
+        return None
+
+    cached = asset_hashes.get(full_path)
+    if cached is not None and cached[:2] == (stat_result.st_mtime_ns, stat_result.st_size):
+        return cached[2]
+
+    digest = hashlib.sha256()
+    with open(full_path, 'rb') as asset_file:
+        for chunk in iter(lambda: asset_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    asset_hash = digest.hexdigest()[:HASH_LENGTH]
+    asset_hashes[full_path] = (stat_result.st_mtime_ns, stat_result.st_size, asset_hash)
+    return asset_hash
+
+
+def asset_url(path):
+    """
+    URL of a static file with its content hash, for templates. Takes a path inside the static directory
+    ('css/style.css') or a stored path that includes it ('static/barcodes/0000000000024.png').
+    """
+    if not path:
+        return ''
+    path = path.replace('\\', '/').lstrip('/')
+    if path.startswith(STATIC_DIRECTORY + '/'):
+        path = path[len(STATIC_DIRECTORY) + 1:]
+
+    url = f'/{STATIC_DIRECTORY}/{quote(path)}'
+    asset_hash = get_asset_hash(os.path.join(STATIC_DIRECTORY, path))
+    return f'{url}?v={asset_hash}' if asset_hash else url
+
+
+def get_accepted_encodings(accept_encoding):
+    accepted = set()
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def get_precompressed(full_path, stat_result, accept_encoding):
+    """
+    The best precompressed copy of a file the client accepts, as (path, encoding, stat result), or the file
+    itself with encoding None. Copies older than the file are ignored.
+    """
+    accepted = get_accepted_encodings(accept_encoding)
+    for encoding, suffix in ENCODINGS:
+        if encoding not in accepted:
+            continue
+        try:
+            compressed_stat = os.stat(str(full_path) + suffix)
+        except OSError:
+            continue
+        if compressed_stat.st_mtime_ns >= stat_result.st_mtime_ns:
+            return str(full_path) + suffix, encoding, compressed_stat
+    return full_path, None, stat_result
+
+
+class AssetFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        media_type = mimetypes.guess_type(str(full_path))[0] or 'text/plain'
+
+        headers = {}
+        served_path, encoding, served_stat = full_path, None, stat_result
+        if str(full_path).endswith(COMPRESSIBLE_SUFFIXES):
+            served_path, encoding, served_stat = get_precompressed(full_path, stat_result,
+                                                                   request_headers.get('accept-encoding', ''))
+            headers['Vary'] = 'Accept-Encoding'
+            if encoding:
+                headers['Content-Encoding'] = encoding
+
+        version = QueryParams(scope.get('query_string', b'')).get('v')
+        if version and version == get_asset_hash(str(full_path)):
+            headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        else:
+            headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+
+        response = FileResponse(served_path, status_code=status_code, headers=headers, media_type=media_type,
+                                stat_result=served_stat)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def precompress_assets(directory=STATIC_DIRECTORY):
+    """
+    Write .gz (and .br, when brotli is installed) copies of the text assets that are missing or out of date.
+    Returns how many copies were written.
+    """
+    written = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if not name.endswith(COMPRESSIBLE_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            source_mtime = os.stat(path).st_mtime_ns
+            data = None
+            for encoding, suffix in ENCODINGS:
+                if encoding == 'br' and brotli is None:
+                    continue
+                target = path + suffix
+                if os.path.exists(target) and os.stat(target).st_mtime_ns >= source_mtime:
+                    continue
+                if data is None:
+                    with open(path, 'rb') as source_file:
+                        data = source_file.read()
+                if encoding == 'br':
+                    compressed = brotli.compress(data, quality=11)
+                else:
+                    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+                with open(target, 'wb') as target_file:
+                    target_file.write(compressed)
+                written += 1
+                logger.debug("asset_compressed path=%s encoding=%s size=%d compressed=%d",
+                             path, encoding, len(data), len(compressed))
+    return written
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s level=%(levelname)s logger=%(name)s %(message)s")
+    print(f"Wrote {precompress_assets()} compressed files")
@@ -0,0 +1,117 @@
+import json
+
+from itemTimestamps import now_epoch, format_epoch
+
+# Every row inside a box, the box included. PARENT is a TEXT column, so FIND values are carried as text to let
+# the join use idx_storage_parent. UNION (not UNION ALL) stops the recursion if the tree ever contains a cycle.
+SUBTREE_CTE = '''WITH RECURSIVE subtree(FIND) AS (
+        SELECT CAST(? AS TEXT)
+        UNION
+        SELECT CAST(child.FIND AS TEXT) FROM storage AS child JOIN subtree ON child.PARENT = subtree.FIND
+    )'''
+
+ROOT_ID = 1
+
+
+def is_in_subtree(cursor, box_id, find):
+    # True when `find` is `box_id` itself or anywhere inside it, i.e. when moving the box into `find` makes a cycle
+    cursor.execute(SUBTREE_CTE + ' SELECT 1 FROM subtree WHERE FIND = CAST(? AS TEXT) LIMIT 1;', (box_id, find))
+    return cursor.fetchone() is not None
+
+
+def get_unreferenced_images(cursor, image_paths):
+    # Uploaded photos are stored by file name, so the same file can be shared by several rows
+    image_paths = set(image_paths)
+    if image_paths:
+        cursor.execute('SELECT IMG_PATH FROM storage WHERE IMG_PATH IS NOT NULL;')
+        for (img_path_json,) in cursor.fetchall():
+            image_paths.difference_update(json.loads(img_path_json))
+    return sorted(image_paths)
+
+
+def delete_subtree(connection, box_id):
+    """
+    Delete a box and everything inside it in one transaction.
+    Returns the deleted FIND values and the files that are no longer referenced by any row.
+    """
+    if box_id == ROOT_ID:
+        raise ValueError("The root directory cannot be deleted.")
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE;')
+        cursor.execute(SUBTREE_CTE + '''
+            SELECT FIND, BARCODE_IMG_PATH, IMG_PATH FROM storage WHERE FIND IN (SELECT FIND FROM subtree);
+        ''', (box_id,))
+        deleted_rows = cursor.fetchall()
+
+        if not deleted_rows:
+            raise ValueError(f"Box {box_id} does not exist.")
+
+        cursor.execute(SUBTREE_CTE + ' DELETE FROM id_tracker WHERE id IN (SELECT FIND FROM subtree);', (box_id,))
+        cursor.execute(SUBTREE_CTE + ' DELETE FROM storage WHERE FIND IN (SELECT FIND FROM subtree);', (box_id,))
+
+        deleted_images = set()
+        for row in deleted_rows:
+            if row[2]:
+                deleted_images.update(json.loads(row[2]))
+        unused_images = get_unreferenced_images(cursor, deleted_images)
+
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    unused_files = [row[1] for row in deleted_rows if row[1]] + unused_images
+    return [row[0] for row in deleted_rows], unused_files
+
+
+def move_subtree(connection, box_id, new_parent):
+    """
+    Move a box (and so everything inside it) into another box, refusing moves into its own subtree.
+    """
+    if box_id == ROOT_ID:
+        raise ValueError("The root directory cannot be moved.")
+
+    cursor = connection.cursor()
+    current_time = now_epoch()
+    cursor.execute(SUBTREE_CTE + '''
+        UPDATE storage SET PARENT = ?, DATE_MODIFIED = ?, MODIFIED_AT = ?
+        WHERE FIND = ?
+            AND EXISTS (SELECT 1 FROM storage WHERE FIND = ? AND TYPE = "BOX")
+            AND CAST(? AS TEXT) NOT IN (SELECT FIND FROM subtree);
+    ''', (box_id, new_parent, format_epoch(current_time), current_time, box_id, new_parent, new_parent))
+
+    # cursor.rowcount is not reported for statements that start with WITH
+    cursor.execute('SELECT changes();')
+    moved = cursor.fetchone()[0]
+    connection.commit()
+
+    if not moved:
+        raise ValueError(f"Cannot move {box_id} into {new_parent}: it is missing, not a box, or inside {box_id}.")
+
+
+def flatten_subtree(connection, box_id):
+    """
+    Move everything nested anywhere inside a box directly into that box.
+    Returns the FIND values that were moved.
+    """
+    cursor = connection.cursor()
+    current_time = now_epoch()
+    try:
+        cursor.execute('BEGIN IMMEDIATE;')
+        cursor.execute(SUBTREE_CTE + '''
+            SELECT FIND FROM storage WHERE FIND IN (SELECT FIND FROM subtree) AND FIND != ? AND PARENT != ?;
+        ''', (box_id, box_id, box_id))
+        moved_ids = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(SUBTREE_CTE + '''
+            UPDATE storage SET PARENT = ?, DATE_MODIFIED = ?, MODIFIED_AT = ?
+            WHERE FIND IN (SELECT FIND FROM subtree) AND FIND != ? AND PARENT != ?;
+        ''', (box_id, box_id, format_epoch(current_time), current_time, box_id, box_id))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    return moved_ids
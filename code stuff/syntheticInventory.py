@@ -0,0 +1,117 @@
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+# Builds synthetic inventories for the benchmarks.
+# Usage: python syntheticInventory.py <db_path> [row_count] [depth]
+
+ROOT_ID = 1
+
+NAME_WORDS = ["screwdriver", "cable", "battery", "propeller", "charger", "bolt", "sensor", "drill bit",
+              "fiberglass sheet", "notecard box", "motor", "wristband", "display tag", "fan", "hotend"]
+
+
+def get_find(unique_id):
+    # Same FIND as the app assigns: the id padded to 12 digits plus its EAN-13 check digit
+    digits = str(unique_id).zfill(12)
+    total = sum(int(digit) * (3 if index % 2 else 1) for index, digit in enumerate(digits))
+    return unique_id * 10 + (10 - total % 10) % 10
+
+
+def create_schema(connection):
+    # Mirrors setup_database() in app.py
+    cursor = connection.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS id_tracker (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT
+                    );''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS storage (
+            FIND INTEGER PRIMARY KEY NOT NULL,
+            NAME TEXT NOT NULL,
+            TYPE TEXT NOT NULL,
+            DESCRIPTION TEXT NULL,
+            WEIGHT INTEGER NULL,
+            BARCODE_NUMBER INTEGER NULL,
+            BARCODE_IMG_PATH TEXT NULL,
+            DATE_CREATED TEXT NOT NULL,
+            DATE_MODIFIED TEXT NOT NULL,
+            PARENT TEXT NULL,
+            IMG_PATH TEXT NULL,
+            COST REAL NULL
+        );''')
+    connection.commit()
+
+
+def generate_inventory(connection, row_count, depth=6, box_ratio=0.05, name_count=500, seed=0):
+    """
+    Fill an empty database with `row_count` rows: a root box, nested boxes at least `depth` levels deep,
+    and items spread over the boxes. Items share a small pool of names so many of them have the same name.
+    Returns a dict with the FIND values of the boxes and items and the names used.
+    """
+    rng = random.Random(seed)
+    create_schema(connection)
+    cursor = connection.cursor()
+
+    now = datetime.now()
+    oldest = now - timedelta(days=730)
+
+    def random_date():
+        return (oldest + timedelta(seconds=rng.randint(0, 730 * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+
+    current_date = now.strftime("%Y-%m-%d %H:%M:%S")
+    rows = [(ROOT_ID, "rootdirectory", "BOX", None, None, None, None, current_date, current_date, None, None, None)]
+
+    box_count = max(depth, int(row_count * box_ratio))
+    boxes = [ROOT_ID]
+    box_depths = {ROOT_ID: 0}
+    items = []
+    names = [f"{rng.choice(NAME_WORDS)} {index}" for index in range(name_count)]
+
+    for unique_id in range(2, row_count + 1):
+        find = get_find(unique_id)
+        created = random_date()
+
+        if len(boxes) <= box_count:
+            # The first boxes form a single chain so the tree is always `depth` levels deep
+            if len(boxes) <= depth:
+                parent = boxes[-1]
+            else:
+                parent = rng.choice(boxes)
+                while box_depths[parent] >= depth:
+                    parent = rng.choice(boxes)
+            item_type = "BOX"
+            name = f"box {unique_id}"
+            boxes.append(find)
+            box_depths[find] = box_depths[parent] + 1
+        else:
+            parent = rng.choice(boxes)
+            item_type = "ITEM"
+            name = rng.choice(names)
+            items.append(find)
+
+        rows.append((find, name, item_type, "synthetic", rng.randint(0, 50), find,
+                     f"static/barcodes/{str(find).zfill(13)}.png", created, created, str(parent), None,
+                     round(rng.uniform(0, 200), 2)))
+
+        if len(rows) >= 50000:
+            cursor.executemany('INSERT INTO storage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);', rows)
+            rows = []
+
+    cursor.executemany('INSERT INTO storage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);', rows)
+
+    # Continue the id sequence after the generated rows so new items get fresh FIND values
+    cursor.execute('INSERT INTO id_tracker (id) VALUES (?);', (row_count,))
+    connection.commit()
+
+    return {'boxes': boxes, 'items': items, 'names': names}
+
+
+if __name__ == "__main__":
+    db_path = sys.argv[1]
+    row_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    depth = int(sys.argv[3]) if len(sys.argv) > 3 else 6
+
+    connection = sqlite3.connect(db_path)
+    inventory = generate_inventory(connection, row_count, depth)
+    connection.close()
+    print(f"Created {len(inventory['boxes'])} boxes and {len(inventory['items'])} items in {db_path}")
@@ -0,0 +1,75 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# The app finds its templates, static files and modules relative to its own directory
+APP_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIRECTORY)
+os.chdir(APP_DIRECTORY)
+# No background reconciler while testing
+os.environ["POTATODB_RECONCILE_INTERVAL"] = "0"
+
+from benchmark import install_stub_backends  # noqa: E402
+from syntheticInventory import generate_inventory  # noqa: E402
+
+# Same printer and barcode stubs as the benchmark; they have to be in place before app.py is imported
+install_stub_backends()
+
+import app  # noqa: E402
+import boxCache  # noqa: E402
+import itemTimestamps  # noqa: E402
+import sites  # noqa: E402
+
+ROW_COUNT = 300
+DEPTH = 4
+
+
+@pytest.fixture
+def inventory(tmp_path, monkeypatch):
+    """
+    A synthetic inventory in a fresh database, served as the default site. Returns the dict from
+    generate_inventory() with the database path added as 'db_path', and the files the app asked to remove as
+    'removed_files'.
+    """
+    db_path = str(tmp_path / "storage.db")
+    connection = sqlite3.connect(db_path)
+    inventory = generate_inventory(connection, ROW_COUNT, DEPTH, seed=1)
+    connection.close()
+
+    monkeypatch.setitem(sites.SITES, sites.DEFAULT_SITE, db_path)
+    monkeypatch.setattr(app, "is_printer_connected", lambda printer_name: True)
+    monkeypatch.setattr(app, "printer_status", None)
+    # The synthetic rows point at the real barcode directory, so deletes must not remove anything from disk
+    inventory['removed_files'] = []
+    monkeypatch.setattr(app, "queue_file_cleanup", inventory['removed_files'].extend)
+
+    # Module-level state left over from an earlier test's database
+    sites.site_caches.clear()
+    boxCache.rendered_boxes.clear()
+    app.last_scanned_items.clear()
+    app.replayed_scan_items.clear()
+    itemTimestamps.pending_scans.clear()
+
+    inventory['db_path'] = db_path
+    yield inventory
+
+    itemTimestamps.pending_scans.clear()
+
+
+@pytest.fixture
+def client(inventory):
+    from fastapi.testclient import TestClient
+
+    # Entering the client runs the lifespan: migrations, scan index and prefix index
+    with TestClient(app.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db(client, inventory):
+    # A second connection to the served database, opened after the migrations ran
+    connection = sqlite3.connect(inventory['db_path'])
+    yield connection
+    connection.close()
@@ -0,0 +1,96 @@
+import io
+import os
+import sqlite3
+import tarfile
+
+import pytest
+
+from backup import get_sync_state, restore_snapshot, take_snapshot, verify_snapshot
+
+
+@pytest.fixture
+def files(tmp_path, db, inventory):
+    # Barcode images for the first few items, under a separate base directory
+    base_dir = tmp_path / "files"
+    paths = []
+    for find in inventory['items'][:3]:
+        path = db.execute('SELECT BARCODE_IMG_PATH FROM storage WHERE FIND = ?;', (find,)).fetchone()[0]
+        os.makedirs(base_dir / os.path.dirname(path), exist_ok=True)
+        (base_dir / path).write_bytes(f"barcode {find}".encode())
+        paths.append(path)
+    return str(base_dir), paths
+
+
+def test_snapshot_holds_the_database_and_files(tmp_path, inventory, files):
+    base_dir, paths = files
+    archive_path, manifest = take_snapshot(inventory['db_path'], str(tmp_path / "backups"), base_dir=base_dir)
+
+    assert sorted(manifest['files']) == sorted(paths)
+    # Rows whose barcode image was never written are listed rather than failing the snapshot
+    assert len(manifest['missing_files']) == len(inventory['boxes'] + inventory['items']) - 1 - len(paths)
+    verified, archives = verify_snapshot(archive_path)
+    for archive in archives.values():
+        archive.close()
+    assert verified == manifest
+
+
+def test_verify_rejects_a_damaged_file(tmp_path, inventory, files):
+    base_dir, paths = files
+    archive_path, manifest = take_snapshot(inventory['db_path'], str(tmp_path / "backups"), base_dir=base_dir)
+
+    # Rewrite the archive with one file changed
+    damaged_path = str(tmp_path / "damaged.tar.gz")
+    with tarfile.open(archive_path, 'r:gz') as source, tarfile.open(damaged_path, 'w:gz') as target:
+        for member in source.getmembers():
+            data = source.extractfile(member).read()
+            if member.name == 'files/' + paths[0]:
+                data = b'x' * len(data)
+            target.addfile(member, io.BytesIO(data))
+    os.replace(damaged_path, archive_path)
+
+    with pytest.raises(ValueError):
+        verify_snapshot(archive_path)
+
+
+def test_incremental_snapshot_only_stores_changed_files(tmp_path, inventory, files):
+    base_dir, paths = files
+    dest = str(tmp_path / "backups")
+    first_path, first = take_snapshot(inventory['db_path'], dest, base_dir=base_dir)
+
+    changed = os.path.join(base_dir, paths[0])
+    with open(changed, 'ab') as changed_file:
+        changed_file.write(b' reprinted')
+    second_path, second = take_snapshot(inventory['db_path'], dest, incremental=True, base_dir=base_dir)
+
+    assert second['incremental'] and second['base'] == first['name']
+    assert second['files'][paths[0]]['archive'] == os.path.basename(second_path)
+    assert second['files'][paths[1]]['archive'] == os.path.basename(first_path)
+    with tarfile.open(second_path, 'r:gz') as archive:
+        assert [name for name in archive.getnames() if name.startswith('files/')] == ['files/' + paths[0]]
+
+    # Verifying follows the manifest back to the first archive
+    manifest, archives = verify_snapshot(second_path)
+    for archive in archives.values():
+        archive.close()
+
+
+def test_restore_moves_sync_state_past_the_replaced_database(tmp_path, client, db, inventory, files):
+    base_dir, paths = files
+    archive_path, manifest = take_snapshot(inventory['db_path'], str(tmp_path / "backups"), base_dir=base_dir)
+
+    # Changes made after the snapshot are lost by the restore, so clients that saw them must start over
+    client.get(f"/delete/{inventory['items'][0]}")
+    latest_seq, page_version = get_sync_state(inventory['db_path'])
+    os.remove(os.path.join(base_dir, paths[1]))
+
+    restore_snapshot(archive_path, inventory['db_path'], base_dir=base_dir)
+
+    restored = sqlite3.connect(inventory['db_path'])
+    assert restored.execute('SELECT COUNT(*) FROM storage WHERE FIND = ?;',
+                            (inventory['items'][0],)).fetchone()[0] == 1
+    horizon = restored.execute('SELECT SEQ FROM change_log_horizon;').fetchone()[0]
+    restored.close()
+    assert horizon > latest_seq
+    assert get_sync_state(inventory['db_path'])[1] > page_version
+    assert os.path.isfile(os.path.join(base_dir, paths[1]))
+    assert client.get(f'/changes?since={latest_seq}').status_code == 410
@@ -0,0 +1,50 @@
+import barcodeIndex
+from barcodeIndex import lookup_scan
+
+
+def select_scan(db, item_id, stripped_item_id):
+    return db.execute('SELECT * FROM storage WHERE FIND = ? OR NAME = ?', (stripped_item_id, item_id)).fetchall()
+
+
+def test_lookup_matches_the_query_it_replaces(db, inventory):
+    for find in inventory['items'][:20] + inventory['boxes'][:5]:
+        code = str(find).zfill(13)
+        assert lookup_scan(db, code, code.lstrip('0')) == select_scan(db, code, code.lstrip('0'))
+
+
+def test_lookup_falls_back_to_the_database_for_rows_written_elsewhere(db, inventory):
+    find = inventory['items'][0]
+    db.execute('UPDATE storage SET NAME = ? WHERE FIND = ?;', ('12345', find))
+    db.commit()
+
+    rows = lookup_scan(db, '12345', '12345')
+    assert [row[0] for row in rows] == [find]
+    # The row read from the database is kept, so the next scan is answered from memory
+    assert barcodeIndex.get_index().rows_by_find[find][1] == '12345'
+
+
+def test_index_follows_renames_and_deletes(client, db, inventory):
+    find = inventory['items'][1]
+    row = db.execute('SELECT DESCRIPTION, WEIGHT, PARENT FROM storage WHERE FIND = ?;', (find,)).fetchone()
+    response = client.post(f'/modify/{find}', data={'name': '4242', 'description': row[0], 'weight': row[1],
+                                                    'parent': row[2], 'cost': '3'}, follow_redirects=False)
+    assert response.status_code == 303
+    assert [found[0] for found in lookup_scan(db, '4242', '4242')] == [find]
+
+    assert client.get(f'/delete/{find}', follow_redirects=False).status_code == 303
+    assert find not in barcodeIndex.get_index().rows_by_find
+    assert lookup_scan(db, '4242', '4242') == []
+
+
+def test_scan_finds_the_row_by_barcode(client, inventory):
+    find = inventory['items'][2]
+    response = client.get(f'/search/{str(find).zfill(13)}')
+    assert response.status_code == 200
+    assert 'does not exist' not in response.text
+
+
+def test_non_ascii_digits_are_not_treated_as_a_barcode(client):
+    # '²' passes str.isdigit() but int() refuses it
+    response = client.get('/search/²')
+    assert response.status_code == 200
+    assert '² does not exist' in response.text
@@ -0,0 +1,74 @@
+import boxCache
+
+
+def get_child(db, box):
+    return db.execute('SELECT FIND, NAME, DESCRIPTION, WEIGHT, PARENT FROM storage WHERE PARENT = ? AND TYPE = "ITEM";',
+                      (str(box),)).fetchone()
+
+
+def test_unchanged_box_is_answered_with_304(client, inventory):
+    box = inventory['boxes'][2]
+    response = client.get(f'/?box_id={box}')
+    assert response.status_code == 200
+    etag = response.headers['etag']
+
+    response = client.get(f'/?box_id={box}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['etag'] == etag
+    assert response.content == b''
+
+
+def test_repeated_view_is_served_from_the_rendered_box_cache(client, inventory):
+    box = inventory['boxes'][2]
+    first = client.get(f'/?box_id={box}')
+    assert boxCache.get_cached_box(first.headers['etag']) == first.content
+
+    second = client.get(f'/?box_id={box}')
+    assert second.headers['etag'] == first.headers['etag']
+    assert second.content == first.content
+
+
+def test_editing_a_child_changes_the_box_etag(client, db, inventory):
+    box = next(box for box in inventory['boxes'][1:] if get_child(db, box))
+    etag = client.get(f'/?box_id={box}').headers['etag']
+
+    find, name, description, weight, parent = get_child(db, box)
+    response = client.post(f'/modify/{find}', data={'name': 'renamed child', 'description': description,
+                                                    'weight': weight, 'parent': parent, 'cost': ''},
+                           follow_redirects=False)
+    assert response.status_code == 303
+
+    response = client.get(f'/?box_id={box}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+    assert 'renamed child' in response.text
+
+
+def test_adding_a_child_changes_the_box_etag(client, inventory):
+    box = inventory['boxes'][3]
+    etag = client.get(f'/?box_id={box}').headers['etag']
+
+    response = client.post('/add/ITEM', data={'name': 'new child', 'description': 'added', 'weight': 1,
+                                              'parent': str(box), 'cost': ''}, follow_redirects=False)
+    assert response.status_code == 303
+
+    response = client.get(f'/?box_id={box}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'new child' in response.text
+
+
+def test_box_versions_follow_moves(client, db, inventory):
+    old_parent = next(box for box in inventory['boxes'][1:-1] if get_child(db, box))
+    new_parent = inventory['boxes'][-1]
+    find = get_child(db, old_parent)[0]
+
+    def version(box):
+        row = db.execute('SELECT VERSION FROM box_versions WHERE BOX = ?;', (box,)).fetchone()
+        return row[0] if row else 0
+
+    before = version(old_parent), version(new_parent)
+    db.execute('UPDATE storage SET PARENT = ? WHERE FIND = ?;', (str(new_parent), find))
+    db.commit()
+    # Both the box it left and the box it went into are shown differently now
+    assert version(old_parent) > before[0]
+    assert version(new_parent) > before[1]
@@ -0,0 +1,81 @@
+import json
+
+from changeFeed import compact_change_log, get_change_horizon
+
+
+def read_changes(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def modify(client, db, find, **changes):
+    row = db.execute('SELECT NAME, DESCRIPTION, WEIGHT, PARENT, COST FROM storage WHERE FIND = ?;', (find,)).fetchone()
+    data = dict(zip(('name', 'description', 'weight', 'parent', 'cost'), row))
+    data['cost'] = '' if data['cost'] is None else str(data['cost'])
+    data.update(changes)
+    assert client.post(f'/modify/{find}', data=data, follow_redirects=False).status_code == 303
+
+
+def test_changes_after_a_sequence_number(client, db, inventory):
+    latest = int(client.get('/changes').headers['x-latest-seq'])
+    assert read_changes(client.get(f'/changes?since={latest}')) == []
+
+    find, deleted = inventory['items'][0], inventory['items'][1]
+    modify(client, db, find, name='first name')
+    modify(client, db, find, name='second name')
+    client.get(f'/delete/{deleted}')
+
+    changes = read_changes(client.get(f'/changes?since={latest}'))
+    # Only the latest change of each row is sent, with the row as it is now
+    assert [(change['find'], change['op']) for change in changes] == [(find, 'UPDATE'), (deleted, 'DELETE')]
+    assert changes[0]['item']['name'] == 'second name'
+    assert changes[1]['item'] is None
+    assert changes[0]['seq'] > latest
+
+
+def test_limit_pages_through_the_changes(client, db, inventory):
+    latest = int(client.get('/changes').headers['x-latest-seq'])
+    for find in inventory['items'][:3]:
+        modify(client, db, find, description='paged')
+
+    first_page = read_changes(client.get(f'/changes?since={latest}&limit=2'))
+    second_page = read_changes(client.get(f"/changes?since={first_page[-1]['seq']}&limit=2"))
+    assert [change['find'] for change in first_page + second_page] == inventory['items'][:3]
+
+
+def test_snapshot_then_changes_misses_nothing(client, db, inventory):
+    response = client.get('/changes/snapshot')
+    rows = read_changes(response)
+    assert len(rows) == db.execute('SELECT COUNT(*) FROM storage;').fetchone()[0]
+    assert all(row['op'] == 'INSERT' for row in rows)
+
+    modify(client, db, inventory['items'][0], name='after the snapshot')
+    changes = read_changes(client.get(f"/changes?since={response.headers['x-latest-seq']}"))
+    assert [change['item']['name'] for change in changes] == ['after the snapshot']
+
+
+def test_changes_older_than_the_horizon_are_gone(client, db, inventory):
+    # A row deleted long ago has been compacted away, so a client that last synced before it has to start over
+    client.get(f"/delete/{inventory['items'][0]}")
+    db.execute("UPDATE change_log SET CHANGED_AT = datetime('now', '-60 days') WHERE OPERATION = 'DELETE';")
+    db.commit()
+    superseded, expired = compact_change_log(db)
+    assert expired == 1
+    horizon = get_change_horizon(db.cursor())
+
+    response = client.get(f'/changes?since={horizon - 1}')
+    assert response.status_code == 410
+    assert response.json()['horizon'] == horizon
+    assert client.get(response.json()['snapshot']).status_code == 200
+    assert client.get(f'/changes?since={horizon}').status_code == 200
+
+
+def test_compaction_keeps_the_latest_change_of_each_row(client, db, inventory):
+    find = inventory['items'][0]
+    modify(client, db, find, name='one')
+    modify(client, db, find, name='two')
+
+    superseded, expired = compact_change_log(db)
+    assert superseded > 0
+    assert expired == 0
+    assert db.execute('SELECT COUNT(*) FROM change_log WHERE FIND = ?;', (find,)).fetchone()[0] == 1
+    assert db.execute('SELECT COUNT(*) FROM change_log GROUP BY FIND HAVING COUNT(*) > 1;').fetchall() == []
@@ -0,0 +1,50 @@
+from fuzzySearch import fuzzy_search, get_trigrams, similarity
+
+
+def add_item(client, inventory, name, description):
+    response = client.post('/add/ITEM', data={'name': name, 'description': description, 'weight': 1,
+                                              'parent': str(inventory['boxes'][1]), 'cost': ''},
+                           follow_redirects=False)
+    assert response.status_code == 303
+
+
+def test_similarity_of_a_transposition():
+    assert similarity([get_trigrams('screwdirver')], 'screwdriver') > 0.4
+    assert similarity([get_trigrams('screwdirver')], 'propeller') < 0.1
+
+
+def test_misspelled_name_finds_the_item(client, db, inventory):
+    add_item(client, inventory, 'Phillips screwdriver', 'magnetic tip')
+    rows = fuzzy_search(db, 'screwdirver')
+    assert rows and all('screwdriver' in row[1] for row in rows)
+
+    text = client.get('/search/phillps screwdirver').text
+    assert 'Phillips screwdriver' in text
+    assert 'does not exist' not in text
+
+
+def test_exact_name_comes_first_among_equal_scores(client, db, inventory):
+    add_item(client, inventory, 'torque wrench', 'calibrated')
+    add_item(client, inventory, 'wrench torque', 'calibrated')
+    assert fuzzy_search(db, 'torque wrench')[0][1] == 'torque wrench'
+
+
+def test_misspelled_description_finds_the_item(client, db, inventory):
+    add_item(client, inventory, 'spare jacket', 'waterproof shell')
+    rows = fuzzy_search(db, 'watrproof')
+    assert [row[1] for row in rows] == ['spare jacket']
+
+
+def test_renamed_rows_are_found_by_their_new_name(client, db, inventory):
+    # The vocabulary is built on the first search and then only follows the change log
+    fuzzy_search(db, 'anything')
+    find = inventory['items'][0]
+    row = db.execute('SELECT DESCRIPTION, WEIGHT, PARENT FROM storage WHERE FIND = ?;', (find,)).fetchone()
+    client.post(f'/modify/{find}', data={'name': 'oscilloscope', 'description': row[0], 'weight': row[1],
+                                         'parent': row[2], 'cost': ''}, follow_redirects=False)
+    assert [found[0] for found in fuzzy_search(db, 'osciloscope')] == [find]
+
+
+def test_nothing_close_is_not_found(client, db):
+    assert fuzzy_search(db, 'qqzzxxjj') == []
+    assert 'qqzzxxjj does not exist' in client.get('/search/qqzzxxjj').text
@@ -0,0 +1,43 @@
+import re
+
+HX = {'HX-Request': 'true'}
+
+
+def get_oob_ids(html):
+    return set(re.findall(r'<div[^>]*\bid="([\w-]+)"[^>]*hx-swap-oob="true"', html))
+
+
+def test_full_page_without_htmx(client):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert '<html' in response.text
+    assert 'hx-swap-oob' not in response.text
+    assert response.headers['vary'] == 'HX-Request'
+
+
+def test_htmx_request_gets_the_body_and_out_of_band_fragments(client, inventory):
+    response = client.get(f"/?box_id={inventory['boxes'][1]}", headers=HX)
+    assert response.status_code == 200
+    assert '<html' not in response.text
+    assert get_oob_ids(response.text) == {'header', 'stats', 'search-error'}
+
+
+def test_htmx_and_full_page_are_cached_apart(client):
+    page = client.get('/')
+    fragment = client.get('/', headers=HX)
+    assert page.headers['etag'] != fragment.headers['etag']
+    assert '<html' in client.get('/').text
+
+
+def test_htmx_delete_only_sends_the_stats(client, inventory):
+    response = client.get(f"/delete/{inventory['items'][0]}", headers=HX)
+    assert response.status_code == 200
+    assert get_oob_ids(response.text) == {'stats'}
+    assert 'id="header"' not in response.text
+
+
+def test_htmx_search_error_is_swapped_out_of_band(client):
+    response = client.get('/search/nothing-is-called-this-zzqx', headers=HX)
+    assert response.status_code == 200
+    assert 'search-error' in get_oob_ids(response.text)
+    assert 'does not exist' in response.text
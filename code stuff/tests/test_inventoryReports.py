@@ -0,0 +1,96 @@
+import re
+
+import pytest
+
+from app import parse_cost
+from subtreeOps import SUBTREE_CTE
+
+
+def get_subtree_value(db, box_id):
+    # Total cost of the box and everything in it, and the number of items in it
+    return db.execute(SUBTREE_CTE + " SELECT IFNULL(SUM(COST), 0), SUM(TYPE = 'ITEM') FROM storage "
+                      'WHERE FIND IN (SELECT FIND FROM subtree);', (box_id,)).fetchone()
+
+
+@pytest.mark.parametrize('text, cost', [('12.5', 12.5), ('$1,234.567', 1234.57), ('  ', None), ('', None),
+                                        ('0', 0.0)])
+def test_parse_cost(text, cost):
+    assert parse_cost(text) == cost
+
+
+@pytest.mark.parametrize('text', ['abc', '-1', 'nan', 'inf', '1e400', '12 dollars'])
+def test_parse_cost_refuses_anything_but_a_number(text):
+    with pytest.raises(ValueError):
+        parse_cost(text)
+
+
+def test_inventory_report_adds_up_the_rows(client, db):
+    report = client.get('/api/v1/reports/inventory').json()
+    total_value, item_count = get_subtree_value(db, 1)
+    assert report['total_value'] == round(total_value, 2)
+    assert report['item_count'] == item_count
+    assert report['box_count'] == db.execute("SELECT COUNT(*) FROM storage WHERE TYPE = 'BOX';").fetchone()[0]
+
+    values = [box['value'] for box in report['most_valuable_boxes']]
+    assert values == sorted(values, reverse=True)
+    assert 1 not in [box['id'] for box in report['most_valuable_boxes']]
+
+
+def test_box_valuation_covers_the_whole_subtree(client, db, inventory):
+    box = inventory['boxes'][1]
+    valuation = client.get(f'/api/v1/reports/boxes/{box}').json()
+    total_value, item_count = get_subtree_value(db, box)
+    assert valuation['value'] == pytest.approx(total_value, abs=0.01)
+    assert valuation['item_count'] == item_count
+    assert client.get('/api/v1/reports/boxes/999999').status_code == 404
+
+
+def test_reports_follow_changes(client, db, inventory):
+    box = inventory['boxes'][1]
+    before = client.get(f'/api/v1/reports/boxes/{box}').json()
+
+    response = client.post('/add/ITEM', data={'name': 'expensive', 'description': 'new', 'weight': 2,
+                                              'parent': str(box), 'cost': '$1,000'}, follow_redirects=False)
+    assert response.status_code == 303
+
+    after = client.get(f'/api/v1/reports/boxes/{box}').json()
+    assert after['value'] == pytest.approx(before['value'] + 1000, abs=0.01)
+    assert after['item_count'] == before['item_count'] + 1
+    assert after['version'] > before['version']
+
+
+def test_add_with_an_invalid_cost_shows_the_form_again(client, db, inventory):
+    row_count = db.execute('SELECT COUNT(*) FROM storage;').fetchone()[0]
+    response = client.post('/add/ITEM', data={'name': 'priceless', 'description': 'new', 'weight': 1,
+                                              'parent': str(inventory['boxes'][1]), 'cost': 'a lot'})
+    assert response.status_code == 200
+    assert "Cost must be a number, not &#39;a lot&#39;." in response.text
+    assert db.execute('SELECT COUNT(*) FROM storage;').fetchone()[0] == row_count
+
+
+def test_modify_with_an_invalid_cost_keeps_the_entered_values(client, db, inventory):
+    find = inventory['items'][0]
+    row = db.execute('SELECT * FROM storage WHERE FIND = ?;', (find,)).fetchone()
+
+    response = client.post(f'/modify/{find}', data={'name': 'edited name', 'description': 'edited', 'weight': 7,
+                                                    'parent': row[9], 'cost': 'twelve'})
+    assert response.status_code == 200
+    assert "Cost must be a number, not &#39;twelve&#39;." in response.text
+    assert 'value="edited name"' in response.text
+    assert f'/modify/{find}' in response.text
+    assert db.execute('SELECT * FROM storage WHERE FIND = ?;', (find,)).fetchone() == row
+
+
+def test_clone_form_leaves_missing_values_blank(client, db, inventory):
+    find = inventory['items'][0]
+    db.execute('UPDATE storage SET COST = NULL, DESCRIPTION = NULL, WEIGHT = NULL WHERE FIND = ?;', (find,))
+    db.commit()
+
+    text = client.get(f'/modify/{find}').text
+    clone_form = re.search(r'<form method="POST" action="/add/ITEM".*?</form>', text, re.S).group(0)
+    assert 'None' not in clone_form
+    assert '<input type="hidden" name="weight" value="0">' in clone_form
+
+    # Cloning such an item works instead of failing on the cost
+    fields = dict(re.findall(r'name="(\w+)" value="([^"]*)"', clone_form))
+    assert client.post('/add/ITEM', data=fields, follow_redirects=False).status_code == 303
@@ -0,0 +1,93 @@
+import app
+import itemTimestamps
+from itemTimestamps import flush_scans, format_epoch, get_last_scan, now_epoch, queue_scanned
+
+
+def connect(site_id):
+    return app.connect_db(site_id=site_id)
+
+
+def get_row(db, find):
+    return db.execute('SELECT MODIFIED_AT, LAST_SCANNED_AT FROM storage WHERE FIND = ?;', (find,)).fetchone()
+
+
+def count_changes(db):
+    return (db.execute('SELECT COUNT(*) FROM change_log;').fetchone()[0],
+            db.execute('SELECT SUM(VERSION) FROM box_versions;').fetchone()[0])
+
+
+def test_migration_fills_in_epoch_times(db, inventory):
+    created, modified, date_created = db.execute('SELECT CREATED_AT, MODIFIED_AT, DATE_CREATED FROM storage '
+                                                 'WHERE FIND = ?;', (inventory['items'][0],)).fetchone()
+    assert created == modified
+    assert format_epoch(created) == date_created
+
+
+def test_move_sets_modified_at(client, db, inventory):
+    box = inventory['boxes'][2]
+    start = now_epoch()
+    client.post(f'/move-tree/{box}', data={'parent': inventory['boxes'][-1]}, follow_redirects=False)
+    assert get_row(db, box)[0] >= start
+
+
+def test_live_scan_is_queued_and_written_in_a_batch(client, db, inventory):
+    find = inventory['items'][0]
+    before = count_changes(db)
+
+    client.get(f'/search/{str(find).zfill(13)}')
+    # Nothing is written yet, but Last Scan already shows the scan
+    assert get_row(db, find)[1] is None
+    assert find in itemTimestamps.pending_scans[app.DEFAULT_SITE]
+    assert get_last_scan(db.cursor()) >= now_epoch() - 1
+
+    flush_scans(connect)
+    assert get_row(db, find)[1] >= now_epoch() - 1
+    assert itemTimestamps.pending_scans == {}
+    # A scan is not an edit: no change log entry and no new box version
+    assert count_changes(db) == before
+
+
+def test_queued_scans_keep_the_newest_time(client, db, inventory):
+    find = inventory['items'][0]
+    queue_scanned([find], 2000)
+    queue_scanned([find], 1000)
+    flush_scans(connect)
+    assert get_row(db, find)[1] == 2000
+
+    # An older scan written later leaves the newer one in place
+    queue_scanned([find], 1500)
+    flush_scans(connect)
+    assert get_row(db, find)[1] == 2000
+
+
+def test_failed_flush_requeues_the_scans(client, inventory):
+    def closed_connect(site_id):
+        # Writing on a closed connection fails
+        connection = app.connect_db(site_id=site_id)
+        connection.close()
+        return connection
+
+    queue_scanned([inventory['items'][0]], 1000)
+    flush_scans(closed_connect)
+    assert itemTimestamps.pending_scans == {app.DEFAULT_SITE: {inventory['items'][0]: 1000}}
+
+
+def test_recent_lists_edited_rows_first(client, db, inventory):
+    find = inventory['items'][0]
+    db.execute('UPDATE storage SET NAME = ?, MODIFIED_AT = ?, LAST_SCANNED_AT = ? WHERE FIND = ?;',
+               ('just edited', now_epoch(), 1700000000, find))
+    db.commit()
+
+    text = client.get('/recent?days=1').text
+    assert 'just edited' in text
+    assert format_epoch(1700000000) in text
+
+
+def test_stale_lists_boxes_until_they_are_scanned(client, db, inventory):
+    box = db.execute("SELECT FIND FROM storage WHERE TYPE = 'BOX' AND CREATED_AT < ? ORDER BY CREATED_AT LIMIT 1;",
+                     (now_epoch() - 100 * 86400,)).fetchone()[0]
+    assert f'Box ID:</strong> {box}<' in client.get('/stale?days=90').text
+
+    client.get(f'/search/{str(box).zfill(13)}')
+    flush_scans(connect)
+    assert f'Box ID:</strong> {box}<' not in client.get('/stale?days=90').text
@@ -0,0 +1,53 @@
+import metrics
+from metrics import Counter, Histogram
+
+
+def get_sample(client, series):
+    # Value of one series in /metrics, or 0 if it has not been recorded yet
+    for line in client.get('/metrics').text.splitlines():
+        if line.startswith(series + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Test.", buckets=(0.1, 1.0))
+    histogram.observe(0.05, route="/")
+    histogram.observe(0.5, route="/")
+    histogram.observe(5, route="/")
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{route="/",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{route="/",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="/"} 3' in lines
+
+
+def test_counter_keeps_a_series_per_label_set():
+    counter = Counter("test_total", "Test.")
+    counter.inc(route="/a")
+    counter.inc(2, route="/a")
+    counter.inc(route="/b")
+    assert counter.render()[2:] == ['test_total{route="/a"} 3', 'test_total{route="/b"} 1']
+
+
+def test_requests_are_counted_by_route_template(client, inventory):
+    series = 'potatodb_request_duration_seconds_count{method="GET",route="/modify/{item_id}",status="200"}'
+    before = get_sample(client, series)
+    for find in inventory['items'][:3]:
+        client.get(f'/modify/{find}')
+    assert get_sample(client, series) == before + 3
+
+
+def test_sql_statements_are_attributed_to_the_route(client, inventory):
+    series = 'potatodb_sql_statements_total{route="/modify/{item_id}"}'
+    before = get_sample(client, series)
+    client.get(f"/modify/{inventory['items'][0]}")
+    assert get_sample(client, series) > before
+
+
+def test_metrics_use_the_prometheus_text_format(client):
+    response = client.get('/metrics')
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    for metric in metrics.ALL_METRICS:
+        assert f'# TYPE {metric.name} ' in response.text
@@ -0,0 +1,53 @@
+from prefixIndex import complete, get_keys
+
+
+def add_item(client, inventory, name):
+    response = client.post('/add/ITEM', data={'name': name, 'description': 'test', 'weight': 1,
+                                              'parent': str(inventory['boxes'][1]), 'cost': ''},
+                           follow_redirects=False)
+    assert response.status_code == 303
+
+
+def test_every_word_start_is_a_key():
+    assert get_keys('Lenovo L13 Yoga') == ['lenovo l13 yoga', 'l13 yoga', 'yoga']
+    # Words that start with a digit are left to barcode scans
+    assert get_keys('M3 bolt 20mm') == ['m3 bolt 20mm', 'bolt 20mm']
+
+
+def test_completion_matches_any_word_in_name_order(client, inventory):
+    add_item(client, inventory, 'Lenovo L13 Yoga')
+    add_item(client, inventory, 'Yoga mat')
+    add_item(client, inventory, 'yogurt maker')
+
+    text = client.get('/autocomplete?q=yog').text
+    assert text.index('Lenovo L13 Yoga') < text.index('Yoga mat') < text.index('yogurt maker')
+    assert 'yogurt maker' not in client.get('/autocomplete?q=yoga').text
+
+
+def test_each_row_is_suggested_once(client, inventory):
+    # Stored under 'zorb zorb' and 'zorb', both of which start with 'zo'
+    add_item(client, inventory, 'zorb zorb')
+    finds = complete('zo')
+    assert len(finds) == len(set(finds)) == 1
+
+
+def test_short_or_numeric_input_gets_no_suggestions(client, inventory):
+    assert 'href' not in client.get('/autocomplete?q=b').text
+    assert 'href' not in client.get(f"/autocomplete?q={inventory['items'][0]}").text
+
+
+def test_suggestions_follow_renames_and_deletes(client, db, inventory):
+    find = inventory['items'][0]
+    row = db.execute('SELECT DESCRIPTION, WEIGHT, PARENT FROM storage WHERE FIND = ?;', (find,)).fetchone()
+    client.post(f'/modify/{find}', data={'name': 'zeppelin model', 'description': row[0], 'weight': row[1],
+                                         'parent': row[2], 'cost': ''}, follow_redirects=False)
+    assert complete('zep') == [find]
+
+    client.get(f'/delete/{find}')
+    assert complete('zep') == []
+
+
+def test_limit(client, inventory):
+    for index in range(5):
+        add_item(client, inventory, f'widget {index}')
+    assert len(complete('widget', limit=3)) == 3
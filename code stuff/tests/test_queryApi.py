@@ -0,0 +1,81 @@
+import pytest
+
+from subtreeOps import SUBTREE_CTE
+
+ITEMS = '/api/v1/items'
+
+
+def fetch_all(client, query):
+    # Follow next_cursor to the last page
+    items = []
+    cursor = None
+    while True:
+        params = dict(query, cursor=cursor) if cursor else query
+        payload = client.get(ITEMS, params=params).json()
+        items.extend(payload['items'])
+        cursor = payload['next_cursor']
+        if cursor is None:
+            return items
+
+
+@pytest.mark.parametrize('sort, order_by', [
+    ('id', 'FIND'),
+    ('-cost', 'COST DESC, FIND DESC'),
+    ('cost', 'COST, FIND'),
+    ('name', 'NAME, FIND'),
+])
+def test_pages_cover_every_row_once_in_order(client, db, sort, order_by):
+    # A few rows without a cost, which sort before every cost and after them when descending
+    db.execute('''UPDATE storage SET COST = NULL
+                  WHERE FIND IN (SELECT FIND FROM storage ORDER BY FIND LIMIT 5 OFFSET 20);''')
+    db.commit()
+
+    items = fetch_all(client, {'sort': sort, 'fields': 'id', 'limit': 37})
+    expected = [find for (find,) in db.execute(f'SELECT FIND FROM storage ORDER BY {order_by};')]
+    assert [item['id'] for item in items] == expected
+
+
+def test_filters(client, db, inventory):
+    box = inventory['boxes'][1]
+
+    items = fetch_all(client, {'type': 'box', 'fields': 'id,type'})
+    assert {item['id'] for item in items} == set(inventory['boxes'])
+
+    items = fetch_all(client, {'parent': box})
+    assert items and all(item['parent'] == box for item in items)
+
+    items = fetch_all(client, {'subtree': box, 'fields': 'id'})
+    assert {item['id'] for item in items} == {int(find) for (find,) in
+                                              db.execute(SUBTREE_CTE + ' SELECT FIND FROM subtree;', (box,))}
+
+    items = fetch_all(client, {'cost_min': 50, 'cost_max': 100, 'type': 'ITEM', 'fields': 'cost,type'})
+    assert items and all(50 <= item['cost'] <= 100 and item['type'] == 'ITEM' for item in items)
+    assert set(items[0]) == {'cost', 'type'}
+
+
+def test_get_item(client, inventory):
+    find = inventory['items'][0]
+    item = client.get(f'{ITEMS}/{find}').json()
+    assert item['id'] == find
+    assert isinstance(item['parent'], int)
+    assert client.get(f'{ITEMS}/{find}', params={'fields': 'name'}).json().keys() == {'name'}
+    assert client.get(f'{ITEMS}/999999').status_code == 404
+
+
+@pytest.mark.parametrize('params', [
+    {'cursor': 'not a cursor'},
+    {'cursor': '!!!'},
+    {'sort': 'description'},
+    {'fields': 'id,secret'},
+    {'type': 'crate'},
+])
+def test_invalid_parameters_are_400(client, params):
+    response = client.get(ITEMS, params=params)
+    assert response.status_code == 400
+    assert 'error' in response.json()
+
+
+def test_cursor_only_continues_the_same_sort(client):
+    next_cursor = client.get(ITEMS, params={'sort': 'cost', 'limit': 5}).json()['next_cursor']
+    assert client.get(ITEMS, params={'sort': 'cost', 'cursor': next_cursor}).status_code == 200
+    assert client.get(ITEMS, params={'sort': 'weight', 'cursor': next_cursor}).status_code == 400
@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import reconciler
+from reconciler import Throttle, check_tree, reconcile
+from sites import DEFAULT_SITE
+
+ORPHAN = 'static/barcodes/0000000009999.png'
+
+
+def fast_throttle():
+    return Throttle(duty_cycle=1.0, max_ops_per_second=10 ** 9)
+
+
+@pytest.fixture
+def base_dir(tmp_path, db, inventory):
+    # One referenced barcode, one file no row refers to and a shipped image, all older than the grace period
+    base_dir = tmp_path / "files"
+    referenced = db.execute('SELECT BARCODE_IMG_PATH FROM storage WHERE FIND = ?;',
+                            (inventory['items'][0],)).fetchone()[0]
+    old = time.time() - 2 * reconciler.GRACE_SECONDS
+    for path in (referenced, ORPHAN, 'static/images/potato.png'):
+        os.makedirs(base_dir / os.path.dirname(path), exist_ok=True)
+        (base_dir / path).write_bytes(b'png')
+        os.utime(base_dir / path, (old, old))
+    return str(base_dir)
+
+
+def test_check_tree_finds_cycles_and_dangling_parents():
+    parents = {1: None, 2: 1, 3: 2, 4: 5, 5: 4, 6: 4, 7: 99}
+    dangling, cycles, unreachable = check_tree(parents, fast_throttle())
+    # The root has no parent either, but that is expected
+    assert dangling == [(7, 99)]
+    assert [sorted(cycle) for cycle in cycles] == [[4, 5]]
+    assert sorted(unreachable) == [4, 5, 6, 7]
+
+
+def test_dry_run_only_reports(db, base_dir):
+    summary = reconcile(db, base_dir, dry_run=True, throttle=fast_throttle())
+    assert summary['unreferenced_files'] == [ORPHAN]
+    assert summary['cycles'] == []
+    assert os.path.isfile(os.path.join(base_dir, ORPHAN))
+
+
+def test_unreferenced_files_are_quarantined(db, base_dir):
+    reconcile(db, base_dir, throttle=fast_throttle())
+    assert not os.path.exists(os.path.join(base_dir, ORPHAN))
+    assert os.path.isfile(os.path.join(base_dir, 'static/images/potato.png'))
+    quarantined = os.path.join(base_dir, reconciler.QUARANTINE_DIRECTORY)
+    (day,) = os.listdir(quarantined)
+    assert os.path.isfile(os.path.join(quarantined, day, ORPHAN))
+
+
+def test_new_files_are_left_alone(db, base_dir):
+    # A file written moments ago may belong to a row that is still being saved
+    os.utime(os.path.join(base_dir, ORPHAN))
+    assert reconcile(db, base_dir, throttle=fast_throttle())['unreferenced_files'] == []
+
+
+def test_old_quarantine_days_are_purged(db, base_dir):
+    old_day = os.path.join(base_dir, reconciler.QUARANTINE_DIRECTORY, '20000101')
+    os.makedirs(old_day)
+    assert reconcile(db, base_dir, throttle=fast_throttle())['purged_quarantine_days'] == 1
+    assert not os.path.exists(old_day)
+
+
+def test_repair_moves_cycles_and_dangling_rows_under_the_root(db, base_dir, inventory):
+    first, second, orphan = inventory['boxes'][2], inventory['boxes'][3], inventory['items'][0]
+    db.execute('UPDATE storage SET PARENT = ? WHERE FIND = ?;', (str(second), first))
+    db.execute('UPDATE storage SET PARENT = ? WHERE FIND = ?;', ('999999', orphan))
+    db.commit()
+
+    summary = reconcile(db, base_dir, repair=True, throttle=fast_throttle())
+    assert {'id': orphan, 'parent': 999999} in summary['dangling_parents']
+    assert [sorted(cycle) for cycle in summary['cycles']] == [sorted([first, second])]
+
+    dangling, cycles, unreachable = check_tree(reconciler.load_parents(db, fast_throttle()), fast_throttle())
+    assert cycles == [] and unreachable == []
+
+
+def test_worker_compacts_the_change_log(monkeypatch, client, db, inventory, base_dir):
+    find = inventory['items'][0]
+    db.execute('UPDATE storage SET NAME = ? WHERE FIND = ?;', ('first', find))
+    db.execute('UPDATE storage SET NAME = ? WHERE FIND = ?;', ('second', find))
+    db.commit()
+
+    class Stop(Exception):
+        pass
+
+    def sleep(seconds):
+        # Stop at the end of the first pass
+        if seconds == reconciler.RECONCILE_INTERVAL:
+            raise Stop
+
+    monkeypatch.setattr(reconciler, 'RECONCILE_START_DELAY', 0)
+    monkeypatch.setattr(reconciler, 'RECONCILE_INTERVAL', 12345)
+    monkeypatch.setattr(reconciler.time, 'sleep', sleep)
+    with pytest.raises(Stop):
+        reconciler.reconcile_worker(lambda: sqlite3.connect(inventory['db_path']), base_dir, DEFAULT_SITE)
+
+    assert db.execute('SELECT COUNT(*) FROM change_log WHERE FIND = ?;', (find,)).fetchone()[0] == 1
@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+from itemTimestamps import now_epoch
+from scanReplay import MAX_BATCH_SIZE
+
+SCANS = '/api/v1/scans'
+
+
+def barcode(find):
+    return str(find).zfill(13)
+
+
+def replay(client, events, station='bench-1'):
+    response = client.post(SCANS, content=json.dumps({'station': station, 'events': events}))
+    assert response.status_code == 200
+    return {result['id']: result for result in response.json()['results']}
+
+
+def scan(event_id, find, scanned_at=None):
+    return {'id': event_id, 'code': barcode(find), 'scanned_at': scanned_at or now_epoch() - 60}
+
+
+def get_parent(db, find):
+    return db.execute('SELECT PARENT FROM storage WHERE FIND = ?;', (find,)).fetchone()[0]
+
+
+def test_item_then_box_moves_the_item(client, db, inventory):
+    item, box = inventory['items'][0], inventory['boxes'][-1]
+    scanned_at = now_epoch() - 300
+
+    results = replay(client, [scan('a1', item, scanned_at), scan('a2', box, scanned_at + 1)])
+    assert results['a1']['status'] == 'tracked'
+    assert results['a2'] == {'id': 'a2', 'status': 'moved', 'moved': item, 'parent': box, 'items': [box]}
+    assert get_parent(db, item) == str(box)
+    assert db.execute('SELECT LAST_SCANNED_AT FROM storage WHERE FIND = ?;', (item,)).fetchone()[0] == scanned_at
+
+
+def test_events_are_replayed_in_scan_order(client, db, inventory):
+    item, box = inventory['items'][0], inventory['boxes'][-1]
+    # Sent out of order: the box was scanned after the item
+    results = replay(client, [scan('b2', box, 2000), scan('b1', item, 1000)])
+    assert results['b2']['status'] == 'moved'
+    assert get_parent(db, item) == str(box)
+
+
+def test_resent_batch_is_not_applied_twice(client, db, inventory):
+    item, box = inventory['items'][0], inventory['boxes'][-1]
+    events = [scan('c1', item), scan('c2', box)]
+    first = replay(client, events)
+
+    # Moved back by hand; replaying the same events again must not move it a second time
+    parent = inventory['boxes'][1]
+    db.execute('UPDATE storage SET PARENT = ? WHERE FIND = ?;', (str(parent), item))
+    db.commit()
+    changes = db.execute('SELECT COUNT(*) FROM change_log;').fetchone()[0]
+
+    second = replay(client, events)
+    assert second['c2'] == dict(first['c2'], duplicate=True)
+    assert get_parent(db, item) == str(parent)
+    assert db.execute('SELECT COUNT(*) FROM change_log;').fetchone()[0] == changes
+
+
+def test_bad_events_are_rejected_one_at_a_time(client, db, inventory):
+    item, box = inventory['items'][0], inventory['boxes'][-1]
+    events = [scan('d1', item), {'id': 'd2', 'code': 12345, 'scanned_at': now_epoch()},
+              {'id': 'd3', 'code': barcode(box), 'scanned_at': now_epoch() + 10 * 86400},
+              {'id': 'd4', 'code': barcode(box), 'scanned_at': True}, scan('d5', box)]
+
+    results = replay(client, events)
+    assert [results[event_id]['status'] for event_id in ('d2', 'd3', 'd4')] == ['rejected'] * 3
+    assert results['d5']['status'] == 'moved'
+    assert get_parent(db, item) == str(box)
+
+
+def test_unknown_codes(client):
+    results = replay(client, [{'id': 'e1', 'code': 'hello', 'scanned_at': 1000},
+                              {'id': 'e2', 'code': '9999999999990', 'scanned_at': 1000},
+                              {'id': 'e3', 'code': '²', 'scanned_at': 1000}])
+    assert [result['status'] for result in results.values()] == ['not_a_barcode', 'not_found', 'not_a_barcode']
+
+
+@pytest.mark.parametrize('payload', [
+    [],
+    {'station': 'x'},
+    {'events': [{'code': '1', 'scanned_at': 1}]},
+    {'events': [{'id': '', 'code': '1', 'scanned_at': 1}]},
+    {'events': [{'id': str(index), 'code': '1', 'scanned_at': 1} for index in range(MAX_BATCH_SIZE + 1)]},
+])
+def test_malformed_batch_is_refused(client, payload):
+    assert client.post(SCANS, content=json.dumps(payload)).status_code == 400
+
+
+def test_moves_into_the_own_subtree_are_refused(client, db, inventory):
+    # boxes[3] is inside boxes[1]
+    outer, inner = inventory['boxes'][1], inventory['boxes'][3]
+    parent = get_parent(db, outer)
+
+    results = replay(client, [scan('f1', outer, 1000), scan('f2', inner, 1001)])
+    assert results['f2']['status'] == 'error'
+    assert get_parent(db, outer) == parent
+
+    results = replay(client, [scan('f3', 1, 1002), scan('f4', inner, 1003)])
+    assert results['f4']['status'] == 'error'
+    assert results['f4']['error'] == "Error: The root directory cannot be moved."
+
+
+def test_live_scan_refuses_a_move_into_the_own_subtree(client, db, inventory):
+    outer, inner = inventory['boxes'][1], inventory['boxes'][3]
+    parent = get_parent(db, outer)
+    client.get(f'/search/{barcode(outer)}')
+    response = client.get(f'/search/{barcode(inner)}')
+    assert f'{inner} is inside {outer}' in response.text
+    assert get_parent(db, outer) == parent
+
+
+def test_scan_to_move_state_is_kept_per_station(client, db, inventory):
+    item, box = inventory['items'][0], inventory['boxes'][-1]
+    parent = get_parent(db, item)
+
+    replay(client, [scan('g1', item, 1000)], station='bench-1')
+    # Another station's box scan, or a live scan, does not complete bench-1's move
+    assert replay(client, [scan('g2', box, 1001)], station='bench-2')['g2']['status'] == 'tracked'
+    client.get(f'/search/{barcode(box)}')
+    assert get_parent(db, item) == parent
+
+    # The next batch from bench-1 does
+    assert replay(client, [scan('g3', box, 1002)], station='bench-1')['g3']['status'] == 'moved'
+    assert get_parent(db, item) == str(box)
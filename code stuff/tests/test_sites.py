@@ -0,0 +1,95 @@
+import sqlite3
+
+import pytest
+
+import sites
+from sites import DEFAULT_SITE, parse_sites
+from syntheticInventory import generate_inventory
+
+SECOND_SITE = 'north'
+SECOND_SITE_ROWS = 120
+
+
+@pytest.fixture
+def north(tmp_path, monkeypatch, inventory):
+    # A second, smaller site; it has to be configured before the app starts
+    db_path = str(tmp_path / "storage-north.db")
+    connection = sqlite3.connect(db_path)
+    north = generate_inventory(connection, SECOND_SITE_ROWS, 3, seed=2)
+    connection.close()
+    monkeypatch.setitem(sites.SITES, SECOND_SITE, db_path)
+    return north
+
+
+@pytest.fixture
+def client(north, client):
+    return client
+
+
+def count_items(client, headers=None, **params):
+    response = client.get('/api/v1/items', params=dict(params, fields='id', limit=1000), headers=headers)
+    return len(response.json()['items'])
+
+
+def test_parse_sites():
+    assert parse_sites('main=storage.db, north = north.db,') == {'main': 'storage.db', 'north': 'north.db'}
+    with pytest.raises(ValueError):
+        parse_sites('main storage.db')
+    with pytest.raises(ValueError):
+        parse_sites('no-dashes=x.db')
+
+
+def test_requests_go_to_the_chosen_site(client):
+    assert count_items(client) == 300
+    assert count_items(client, site=SECOND_SITE) == SECOND_SITE_ROWS
+    assert count_items(client, headers={'X-Site': SECOND_SITE}) == SECOND_SITE_ROWS
+
+
+def test_site_cookie_sticks(client):
+    response = client.get(f'/site/{SECOND_SITE}', follow_redirects=False)
+    assert response.status_code == 303
+    assert count_items(client) == SECOND_SITE_ROWS
+    assert client.get('/site/elsewhere').status_code == 404
+
+
+def test_unknown_site_is_refused_but_an_old_cookie_is_dropped(client):
+    assert client.get('/?site=elsewhere').status_code == 404
+
+    client.cookies.set(sites.SITE_COOKIE, 'elsewhere')
+    response = client.get('/api/v1/items', params={'fields': 'id', 'limit': 1000})
+    assert len(response.json()['items']) == 300
+    assert 'Max-Age=0' in response.headers['set-cookie']
+
+
+def test_same_box_id_on_two_sites_is_cached_apart(client):
+    main_page = client.get('/')
+    north_page = client.get('/', headers={'X-Site': SECOND_SITE})
+    assert main_page.headers['etag'] != north_page.headers['etag']
+    assert client.get('/', headers={'X-Site': SECOND_SITE,
+                                    'If-None-Match': main_page.headers['etag']}).status_code == 200
+
+
+def test_scan_index_is_kept_per_site(client, inventory, north):
+    # A FIND that only the main site has is not found on the second one
+    find = max(inventory['items'])
+    assert find not in north['items'] + north['boxes']
+    assert 'does not exist' not in client.get(f'/search/{find}').text
+    assert 'does not exist' in client.get(f'/search/{find}', headers={'X-Site': SECOND_SITE}).text
+
+
+def test_site_summary_adds_up_every_site(client, inventory, north):
+    payload = client.get('/api/v1/sites').json()
+    by_site = {summary['site']: summary for summary in payload['sites']}
+    assert by_site[DEFAULT_SITE]['item_count'] == len(inventory['items'])
+    assert by_site[SECOND_SITE]['box_count'] == len(north['boxes'])
+    assert payload['total']['item_count'] == len(inventory['items']) + len(north['items'])
+
+
+def test_search_across_sites(client):
+    client.post('/add/ITEM', data={'name': 'sextant', 'description': 'brass', 'weight': 1, 'cost': ''},
+                headers={'X-Site': SECOND_SITE})
+    items = client.get('/api/v1/search', params={'q': 'sextant'}).json()['items']
+    assert [(item['name'], item['site']) for item in items] == [('sextant', SECOND_SITE)]
+
+    assert client.get('/api/v1/search', params={'q': 'sextant', 'sites': DEFAULT_SITE}).json()['items'] == []
+    assert client.get('/api/v1/search', params={'q': 'x', 'sites': 'elsewhere'}).status_code == 400
@@ -0,0 +1,49 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from benchmarkStartup import APP_DIR, parse_importtime
+from migrations import MIGRATIONS, run_migrations
+from syntheticInventory import create_schema
+
+# Modules that must not be loaded just by importing the app
+HEAVY_MODULES = ('printBarcode', 'generateBarcode', 'inventoryReports', 'numpy', 'win32print', 'barcode')
+
+
+def test_import_leaves_backends_and_database_alone(tmp_path):
+    db_path = tmp_path / "storage.db"
+    script = f"import app, sys; print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=APP_DIR, capture_output=True, text=True,
+                            env=dict(os.environ, POTATODB_SITES=f"main={db_path}"))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
+    # The database is only created by the lifespan hook
+    assert not db_path.exists()
+
+
+def test_parse_importtime():
+    stderr = ("import time: self [us] | cumulative | imported package\n"
+              "import time:       120 |        120 |   json.decoder\n"
+              "import time:       310 |        430 | json\n")
+    assert parse_importtime(stderr) == {'json.decoder': (120, 120), 'json': (310, 430)}
+
+
+def test_migrations_run_once(tmp_path):
+    connection = sqlite3.connect(tmp_path / "storage.db")
+    create_schema(connection)
+
+    assert run_migrations(connection) == len(MIGRATIONS)
+    assert connection.execute('PRAGMA user_version;').fetchone()[0] == len(MIGRATIONS)
+    schema = connection.execute('SELECT name, sql FROM sqlite_master ORDER BY name;').fetchall()
+
+    # A second start finds nothing to do
+    run_migrations(connection)
+    assert connection.execute('SELECT name, sql FROM sqlite_master ORDER BY name;').fetchall() == schema
+    connection.close()
+
+
+def test_lifespan_sets_up_the_database(client, db):
+    assert db.execute('PRAGMA user_version;').fetchone()[0] == len(MIGRATIONS)
+    tables = {name for (name,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'table';")}
+    assert {'storage', 'id_tracker', 'box_versions', 'change_log', 'scan_events'} <= tables
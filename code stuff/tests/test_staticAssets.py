@@ -0,0 +1,76 @@
+import gzip
+import hashlib
+import os
+
+from staticAssets import (IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, asset_url, get_accepted_encodings,
+                          precompress_assets)
+
+STYLESHEET = 'static/css/style.css'
+
+
+def get_hash(path):
+    with open(path, 'rb') as asset_file:
+        return hashlib.sha256(asset_file.read()).hexdigest()[:16]
+
+
+def test_asset_url_carries_the_content_hash():
+    url = f'/{STYLESHEET}?v={get_hash(STYLESHEET)}'
+    assert asset_url('css/style.css') == url
+    assert asset_url(STYLESHEET) == url
+    assert asset_url('/static\\css\\style.css') == url
+    assert asset_url('css/missing.css') == '/static/css/missing.css'
+    assert asset_url(None) == ''
+
+
+def test_pages_link_the_hashed_assets(client):
+    assert asset_url('css/style.css') in client.get('/').text
+
+
+def test_current_hash_is_cached_for_good(client):
+    response = client.get(asset_url('css/style.css'))
+    assert response.status_code == 200
+    assert response.headers['cache-control'] == IMMUTABLE_CACHE_CONTROL
+
+
+def test_stale_or_missing_hash_is_revalidated(client):
+    for url in (f'/{STYLESHEET}?v=0000000000000000', f'/{STYLESHEET}'):
+        response = client.get(url)
+        assert response.headers['cache-control'] == REVALIDATE_CACHE_CONTROL
+        assert client.get(url, headers={'If-None-Match': response.headers['etag']}).status_code == 304
+
+
+def test_precompressed_copy_is_sent_when_accepted(client):
+    with open(STYLESHEET, 'rb') as stylesheet:
+        content = stylesheet.read()
+
+    response = client.get(f'/{STYLESHEET}', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert int(response.headers['content-length']) == os.path.getsize(STYLESHEET + '.gz')
+    assert response.content == content
+
+    response = client.get(f'/{STYLESHEET}', headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in response.headers
+    assert response.content == content
+
+
+def test_accepted_encodings():
+    assert get_accepted_encodings('gzip, br;q=0') == {'gzip'}
+    assert get_accepted_encodings('BR;q=0.5, gzip;q=0.0') == {'br'}
+
+
+def test_precompress_only_rewrites_changed_files(tmp_path):
+    asset = tmp_path / "app.js"
+    asset.write_text("console.log('hello');\n" * 50)
+    (tmp_path / "image.png").write_bytes(b'png')
+
+    assert precompress_assets(str(tmp_path)) >= 1
+    assert gzip.decompress((tmp_path / "app.js.gz").read_bytes()) == asset.read_bytes()
+    assert not (tmp_path / "image.png.gz").exists()
+    assert precompress_assets(str(tmp_path)) == 0
+
+    asset.write_text("console.log('changed');\n")
+    stat = os.stat(asset)
+    os.utime(asset, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert precompress_assets(str(tmp_path)) >= 1
+    assert gzip.decompress((tmp_path / "app.js.gz").read_bytes()) == asset.read_bytes()
@@ -0,0 +1,84 @@
+from subtreeOps import SUBTREE_CTE
+
+
+def get_subtree(db, box_id):
+    return {int(find) for (find,) in db.execute(SUBTREE_CTE + ' SELECT FIND FROM subtree;', (box_id,))}
+
+
+def get_parent(db, find):
+    return db.execute('SELECT PARENT FROM storage WHERE FIND = ?;', (find,)).fetchone()[0]
+
+
+def test_move_takes_the_contents_along(client, db, inventory):
+    # The first boxes form a chain: boxes[2] is inside boxes[1], and so on
+    box, target = inventory['boxes'][2], inventory['boxes'][-1]
+    contents = get_subtree(db, box)
+
+    response = client.post(f'/move-tree/{box}', data={'parent': target}, follow_redirects=False)
+    assert response.status_code == 303
+    assert get_parent(db, box) == str(target)
+    assert get_subtree(db, box) == contents
+
+
+def test_move_into_own_subtree_is_refused(client, db, inventory):
+    box, descendant = inventory['boxes'][1], inventory['boxes'][3]
+    parent = get_parent(db, box)
+
+    response = client.post(f'/move-tree/{box}', data={'parent': descendant})
+    assert response.status_code == 400
+    assert get_parent(db, box) == parent
+
+    response = client.post(f'/move-tree/{box}', data={'parent': box})
+    assert response.status_code == 400
+
+
+def test_move_refuses_the_root_and_items_as_parents(client, inventory):
+    assert client.post('/move-tree/1', data={'parent': inventory['boxes'][1]}).status_code == 400
+    assert client.post(f"/move-tree/{inventory['boxes'][1]}",
+                       data={'parent': inventory['items'][0]}).status_code == 400
+
+
+def test_flatten_makes_every_descendant_a_direct_child(client, db, inventory):
+    box = inventory['boxes'][1]
+    contents = get_subtree(db, box)
+    assert any(get_parent(db, find) != str(box) for find in contents - {box})
+
+    response = client.get(f'/flatten/{box}', follow_redirects=False)
+    assert response.status_code == 303
+    assert get_subtree(db, box) == contents
+    assert all(get_parent(db, find) == str(box) for find in contents - {box})
+
+
+def test_delete_tree_removes_the_box_and_its_contents(client, db, inventory):
+    box = inventory['boxes'][2]
+    contents = get_subtree(db, box)
+    row_count = db.execute('SELECT COUNT(*) FROM storage;').fetchone()[0]
+
+    response = client.get(f'/delete-tree/{box}', follow_redirects=False)
+    assert response.status_code == 303
+    assert db.execute('SELECT COUNT(*) FROM storage;').fetchone()[0] == row_count - len(contents)
+    placeholders = ', '.join('?' * len(contents))
+    assert db.execute(f'SELECT COUNT(*) FROM storage WHERE FIND IN ({placeholders});',
+                      list(contents)).fetchone()[0] == 0
+    assert client.get(f'/?box_id={box}').status_code == 404
+    # Their barcode images are removed along with them
+    assert sorted(inventory['removed_files']) == sorted(
+        f'static/barcodes/{str(find).zfill(13)}.png' for find in contents)
+
+
+def test_delete_tree_refuses_the_root_and_missing_boxes(client):
+    assert client.get('/delete-tree/1').status_code == 400
+    assert client.get('/delete-tree/999999').status_code == 400
+
+
+def test_missing_box_is_404(client):
+    response = client.get('/?box_id=999999')
+    assert response.status_code == 404
+
+
+def test_box_form_offers_the_subtree_operations(client, inventory):
+    text = client.get(f"/modify/{inventory['boxes'][1]}").text
+    assert f"/move-tree/{inventory['boxes'][1]}" in text
+    assert f"/flatten/{inventory['boxes'][1]}" in text
+    assert f"/delete-tree/{inventory['boxes'][1]}" in text
+    assert '/move-tree/' not in client.get(f"/modify/{inventory['items'][0]}").text
@@ -0,0 +1,49 @@
+import sqlite3
+
+from syntheticInventory import ROOT_ID, generate_inventory, get_find
+
+
+def test_get_find_matches_the_ean_check_digit():
+    assert get_find(1) == 17
+    assert get_find(2) == 24
+    assert get_find(123) == 1236
+
+
+def test_generate_inventory_builds_a_tree_of_the_requested_depth():
+    connection = sqlite3.connect(':memory:')
+    inventory = generate_inventory(connection, 200, depth=5, seed=3)
+
+    rows = connection.execute('SELECT FIND, TYPE, PARENT FROM storage;').fetchall()
+    assert len(rows) == 200
+    assert {find for find, row_type, parent in rows if row_type == 'BOX'} == set(inventory['boxes'])
+    assert {find for find, row_type, parent in rows if row_type == 'ITEM'} == set(inventory['items'])
+
+    # Every parent is a box, and the deepest box is `depth` levels below the root
+    parents = {find: int(parent) for find, row_type, parent in rows if parent is not None}
+    assert set(parents.values()) <= set(inventory['boxes'])
+    depths = {ROOT_ID: 0}
+    for box in inventory['boxes'][1:]:
+        depths[box] = depths[parents[box]] + 1
+    assert max(depths.values()) == 5
+
+    # New items continue after the generated ids
+    assert connection.execute('SELECT MAX(id) FROM id_tracker;').fetchone()[0] == 200
+    connection.close()
+
+
+def test_generate_inventory_is_reproducible():
+    first = generate_inventory(sqlite3.connect(':memory:'), 100, seed=7)
+    second = generate_inventory(sqlite3.connect(':memory:'), 100, seed=7)
+    assert first == second
+
+
+def test_benchmark_endpoints_answer_on_the_test_client(client, inventory):
+    # The same requests the benchmark times, through the same printer and barcode stubs
+    assert client.get('/').status_code == 200
+    assert client.get(f"/?box_id={inventory['boxes'][-1]}").status_code == 200
+    assert client.get(f"/search/{str(inventory['items'][0]).zfill(13)}").status_code == 200
+    assert client.get(f"/modify/{inventory['items'][0]}").status_code == 200
+    response = client.post('/add/ITEM', data={'name': 'benchmark item', 'description': 'benchmark', 'weight': 1,
+                                              'parent': str(inventory['boxes'][1]), 'cost': '1.00'},
+                           follow_redirects=False)
+    assert response.status_code < 400